@@ -0,0 +1,218 @@
+"""
+Runs the pipeline on many objects: every job of the manifest gets its own working directory and
+its own coordination/viewer ports, and jobs are dispatched from a queue to a pool of device slots
+(local GPUs, or GPUs of worker hosts reached over ssh). The working directories are only prepared on
+this machine: ssh hosts must mount --root at the same path (--shared_root), and run the pipeline with
+--remote_python and --remote_pipeline_dir.
+
+    python batch_runner.py jobs.yaml --root ./batch --devices 0,1
+    python batch_runner.py jobs.yaml --root ./batch --fake          # pipeline.py with CPU stubs, no GPU needed
+
+Manifest (YAML or JSON):
+
+    jobs:
+      - name: duck
+        start_image: ./start.png
+        model: instant-ngp
+        iterations: 10
+        steps: 3500
+        args: ["--batch_size", "4"]
+"""
+import argparse
+import json
+import os
+import queue
+import shlex
+import shutil
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+PIPELINE_DIR = os.path.dirname(os.path.abspath(__file__))
+# Files every working directory needs next to start.png
+SHARED_FILES = ["transforms.json", "transforms_internal.json"]
+
+
+class Job:
+    def __init__(self, name: str, start_image: str, model: str = "instant-ngp", iterations: int = 10,
+                 steps: int = 3500, args=None):
+        self.name = name
+        self.start_image = start_image
+        self.model = model
+        self.iterations = iterations
+        self.steps = steps
+        self.args = list(args or [])
+        self.workdir = None
+        self.ws_port = None
+        self.viewer_port = None
+
+
+class Slot:
+    """
+    Where a job runs: a device index, optionally on a remote host with its own python and pipeline paths.
+    """
+
+    def __init__(self, device: str, host: str = None, python: str = None, pipeline_dir: str = None):
+        self.device = device
+        self.host = host
+        self.python = python or sys.executable
+        self.pipeline_dir = pipeline_dir or PIPELINE_DIR
+
+    def __str__(self):
+        return f"{self.host}:{self.device}" if self.host else f"local:{self.device}"
+
+
+def load_jobs(manifest_path: str):
+    with open(manifest_path) as f:
+        if manifest_path.endswith((".yaml", ".yml")):
+            import yaml
+            manifest = yaml.safe_load(f)
+        else:
+            manifest = json.load(f)
+
+    # Relative image paths are relative to the manifest
+    base = os.path.dirname(os.path.abspath(manifest_path))
+    jobs = []
+    for i, entry in enumerate(manifest["jobs"]):
+        entry = dict(entry)
+        entry.setdefault("name", f"job_{i}")
+        entry["start_image"] = os.path.join(base, entry["start_image"])
+        jobs.append(Job(**entry))
+    return jobs
+
+
+def allocate(jobs, root: str, base_ws_port: int = 8765, base_viewer_port: int = 7007):
+    """
+    Gives every job an isolated working directory and ports no other job of the batch uses.
+    """
+    names = set()
+    for i, job in enumerate(jobs):
+        if job.name in names:
+            raise ValueError(f"Duplicate job name: {job.name}")
+        names.add(job.name)
+        job.workdir = os.path.abspath(os.path.join(root, job.name))
+        job.ws_port = base_ws_port + i
+        job.viewer_port = base_viewer_port + i
+    ports = {job.ws_port for job in jobs} | {job.viewer_port for job in jobs}
+    if len(ports) != 2 * len(jobs):
+        raise ValueError("Coordination and viewer port ranges overlap, move one of the base ports")
+
+
+def prepare_workdir(job: Job):
+    os.makedirs(job.workdir, exist_ok=True)
+    shutil.copyfile(job.start_image, os.path.join(job.workdir, "start.png"))
+    for name in SHARED_FILES:
+        source = os.path.join(PIPELINE_DIR, name)
+        if os.path.exists(source):
+            shutil.copyfile(source, os.path.join(job.workdir, name))
+
+
+def pipeline_command(job: Job, slot: Slot, fake: bool = False, stage_seconds: float = 0.05):
+    command = [
+        slot.python, os.path.join(slot.pipeline_dir, "pipeline.py"),
+        "--iterations", str(job.iterations),
+        "--model", job.model,
+        "--steps", str(job.steps),
+        "--ws_port", str(job.ws_port),
+        "--viewer_port", str(job.viewer_port),
+    ] + job.args
+    if fake:
+        # The real orchestration, with the trainer and the diffusion model replaced by CPU stubs
+        command += ["--trainer", "stub", "--diffusion", "stub", "--stub_seconds", str(stage_seconds)]
+    if slot.host is None:
+        return command
+    # The working directory was prepared locally, the host sees it through the shared --root
+    remote = f"cd {shlex.quote(job.workdir)} && CUDA_VISIBLE_DEVICES={slot.device} " + shlex.join(command)
+    return ["ssh", slot.host, remote]
+
+
+def run_job(job: Job, slots: queue.Queue, fake: bool, stage_seconds: float):
+    slot = slots.get()
+    start = time.perf_counter()
+    error = None
+    try:
+        prepare_workdir(job)
+        print(f"[{job.name}] started on {slot} (ports {job.ws_port}/{job.viewer_port})")
+        env = dict(os.environ, CUDA_VISIBLE_DEVICES=slot.device)
+        with open(os.path.join(job.workdir, "pipeline.log"), "w") as log:
+            returncode = subprocess.run(pipeline_command(job, slot, fake, stage_seconds), cwd=job.workdir, env=env,
+                                        stdout=log, stderr=subprocess.STDOUT).returncode
+    except Exception as e:
+        # One broken job (e.g. a missing start image) must not abort the batch and its report
+        returncode, error = 1, f"{type(e).__name__}: {e}"
+    finally:
+        slots.put(slot)
+    seconds = time.perf_counter() - start
+    print(f"[{job.name}] finished on {slot} in {seconds:.1f}s with code {returncode}"
+          + (f" ({error})" if error else ""))
+    return {"name": job.name, "slot": str(slot), "seconds": seconds, "returncode": returncode, "error": error}
+
+
+def run_batch(jobs, slots, fake: bool = False, stage_seconds: float = 0.05):
+    slot_queue = queue.Queue()
+    for slot in slots:
+        slot_queue.put(slot)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=len(slots)) as executor:
+        results = list(executor.map(lambda job: run_job(job, slot_queue, fake, stage_seconds), jobs))
+    elapsed = time.perf_counter() - start
+
+    completed = sum(1 for result in results if result["returncode"] == 0)
+    return {
+        "jobs": results,
+        "slots": [str(slot) for slot in slots],
+        "elapsed": elapsed,
+        "completed": completed,
+        "failed": len(results) - completed,
+        "objects_per_hour": completed / (elapsed / 3600) if elapsed > 0 else 0.0,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the pipeline on a batch of objects")
+    parser.add_argument("manifest", type=str, help="YAML or JSON file listing the jobs")
+    parser.add_argument("--root", type=str, default="./batch",
+                        help="Folder where the job working directories are created (default: ./batch)")
+    parser.add_argument("--devices", type=str, default="0",
+                        help="Comma separated device indices, one job runs per device at a time (default: 0)")
+    parser.add_argument("--hosts", type=str, default=None,
+                        help="Comma separated ssh hosts sharing --root, each gets every device (default: local only)")
+    parser.add_argument("--shared_root", action="store_true",
+                        help="Confirms the ssh hosts mount --root at the same absolute path, required with --hosts")
+    parser.add_argument("--remote_python", type=str, default=None,
+                        help="Python executable on the ssh hosts (default: the local sys.executable)")
+    parser.add_argument("--remote_pipeline_dir", type=str, default=None,
+                        help="Folder of pipeline.py on the ssh hosts (default: the local one)")
+    parser.add_argument("--base_ws_port", type=int, default=8765,
+                        help="First coordination port, job i uses base + i (default: 8765)")
+    parser.add_argument("--base_viewer_port", type=int, default=7007,
+                        help="First viewer port, job i uses base + i (default: 7007)")
+    parser.add_argument("--fake", action="store_true",
+                        help="Run pipeline.py with the stub trainer and diffusion, on the CPU (default: False)")
+    parser.add_argument("--fake_stage_seconds", type=float, default=0.05,
+                        help="--stub_seconds of the fake runs (default: 0.05)")
+    args = parser.parse_args()
+    if args.hosts and not args.shared_root:
+        parser.error("--hosts needs --shared_root: the working directories are only prepared on this machine "
+                     "and the hosts must see them at the same path")
+
+    devices = [device.strip() for device in args.devices.split(",") if device.strip()]
+    hosts = [host.strip() for host in args.hosts.split(",")] if args.hosts else [None]
+    slots = [Slot(device, host, args.remote_python, args.remote_pipeline_dir) if host else Slot(device)
+             for host in hosts for device in devices]
+
+    jobs = load_jobs(args.manifest)
+    allocate(jobs, args.root, args.base_ws_port, args.base_viewer_port)
+    report = run_batch(jobs, slots, fake=args.fake, stage_seconds=args.fake_stage_seconds)
+
+    os.makedirs(args.root, exist_ok=True)
+    with open(os.path.join(args.root, "batch_report.json"), "w") as f:
+        json.dump(report, f, indent=4)
+
+    print("-------------------------------------")
+    print(f"Jobs completed: {report['completed']}/{len(jobs)} on {len(slots)} slots")
+    print(f"Elapsed: {report['elapsed']:.1f}s")
+    print(f"Throughput: {report['objects_per_hour']:.1f} objects/hour")
+    print("-------------------------------------")
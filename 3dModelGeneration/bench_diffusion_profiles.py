@@ -0,0 +1,146 @@
+"""
+Quality against latency of the diffusion speed profiles.
+
+By default the pipeline is built from tiny random-weight components, with a byte-level tokenizer
+written locally, and runs on the CPU in float32, so the profiles can be compared anywhere, offline
+included. Profiles using torch.compile are skipped on the CPU, where compiling the tiny UNet would
+dominate the timings. Quality is then measured as the PSNR of
+each profile's output against the "quality" profile from the same seed, at the strengths of the
+first, middle and last iterations. Pass --model to measure a real model instead.
+
+    python bench_diffusion_profiles.py [--profiles quality,balanced,fast] [--repeat 3]
+    python bench_diffusion_profiles.py --model AdrianoC/RubberDuckProspectStableDiffusion_1_5 --device cuda
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+
+import numpy as np
+import torch
+from PIL import Image
+
+from diffusion_profiles import PROFILES, apply_profile
+from schedule import strength_schedule
+
+
+def local_tokenizer():
+    """
+    CLIP tokenizer without merges over the 256 byte symbols, built from files written here instead of
+    downloaded, so the benchmark needs no network.
+    """
+    from transformers import CLIPTokenizer
+    from transformers.models.clip.tokenization_clip import bytes_to_unicode
+
+    symbols = list(bytes_to_unicode().values())
+    tokens = ["<|startoftext|>", "<|endoftext|>"] + symbols + [symbol + "</w>" for symbol in symbols]
+    with tempfile.TemporaryDirectory() as folder:
+        vocab_file = os.path.join(folder, "vocab.json")
+        merges_file = os.path.join(folder, "merges.txt")
+        with open(vocab_file, "w", encoding="utf-8") as f:
+            json.dump({token: i for i, token in enumerate(tokens)}, f)
+        with open(merges_file, "w", encoding="utf-8") as f:
+            f.write("#version: 0.2\n")
+        return CLIPTokenizer(vocab_file, merges_file, model_max_length=77)
+
+
+def tiny_pipeline():
+    from diffusers import AutoencoderKL, PNDMScheduler, StableDiffusionImg2ImgPipeline, UNet2DConditionModel
+    from transformers import CLIPTextConfig, CLIPTextModel
+
+    torch.manual_seed(0)
+    unet = UNet2DConditionModel(
+        block_out_channels=(32, 64), layers_per_block=2, sample_size=32, in_channels=4, out_channels=4,
+        down_block_types=("DownBlock2D", "CrossAttnDownBlock2D"),
+        up_block_types=("CrossAttnUpBlock2D", "UpBlock2D"), cross_attention_dim=32,
+    )
+    vae = AutoencoderKL(
+        block_out_channels=[32, 64], in_channels=3, out_channels=3, latent_channels=4,
+        down_block_types=["DownEncoderBlock2D", "DownEncoderBlock2D"],
+        up_block_types=["UpDecoderBlock2D", "UpDecoderBlock2D"],
+    )
+    text_encoder = CLIPTextModel(CLIPTextConfig(
+        bos_token_id=0, eos_token_id=1, hidden_size=32, intermediate_size=37, layer_norm_eps=1e-05,
+        num_attention_heads=4, num_hidden_layers=5, pad_token_id=1, vocab_size=1000,
+    ))
+    tokenizer = local_tokenizer()
+    scheduler = PNDMScheduler(skip_prk_steps=True)
+    return StableDiffusionImg2ImgPipeline(
+        unet=unet, vae=vae, text_encoder=text_encoder, tokenizer=tokenizer, scheduler=scheduler,
+        safety_checker=None, feature_extractor=None, requires_safety_checker=False,
+    )
+
+
+def build(model, device, profile):
+    if model is None:
+        pipeline = tiny_pipeline()
+        # No LoRA exists for the random weights, only the scheduler and step budget are measured
+        profile = profile.replace(lora=None)
+    else:
+        from diffusers import StableDiffusionImg2ImgPipeline
+        dtype = torch.float16 if device == "cuda" else torch.float32
+        pipeline = StableDiffusionImg2ImgPipeline.from_pretrained(model, torch_dtype=dtype)
+        pipeline.safety_checker = None
+    pipeline.set_progress_bar_config(disable=True)
+    return apply_profile(pipeline.to(device), profile), profile
+
+
+def run(pipeline, profile, image, strength, device, seed=0):
+    generator = torch.Generator(device=device).manual_seed(seed)
+    with torch.no_grad():
+        output = pipeline(
+            prompt="yellow rubber duck seen from Front", image=image, strength=strength,
+            guidance_scale=profile.guidance_scale, num_inference_steps=profile.inference_steps(strength),
+            generator=generator, output_type="np",
+        )
+    return output.images[0]
+
+
+def psnr(a, b):
+    mse = float(np.mean((a.astype(np.float64) - b.astype(np.float64)) ** 2))
+    return float("inf") if mse == 0 else 10 * np.log10(1.0 / mse)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Diffusion speed profile benchmark")
+    parser.add_argument("--profiles", type=str, default=",".join(PROFILES),
+                        help="Comma separated profiles to compare (default: all)")
+    parser.add_argument("--model", type=str, default=None, help="Model to load instead of the tiny random one")
+    parser.add_argument("--device", type=str, default="cpu", help="Device (default: cpu)")
+    parser.add_argument("--size", type=int, default=None, help="Image size (default: 64 tiny, 512 real)")
+    parser.add_argument("--iterations", type=int, default=10, help="Iterations of the strength schedule (default: 10)")
+    parser.add_argument("--repeat", type=int, default=3, help="Timed runs per strength (default: 3)")
+    args = parser.parse_args()
+
+    size = args.size or (64 if args.model is None else 512)
+    rng = np.random.default_rng(0)
+    image = Image.fromarray(rng.integers(0, 255, (size, size, 3), dtype=np.uint8))
+    strengths = [strength_schedule(i, args.iterations) for i in (0, args.iterations // 2, args.iterations - 1)]
+
+    names = ["quality"] + [name for name in args.profiles.split(",") if name != "quality"]
+    references = {}
+    rows = []
+    for name in names:
+        if args.device == "cpu" and PROFILES[name].compile:
+            print(f"Skipping {name}: torch.compile timings are meaningless on the CPU")
+            continue
+        pipeline, profile = build(args.model, args.device, PROFILES[name])
+        for strength in strengths:
+            # Warm-up, it also absorbs the compilation of compiled profiles
+            output = run(pipeline, profile, image, strength, args.device)
+            start = time.perf_counter()
+            for _ in range(args.repeat):
+                run(pipeline, profile, image, strength, args.device)
+            if args.device == "cuda":
+                torch.cuda.synchronize()
+            latency = (time.perf_counter() - start) / args.repeat
+            references.setdefault(strength, output)
+            rows.append((name, strength, profile.denoising_steps(strength), latency, psnr(output, references[strength])))
+        del pipeline
+
+    baseline = {strength: latency for name, strength, _, latency, _ in rows if name == "quality"}
+    print(f"{'profile':<12}{'strength':>10}{'steps':>7}{'latency ms':>12}{'speedup':>9}{'PSNR dB':>9}")
+    for name, strength, denoising_steps, latency, quality in rows:
+        print(f"{name:<12}{strength:>10.3f}{denoising_steps:>7}{latency * 1e3:>12.1f}"
+              f"{baseline[strength] / latency:>9.2f}{quality:>9.2f}")
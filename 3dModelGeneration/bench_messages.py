@@ -0,0 +1,55 @@
+"""
+Compares the framed message format with the legacy pickled SocketMessage:
+encode/decode time and size on the wire for step and camera messages.
+
+    python bench_messages.py [--repeat 20000]
+"""
+import argparse
+import os
+import timeit
+
+from messages import SocketMessage, camera_message, step_message, decode
+
+
+def legacy(type, message, payload=None):
+    # The legacy message only carried a type and a string, the image is pickled along for comparison
+    legacy_message = SocketMessage.__new__(SocketMessage)
+    legacy_message.type = type
+    legacy_message.message = message
+    if payload is not None:
+        legacy_message.payload = payload
+    return legacy_message
+
+
+def bench(name, framed, legacy_message, repeat):
+    framed_bytes = framed.to_bytes()
+    pickled_bytes = legacy_message.to_pickle()
+
+    rows = []
+    for label, encode_fn, raw in (
+        ("framed", framed.to_bytes, framed_bytes),
+        ("pickle", legacy_message.to_pickle, pickled_bytes),
+    ):
+        encode_time = timeit.timeit(encode_fn, number=repeat) / repeat
+        decode_time = timeit.timeit(lambda: decode(raw, allow_legacy_pickle=True), number=repeat) / repeat
+        rows.append((f"{name} ({label})", len(raw), encode_time * 1e6, decode_time * 1e6))
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Message format microbenchmark")
+    parser.add_argument("--repeat", type=int, default=20000, help="Iterations per measure (default: 20000)")
+    args = parser.parse_args()
+
+    # Roughly the size of a 512x512 PNG render
+    image = os.urandom(300 * 1024)
+
+    rows = []
+    rows += bench("step", step_message(1200, loss=0.0123, rays_per_sec=2.5e6), legacy("step", "1200"), args.repeat)
+    rows += bench("camera", camera_message("output_top_camera.png"), legacy("camera", "output_top_camera.png"), args.repeat)
+    rows += bench("camera+image", camera_message("output_top_camera.png", image=image),
+                  legacy("camera", "output_top_camera.png", image), max(1, args.repeat // 100))
+
+    print(f"{'message':<28}{'bytes':>10}{'encode us':>12}{'decode us':>12}")
+    for name, size, encode_us, decode_us in rows:
+        print(f"{name:<28}{size:>10}{encode_us:>12.2f}{decode_us:>12.2f}")
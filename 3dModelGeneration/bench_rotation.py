@@ -0,0 +1,122 @@
+"""
+Times the file rotation between two iterations: 128 views (init, diffusion output and NeRF render
+each) and a large outputs tree. Compares the original rename loop (no journal), the serial rotation
+journaled after every move, and the phased RotationExecutor, within one file system and, with
+--cross_dir, across two.
+
+    python bench_rotation.py [--views 128] [--output_files 400] [--output_file_kb 256] [--cross_dir /dev/shm]
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+from rotation import RotationExecutor
+from run_manifest import RunManifest, atomic_write_json
+
+
+def make_tree(root: str, views: int, output_files: int, output_file_kb: int, image_kb: int = 300):
+    image = os.urandom(image_kb * 1024)
+    for folder in ("init", "diff_mod_image", "outputs/model/nerfstudio_models"):
+        os.makedirs(os.path.join(root, folder), exist_ok=True)
+    for i in range(views):
+        for path in (f"init/init_view_{i}.png", f"diff_mod_image/view_{i}.png", f"output_view_{i}.png"):
+            with open(os.path.join(root, path), "wb") as f:
+                f.write(image)
+    blob = os.urandom(output_file_kb * 1024)
+    for i in range(output_files):
+        with open(os.path.join(root, "outputs/model/nerfstudio_models", f"part_{i}.bin"), "wb") as f:
+            f.write(blob)
+
+
+def plan(root: str, iteration_dir: str, views: int):
+    moves = []
+    for i in range(views):
+        init_path = os.path.join(root, "init", f"init_view_{i}.png")
+        moves.append((init_path, os.path.join(iteration_dir, f"init_view_{i}.png")))
+        moves.append((os.path.join(root, "diff_mod_image", f"view_{i}.png"), os.path.join(iteration_dir, f"view_{i}.png")))
+        moves.append((os.path.join(root, f"output_view_{i}.png"), init_path))
+    moves.append((os.path.join(root, "outputs"), os.path.join(iteration_dir, "outputs")))
+    return moves
+
+
+def original_rotation(moves):
+    # rename_new_file before the run manifest: renames one after the other, nothing journaled
+    for source, destination in moves:
+        if os.path.exists(source):
+            os.rename(source, destination)
+
+
+def serial_rotation(journal_path: str, moves):
+    # The rotation as it was: one move after the other, the journal saved after each
+    rotation = {"moves": [list(move) for move in moves], "done": 0}
+    atomic_write_json(journal_path, rotation)
+    for source, destination in moves:
+        if os.path.exists(source):
+            os.replace(source, destination)
+        rotation["done"] += 1
+        atomic_write_json(journal_path, rotation)
+
+
+def bench(label, args, iteration_root, rotate):
+    root = tempfile.mkdtemp(prefix="rotation_")
+    iteration_parent = tempfile.mkdtemp(prefix="rotation_iter_", dir=iteration_root)
+    try:
+        make_tree(root, args.views, args.output_files, args.output_file_kb)
+        iteration_dir = os.path.join(iteration_parent, "0")
+        os.makedirs(iteration_dir)
+        moves = plan(root, iteration_dir, args.views)
+        start = time.perf_counter()
+        rotate(iteration_parent, moves)
+        elapsed = time.perf_counter() - start
+        assert not os.path.exists(os.path.join(root, "outputs"))
+        print(f"{label:<36}{len(moves):>7}{elapsed * 1e3:>12.1f}")
+        return elapsed
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+        shutil.rmtree(iteration_parent, ignore_errors=True)
+
+
+def phased(workers):
+    def rotate(run_dir, moves):
+        executor = RotationExecutor(workers=workers)
+        try:
+            RunManifest.create(run_dir, {}).move_files(0, moves, executor)
+        finally:
+            executor.close()
+    return rotate
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="File rotation benchmark")
+    parser.add_argument("--views", type=int, default=128, help="Number of views (default: 128)")
+    parser.add_argument("--output_files", type=int, default=400, help="Files in the outputs tree (default: 400)")
+    parser.add_argument("--output_file_kb", type=int, default=256, help="Size of those files in KB (default: 256)")
+    parser.add_argument("--workers", type=int, default=8, help="Threads of the executor (default: 8)")
+    parser.add_argument("--cross_dir", type=str, default=None,
+                        help="Folder on another file system for the iteration folder, e.g. /dev/shm (default: None)")
+    args = parser.parse_args()
+
+    print(f"{'rotation':<36}{'moves':>7}{'ms':>12}")
+    same_fs = tempfile.gettempdir()
+    original = bench("original rename loop, no journal", args, same_fs, lambda run_dir, moves: original_rotation(moves))
+    serial = bench("serial, journal per move", args, same_fs, lambda run_dir, moves: serial_rotation(
+        os.path.join(run_dir, "journal.json"), moves))
+    one_worker = bench("phased, 1 worker", args, same_fs, phased(1))
+    workers = bench(f"phased, {args.workers} workers", args, same_fs, phased(args.workers))
+    cross = None
+    if args.cross_dir is not None:
+        # os.replace cannot cross file systems, the serial rotation does not apply
+        cross_one = bench("cross fs, phased, 1 worker", args, args.cross_dir, phased(1))
+        cross_workers = bench(f"cross fs, phased, {args.workers} workers", args, args.cross_dir, phased(args.workers))
+        cross = cross_one / cross_workers
+
+    # The crash-safe rotation against the original loop, then its two effects separately:
+    # journaling per phase instead of per move, and the thread pool
+    print(f"phased, {args.workers} workers against the original rename loop: {workers / original:.1f}x the time "
+          f"(+{(workers - original) * 1e3:.1f} ms for the journal)")
+    print(f"journal per phase instead of per move (1 worker): {serial / one_worker:.1f}x")
+    print(f"{args.workers} workers instead of 1, same file system: {one_worker / workers:.2f}x")
+    if cross is not None:
+        print(f"{args.workers} workers instead of 1, across file systems: {cross:.2f}x")
@@ -0,0 +1,100 @@
+"""
+Measures how the CPU side of one iteration grows with the number of views: building the view set,
+writing the transforms file, rotating the renders, decoding streamed renders and tracking a session.
+Diffusion and training scale linearly with the views on top of this.
+
+    python bench_view_scaling.py [--views 17,32,64,128] [--size 512]
+"""
+import argparse
+import contextlib
+import io
+import math
+import os
+import tempfile
+import time
+
+import numpy as np
+from PIL import Image
+
+from coordination_server import Session
+from run_manifest import RunManifest
+from view_buffer import ViewBuffer
+from view_set import ViewSet, INTRINSICS
+
+
+def synthetic_view_set(count: int) -> ViewSet:
+    """
+    Cameras on a sphere (Fibonacci lattice) looking at the origin.
+    """
+    i = np.arange(count) + 0.5
+    z = 1 - i / count
+    radius = np.sqrt(1 - z ** 2)
+    angle = math.pi * (1 + 5 ** 0.5) * i
+    positions = 4 * np.stack([radius * np.cos(angle), radius * np.sin(angle), z], axis=1)
+
+    forward = -positions / np.linalg.norm(positions, axis=1, keepdims=True)
+    right = np.cross(forward, [0, 0, 1])
+    right /= np.maximum(np.linalg.norm(right, axis=1, keepdims=True), 1e-8)
+    up = np.cross(right, forward)
+
+    poses = np.tile(np.eye(4, dtype=np.float32), (count, 1, 1))
+    poses[:, :3, 0] = right
+    poses[:, :3, 1] = up
+    poses[:, :3, 2] = -forward
+    poses[:, :3, 3] = positions
+
+    filenames = [f"view_{index:03d}.png" for index in range(count)]
+    perspectives = [f"View {index:03d}" for index in range(count)]
+    intrinsics = dict.fromkeys(INTRINSICS[:6], 512.0)
+    return ViewSet(perspectives, filenames, poses, intrinsics)
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    function(*args)
+    return time.perf_counter() - start
+
+
+def bench(count: int, png: bytes, size: int):
+    view_set = synthetic_view_set(count)
+    row = {"views": count}
+    row["view set"] = timed(lambda: synthetic_view_set(count).train_elements(tokenized=True))
+
+    with tempfile.TemporaryDirectory() as folder:
+        row["transforms"] = timed(view_set.write_transforms, os.path.join(folder, "transforms.json"))
+
+        # One rotation: every render and its previous init image change folder
+        for filename in view_set.filenames:
+            with open(os.path.join(folder, f"output_{filename}"), "wb") as f:
+                f.write(png)
+        manifest = RunManifest.create(os.path.join(folder, "run"), {})
+        moves = [(os.path.join(folder, f"output_{filename}"), os.path.join(folder, f"init_{filename}"))
+                 for filename in view_set.filenames]
+        row["rotation"] = timed(manifest.move_files, 0, moves)
+
+    buffer = ViewBuffer(view_set.filenames.tolist(), size, size)
+    row["decode"] = timed(lambda: [buffer.put(filename, png) for filename in view_set.filenames])
+
+    session = Session("bench", view_set.expected_renders())
+    with contextlib.redirect_stdout(io.StringIO()):
+        row["session"] = timed(lambda: [session.add(filename) for filename in view_set.filenames])
+    return row
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Per-iteration overhead against the number of views")
+    parser.add_argument("--views", type=str, default="17,32,64,128", help="View counts to measure (default: 17,32,64,128)")
+    parser.add_argument("--size", type=int, default=512, help="Render resolution (default: 512)")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    encoded = io.BytesIO()
+    Image.fromarray(rng.integers(0, 255, (args.size, args.size, 3), dtype=np.uint8)).save(encoded, format="PNG")
+    png = encoded.getvalue()
+
+    columns = ["view set", "transforms", "rotation", "decode", "session"]
+    print(f"{'views':>6}" + "".join(f"{column + ' ms':>15}" for column in columns) + f"{'total ms':>12}")
+    for count in (int(value) for value in args.views.split(",")):
+        row = bench(count, png, args.size)
+        total = sum(row[column] for column in columns)
+        print(f"{count:>6}" + "".join(f"{row[column] * 1e3:>15.2f}" for column in columns) + f"{total * 1e3:>12.2f}")
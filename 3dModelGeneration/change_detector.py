@@ -0,0 +1,59 @@
+import json
+
+import numpy as np
+
+from image_metrics import average_hash, hamming, mse
+
+
+class ChangeDetector:
+    """
+    Picks the views worth diffusing again: a view whose init image (its latest NeRF render) barely
+    changed since the previous iteration keeps its previous diffusion output. A view is skipped when
+    the RMSE of its downsampled render is below `rmse_threshold` and its average hash differs by at
+    most `hash_threshold` bits. Every `full_refresh_every` iterations all views are diffused again.
+    Each decision is appended to a JSON lines log.
+    """
+
+    def __init__(self, rmse_threshold: float = 0.01, hash_threshold: int = 2, full_refresh_every: int = 5,
+                 log_path: str = None):
+        self.rmse_threshold = rmse_threshold
+        self.hash_threshold = hash_threshold
+        self.full_refresh_every = max(1, full_refresh_every)
+        self.log_path = log_path
+        self.skipped = {}
+
+    def decide(self, iteration: int, names, current: np.ndarray, previous: np.ndarray) -> dict:
+        """
+        Takes the downsampled init images of this iteration and of the previous one, in the order
+        of names, and returns {name: True if the view must be diffused again}.
+        """
+        rmse = np.sqrt(mse(current, previous))
+        distance = hamming(average_hash(current), average_hash(previous))
+        unchanged = (rmse < self.rmse_threshold) & (distance <= self.hash_threshold)
+        full_refresh = iteration % self.full_refresh_every == 0
+
+        decisions = {}
+        entries = []
+        for name, view_rmse, view_distance, view_unchanged in zip(names, rmse, distance, unchanged):
+            regenerate = full_refresh or not view_unchanged
+            decisions[name] = regenerate
+            reason = "full refresh" if full_refresh else ("changed" if regenerate else "unchanged")
+            entries.append({"iteration": iteration, "view": name, "rmse": round(float(view_rmse), 6),
+                            "hash_distance": int(view_distance), "decision": "diffuse" if regenerate else "reuse",
+                            "reason": reason})
+        self.skipped[iteration] = sum(1 for regenerate in decisions.values() if not regenerate)
+
+        if self.log_path is not None:
+            with open(self.log_path, "a") as f:
+                for entry in entries:
+                    f.write(json.dumps(entry) + "\n")
+        return decisions
+
+    def report(self, views: int):
+        if not self.skipped:
+            return
+        total = sum(self.skipped.values())
+        print(f"Selective regeneration: {total} of {views * len(self.skipped)} view diffusions reused")
+        for iteration, skipped in self.skipped.items():
+            print(f"  iteration {iteration:<4} reused {skipped}/{views}")
+
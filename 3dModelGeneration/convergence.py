@@ -0,0 +1,127 @@
+import time
+
+import numpy as np
+
+from image_metrics import psnr, ssim
+
+MODES = ("off", "stop", "adapt")
+
+
+class ConvergenceController:
+    """
+    Decides from the renders whether the refinement loop still makes progress. After every training,
+    the new renders are compared (downsampled, all views at once) with the renders of the previous
+    iteration, and with the diffusion outputs they were trained on. An iteration is converged when
+    the median render-to-render PSNR and SSIM are both above their thresholds.
+
+    mode "stop" ends the loop after `patience` converged iterations in a row, mode "adapt" scales
+    the strength and the training steps by `adapt_factor` for every converged iteration in a row.
+    """
+
+    def __init__(self, mode: str = "off", psnr_threshold: float = 32.0, ssim_threshold: float = 0.97,
+                 patience: int = 2, min_iterations: int = 2, adapt_factor: float = 0.5):
+        if mode not in MODES:
+            raise ValueError(f"Unknown convergence mode: {mode}")
+        self.mode = mode
+        self.psnr_threshold = psnr_threshold
+        self.ssim_threshold = ssim_threshold
+        self.patience = max(1, patience)
+        self.min_iterations = min_iterations
+        self.adapt_factor = adapt_factor
+        self.previous = None
+        self.streak = 0
+        self.history = []
+        self.stopped_at = None
+        self.saved_steps = 0
+        self.last_strength = None
+        self._iteration_started = time.perf_counter()
+
+    @property
+    def scale(self) -> float:
+        return self.adapt_factor ** self.streak if self.mode == "adapt" else 1.0
+
+    def adjust_strength(self, strength: float) -> float:
+        self.last_strength = strength * self.scale
+        return self.last_strength
+
+    def adjust_steps(self, steps: int, min_steps: int = 1) -> int:
+        adjusted = max(min_steps, int(round(steps * self.scale)))
+        self.saved_steps += max(0, steps - adjusted)
+        return adjusted
+
+    def check(self, iteration: int, renders: np.ndarray, diffused: np.ndarray = None,
+              previous: np.ndarray = None, steps_per_sec: float = None) -> dict:
+        """
+        Takes the downsampled renders of this iteration (and the diffusion outputs), returns the metrics.
+        `previous` is only needed when the controller did not see the previous iteration (resumed runs).
+        """
+        start = time.perf_counter()
+        previous = self.previous if previous is None else previous
+        result = {"iteration": iteration, "converged": False,
+                  "seconds": time.perf_counter() - self._iteration_started, "steps_per_sec": steps_per_sec}
+        if previous is not None:
+            render_psnr, render_ssim = psnr(renders, previous), ssim(renders, previous)
+            result.update(render_psnr=float(np.median(render_psnr)), render_ssim=float(np.median(render_ssim)),
+                          worst_view=int(np.argmin(render_psnr)), worst_psnr=float(render_psnr.min()))
+            result["converged"] = (iteration + 1 >= self.min_iterations
+                                   and result["render_psnr"] >= self.psnr_threshold
+                                   and result["render_ssim"] >= self.ssim_threshold)
+        if diffused is not None:
+            result.update(diffusion_psnr=float(np.median(psnr(renders, diffused))),
+                          diffusion_ssim=float(np.median(ssim(renders, diffused))))
+
+        self.streak = self.streak + 1 if result["converged"] else 0
+        self.previous = renders
+        result["check_seconds"] = time.perf_counter() - start
+        self.history.append(result)
+        self._iteration_started = time.perf_counter()
+        return result
+
+    def state(self) -> dict:
+        """
+        What a resumed run needs to go on with the same schedule: the converged streak, the last
+        strength, the training steps saved so far and the iteration the loop stopped after.
+        """
+        return {"streak": self.streak, "last_strength": self.last_strength, "saved_steps": self.saved_steps,
+                "stopped_at": self.stopped_at}
+
+    def restore(self, state: dict):
+        self.streak = state.get("streak", 0)
+        self.last_strength = state.get("last_strength")
+        self.saved_steps = state.get("saved_steps", 0)
+        self.stopped_at = state.get("stopped_at")
+
+    def should_stop(self) -> bool:
+        return self.mode == "stop" and self.streak >= self.patience
+
+    def stop(self, iteration: int):
+        self.stopped_at = iteration
+
+    def saved_seconds(self, max_iterations: int) -> float:
+        """
+        Estimate of the time saved: skipped iterations at the mean iteration time, and training steps
+        not run at the measured training speed.
+        """
+        saved = 0.0
+        timed = [entry["seconds"] for entry in self.history if entry["seconds"]]
+        if self.stopped_at is not None and timed:
+            saved += (max_iterations - self.stopped_at - 1) * sum(timed) / len(timed)
+        speeds = [entry["steps_per_sec"] for entry in self.history if entry.get("steps_per_sec")]
+        if self.saved_steps and speeds:
+            saved += self.saved_steps / (sum(speeds) / len(speeds))
+        return saved
+
+    def report(self, max_iterations: int):
+        if self.mode == "off" and not self.history:
+            return
+        print(f"Convergence ({self.mode}, PSNR >= {self.psnr_threshold}, SSIM >= {self.ssim_threshold}):")
+        for entry in self.history:
+            if "render_psnr" in entry:
+                print(f"  iteration {entry['iteration']:<4} render PSNR={entry['render_psnr']:.2f} "
+                      f"SSIM={entry['render_ssim']:.4f} worst view {entry['worst_view']} ({entry['worst_psnr']:.2f})"
+                      f"{' converged' if entry['converged'] else ''} [{entry['check_seconds'] * 1e3:.1f}ms]")
+        if self.stopped_at is not None:
+            print(f"  stopped after iteration {self.stopped_at} of {max_iterations}")
+        if self.saved_steps:
+            print(f"  training steps saved: {self.saved_steps}")
+        print(f"  estimated time saved: {self.saved_seconds(max_iterations):.1f}s")
@@ -0,0 +1,183 @@
+import asyncio
+import functools
+import os
+import threading
+import time
+import traceback
+
+from websockets.server import serve
+import websockets
+
+from messages import decode, is_framed
+
+# What the server does with legacy pickled messages: accept them with a deprecation warning, accept them
+# silently, or refuse them
+LEGACY_PICKLE_MODES = ("warn", "allow", "refuse")
+
+
+class Session:
+    """
+    One iteration of one trainer: the set of renders it is expected to send and the ones received so far.
+    """
+
+    def __init__(self, session_id: str, expected_filenames, on_complete=None, on_step=None, on_view=None):
+        self.session_id = session_id
+        self.expected = frozenset(expected_filenames)
+        self.received = {}
+        self.duplicates = 0
+        self.on_complete = on_complete
+        self.on_step = on_step
+        self.on_view = on_view
+        self.opened_at = time.monotonic()
+        self.complete = threading.Event()
+
+    def missing(self):
+        return self.expected - self.received.keys()
+
+    def add(self, filename: str) -> bool:
+        """
+        Records a received render, returns False if it was a duplicate or not expected.
+        """
+        if filename in self.received:
+            self.duplicates += 1
+            print(f"[{self.session_id}] Duplicate file ignored: {filename}")
+            return False
+        if filename not in self.expected:
+            print(f"[{self.session_id}] Unexpected file ignored: {filename}")
+            return False
+
+        self.received[filename] = time.monotonic() - self.opened_at
+        print(f"[{self.session_id}] Received file: {filename} {len(self.received)}/{len(self.expected)}")
+        if not self.missing():
+            self.complete.set()
+        return True
+
+    def wait(self, timeout: float = None) -> bool:
+        return self.complete.wait(timeout)
+
+
+def render_name(filename: str) -> str:
+    """
+    The trainer reports the path of the render it wrote (output_<name>), sessions track the view filename.
+    """
+    name = os.path.basename(filename)
+    if name.startswith("output_"):
+        name = name[len("output_"):]
+    return name
+
+
+class CoordinationServer:
+    """
+    Long-lived websocket server receiving the camera and step messages of the trainers.
+    It runs its own event loop on a background thread for the whole run; each iteration
+    opens a session and the messages are routed to it. Trainers are started with their session id
+    in NERF_PIPELINE_SESSION and name it in their messages; a message without one goes to the most
+    recently opened session, which only works with one trainer at a time. The trainer fork still sends legacy
+    pickled messages: they are accepted (through the restricted unpickler) with a deprecation warning until it
+    sends framed ones, legacy_pickle="refuse" drops them.
+    """
+
+    def __init__(self, host: str = "localhost", port: int = 8765, decode=decode, legacy_pickle: str = "warn"):
+        if legacy_pickle not in LEGACY_PICKLE_MODES:
+            raise ValueError(f"Unknown legacy pickle mode: {legacy_pickle}")
+        self.host = host
+        self.port = port
+        self.legacy_pickle = legacy_pickle
+        self.decode = decode if legacy_pickle == "refuse" else functools.partial(decode, allow_legacy_pickle=True)
+        self.legacy_messages = 0
+        self.sessions = {}
+        self.closed_sessions = set()
+        self._lock = threading.Lock()
+        self._loop = None
+        self._stop = None
+        self._thread = None
+        self._listening = threading.Event()
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=lambda: asyncio.run(self._serve()), daemon=True)
+        self._thread.start()
+        self._listening.wait()
+
+    async def _serve(self):
+        self._loop = asyncio.get_running_loop()
+        self._stop = self._loop.create_future()
+        async with serve(self._handle, self.host, self.port, max_size=None):
+            self._listening.set()
+            await self._stop
+
+    def stop(self):
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(lambda: self._stop.done() or self._stop.set_result(None))
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def open_session(self, session_id, expected_filenames, on_complete=None, on_step=None, on_view=None) -> Session:
+        session = Session(str(session_id), expected_filenames,
+                          on_complete=on_complete, on_step=on_step, on_view=on_view)
+        with self._lock:
+            self.sessions[session.session_id] = session
+        return session
+
+    def close_session(self, session_id):
+        with self._lock:
+            session = self.sessions.pop(str(session_id), None)
+            self.closed_sessions.add(str(session_id))
+        return session
+
+    def _route(self, message):
+        session_id = getattr(message, "session", None)
+        with self._lock:
+            if session_id is None and self.sessions:
+                return list(self.sessions.values())[-1]
+            session = self.sessions.get(str(session_id))
+            if session is None and str(session_id) in self.closed_sessions:
+                print(f"Late message for closed session {session_id} ignored")
+        return session
+
+    def dispatch(self, message):
+        session = self._route(message)
+        if session is None:
+            print(f"No open session for {message.type} message, ignored")
+            return
+
+        if message.type == "camera":
+            filename = render_name(message.message)
+            was_complete = session.complete.is_set()
+            if not session.add(filename):
+                return
+            # Hand the render (and its bytes, if streamed) over before signalling completion
+            if session.on_view is not None:
+                session.on_view(filename, message.payload)
+            if not was_complete and session.complete.is_set() and session.on_complete is not None:
+                session.on_complete(session)
+        elif message.type == "step":
+            print(f"[{session.session_id}] Step: {message.message}")
+            if session.on_step is not None:
+                session.on_step(message)
+
+    def _on_legacy_message(self):
+        self.legacy_messages += 1
+        if self.legacy_messages == 1 and self.legacy_pickle == "warn":
+            print("DeprecationWarning: the trainer sends legacy pickled messages. They are accepted until the "
+                  "trainer fork sends framed messages (messages.encode), --legacy_pickle refuse drops them")
+
+    async def _handle(self, websocket):
+        try:
+            async for raw in websocket:
+                try:
+                    message = self.decode(raw)
+                except Exception as e:
+                    print(f"Malformed message dropped: {e}")
+                    continue
+                if not is_framed(raw):
+                    self._on_legacy_message()
+                try:
+                    self.dispatch(message)
+                except Exception:
+                    # A failing callback must not drop the trainer's connection
+                    print(f"Error handling {message.type} message:")
+                    traceback.print_exc()
+        except websockets.exceptions.ConnectionClosedError:
+            pass
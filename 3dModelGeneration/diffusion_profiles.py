@@ -0,0 +1,106 @@
+import copy
+import math
+
+# Scheduler classes of diffusers, by profile name, with the options they are built with
+SCHEDULERS = {
+    "dpm++": ("DPMSolverMultistepScheduler", {"algorithm_type": "dpmsolver++"}),
+    "unipc": ("UniPCMultistepScheduler", {}),
+    "lcm": ("LCMScheduler", {}),
+}
+
+
+class SpeedProfile:
+    """
+    How the img2img pipeline runs: scheduler, step budget and the UNet execution options.
+    img2img only runs int(steps * strength) denoising steps, `min_steps` raises the step count
+    at low strength so late iterations still run at least that many.
+    """
+
+    def __init__(self, name: str, steps: int = 50, min_steps: int = 0, guidance_scale: float = 2.5,
+                 scheduler: str = None, channels_last: bool = False, attention: str = "default",
+                 compile: bool = False, lora: str = None):
+        if scheduler is not None and scheduler not in SCHEDULERS:
+            raise ValueError(f"Unknown scheduler: {scheduler}")
+        if attention not in ("default", "sdpa", "slicing"):
+            raise ValueError(f"Unknown attention mode: {attention}")
+        self.name = name
+        self.steps = steps
+        self.min_steps = min_steps
+        self.guidance_scale = guidance_scale
+        self.scheduler = scheduler
+        self.channels_last = channels_last
+        self.attention = attention
+        self.compile = compile
+        self.lora = lora
+
+    def replace(self, **changes):
+        profile = copy.copy(self)
+        for name, value in changes.items():
+            setattr(profile, name, value)
+        return profile
+
+    def inference_steps(self, strength: float) -> int:
+        """
+        num_inference_steps to pass to the pipeline for this strength.
+        """
+        if strength <= 0 or self.min_steps <= 0:
+            return self.steps
+        return max(self.steps, math.ceil(self.min_steps / strength))
+
+    def denoising_steps(self, strength: float) -> int:
+        steps = self.inference_steps(strength)
+        return min(int(steps * strength), steps)
+
+    def __str__(self):
+        return (f"{self.name} (scheduler={self.scheduler or 'model default'}, steps={self.steps}, "
+                f"min_steps={self.min_steps}, guidance={self.guidance_scale}, channels_last={self.channels_last}, "
+                f"attention={self.attention}, compile={self.compile})")
+
+
+PROFILES = {
+    # What the pipeline always did: the model's own scheduler for 50 steps
+    "quality": SpeedProfile("quality"),
+    "balanced": SpeedProfile("balanced", steps=25, min_steps=10, scheduler="dpm++",
+                             channels_last=True, attention="sdpa"),
+    "fast": SpeedProfile("fast", steps=15, min_steps=6, scheduler="unipc",
+                         channels_last=True, attention="sdpa", compile=True),
+    # Latent consistency: needs the LCM LoRA (or an LCM-distilled model) and no classifier-free guidance
+    "lcm": SpeedProfile("lcm", steps=6, min_steps=3, guidance_scale=1.0, scheduler="lcm",
+                        channels_last=True, attention="sdpa", lora="latent-consistency/lcm-lora-sdv1-5"),
+    # Lowest memory: attention computed one slice at a time
+    "low_memory": SpeedProfile("low_memory", steps=25, min_steps=10, scheduler="dpm++", attention="slicing"),
+}
+
+
+def apply_profile(pipeline, profile: SpeedProfile):
+    """
+    Configures a loaded pipeline for the profile. The scheduler is rebuilt from the model's
+    scheduler config, so the noise schedule of the fine-tuned model is kept.
+    """
+    import torch
+
+    if profile.scheduler is not None:
+        import diffusers
+
+        class_name, options = SCHEDULERS[profile.scheduler]
+        scheduler_class = getattr(diffusers, class_name)
+        pipeline.scheduler = scheduler_class.from_config(pipeline.scheduler.config, **options)
+
+    if profile.lora is not None:
+        pipeline.load_lora_weights(profile.lora)
+        pipeline.fuse_lora()
+
+    if profile.channels_last:
+        pipeline.unet.to(memory_format=torch.channels_last)
+        pipeline.vae.to(memory_format=torch.channels_last)
+
+    if profile.attention == "sdpa":
+        from diffusers.models.attention_processor import AttnProcessor2_0
+        pipeline.unet.set_attn_processor(AttnProcessor2_0())
+    elif profile.attention == "slicing":
+        pipeline.enable_attention_slicing()
+
+    if profile.compile:
+        # The first call of every new shape (batch size, step count) pays the compilation
+        pipeline.unet = torch.compile(pipeline.unet, mode="reduce-overhead")
+    return pipeline
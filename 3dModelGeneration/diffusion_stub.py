@@ -0,0 +1,44 @@
+import time
+
+import numpy as np
+from PIL import Image
+
+
+def stub_img2img(images, strength: float, seeds=None, seconds: float = 0.0):
+    """
+    CPU stand-in for the img2img pipeline: adds noise scaled by the strength to every image.
+    Each image gets its own generator, seeded like the real ones so the output does not depend on the batch size.
+    """
+    time.sleep(seconds)
+    outputs = []
+    for i, image in enumerate(images):
+        rng = np.random.default_rng(None if seeds is None else seeds[i])
+        pixels = np.asarray(image.convert("RGB").resize((512, 512)), np.float32)
+        pixels = pixels + rng.normal(0.0, 32.0 * strength, pixels.shape)
+        outputs.append(Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8)))
+    return outputs
+
+
+class StubModelManager:
+    """
+    The ModelManager of --diffusion stub: there are no weights to load or move, the pipeline is stub_img2img.
+    Needs neither torch nor diffusers, so the orchestration of pipeline.py runs on any machine.
+    """
+
+    def __init__(self):
+        self.pipeline = None
+        self.loads = 0
+
+    def load(self):
+        self.pipeline = stub_img2img
+        self.loads += 1
+        return self.pipeline
+
+    def acquire(self):
+        return self.pipeline if self.pipeline is not None else self.load()
+
+    def offload(self):
+        pass
+
+    def report(self):
+        print(f"Model manager: stub diffusion, loaded {self.loads} time(s)")
@@ -0,0 +1,249 @@
+"""
+Iteration archive: the views of every iteration folder (iter/<time>/<i>/) packed into one
+(stages, views, height, width, 3) uint8 array, views.npy, with an index.json naming the stages and views.
+Readers memory-map the arrays, so only the images actually looked at are read from disk.
+
+Only the init and diffusion stages are stored: the NeRF render of an iteration becomes the init image
+of the next one, so ArchiveReader serves a "nerf" stage of folder i from the "init" stage of folder i + 1
+instead of archiving every render twice.
+
+    python image_archive.py pack iter/<time>             # archive the PNGs of an existing run
+    python image_archive.py info iter/<time>             # iterations, stages, views and load time
+    python image_archive.py export iter/<time> ./export  # back to PNG
+"""
+import argparse
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from PIL import Image
+
+from run_manifest import atomic_write_json
+
+ARRAY_NAME = "views.npy"
+INDEX_NAME = "index.json"
+# Virtual stage: the NeRF render of iteration i is the init image of iteration i + 1
+NERF_STAGE = "nerf"
+
+
+def write_iteration(folder: str, stages: dict, size=None, workers: int = 4):
+    """
+    Packs the images of one iteration folder. `stages` maps a stage name to {view name: image file name}
+    relative to the folder; missing files leave a black image and are left out of the index.
+    Returns the path of the array.
+    """
+    names = list(dict.fromkeys(view for views in stages.values() for view in views))
+    jobs = []
+    for s, views in enumerate(stages.values()):
+        for view, file_name in views.items():
+            path = os.path.join(folder, file_name)
+            if os.path.exists(path):
+                jobs.append((s, names.index(view), path))
+    if not jobs:
+        return None
+
+    if size is None:
+        with Image.open(jobs[0][2]) as image:
+            size = image.size
+    width, height = size
+
+    temp_path = os.path.join(folder, f"{ARRAY_NAME}.part")
+    array = np.lib.format.open_memmap(temp_path, mode="w+", dtype=np.uint8,
+                                      shape=(len(stages), len(names), height, width, 3))
+
+    def decode(job):
+        s, v, path = job
+        with Image.open(path) as image:
+            image = image.convert("RGB")
+            if image.size != (width, height):
+                image = image.resize((width, height))
+            array[s, v] = np.asarray(image)
+
+    # PNG decoding releases the GIL, the images are decoded in parallel
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        list(executor.map(decode, jobs))
+    array.flush()
+    del array
+
+    present = {(s, v) for s, v, _ in jobs}
+    index = {
+        "stages": list(stages),
+        "views": names,
+        "files": {stage: {view: file_name for view, file_name in views.items()
+                          if (s, names.index(view)) in present}
+                  for s, (stage, views) in enumerate(stages.items())},
+        "shape": [height, width],
+    }
+    path = os.path.join(folder, ARRAY_NAME)
+    os.replace(temp_path, path)
+    atomic_write_json(os.path.join(folder, INDEX_NAME), index)
+    return path
+
+
+class ArchiveWriter:
+    """
+    Packs iteration folders on a background thread, off the critical path of the loop.
+    With remove_images the archived PNGs are deleted once packed.
+    """
+
+    def __init__(self, remove_images: bool = False, workers: int = 4):
+        self.remove_images = remove_images
+        self.workers = workers
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="archive")
+        self._pending = []
+        self._lock = threading.Lock()
+
+    def _pack(self, folder, stages):
+        path = write_iteration(folder, stages, workers=self.workers)
+        if path is not None and self.remove_images:
+            for views in stages.values():
+                for file_name in views.values():
+                    file_path = os.path.join(folder, file_name)
+                    if os.path.exists(file_path):
+                        os.remove(file_path)
+        return path
+
+    def submit(self, folder: str, stages: dict):
+        future = self._executor.submit(self._pack, folder, stages)
+        with self._lock:
+            self._pending.append(future)
+        return future
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, []
+        for future in pending:
+            future.result()
+
+    def close(self):
+        self.flush()
+        self._executor.shutdown()
+
+
+class ArchiveReader:
+    """
+    Random access to the archived views of a run. Arrays are memory-mapped on first access,
+    reading a view only touches its own pages.
+    """
+
+    def __init__(self, run_dir: str):
+        self.run_dir = run_dir
+        self.indexes = {}
+        for name in os.listdir(run_dir):
+            index_path = os.path.join(run_dir, name, INDEX_NAME)
+            if name.isdigit() and os.path.exists(index_path):
+                with open(index_path) as f:
+                    self.indexes[int(name)] = json.load(f)
+        self._arrays = {}
+
+    def iterations(self):
+        return sorted(self.indexes)
+
+    def _files(self, iteration: int, stage: str) -> dict:
+        if stage == NERF_STAGE:
+            return self.indexes.get(iteration + 1, {}).get("files", {}).get("init", {})
+        return self.indexes[iteration]["files"].get(stage, {})
+
+    def stages(self, iteration: int):
+        stages = list(self.indexes[iteration]["files"])
+        if self._files(iteration, NERF_STAGE):
+            stages.append(NERF_STAGE)
+        return stages
+
+    def views(self, iteration: int, stage: str):
+        return list(self._files(iteration, stage))
+
+    def array(self, iteration: int) -> np.ndarray:
+        if iteration not in self._arrays:
+            self._arrays[iteration] = np.load(os.path.join(self.run_dir, str(iteration), ARRAY_NAME), mmap_mode="r")
+        return self._arrays[iteration]
+
+    def view(self, iteration: int, stage: str, view: str) -> np.ndarray:
+        if view not in self._files(iteration, stage):
+            raise KeyError(f"No {stage} image of {view} in iteration {iteration}")
+        if stage == NERF_STAGE:
+            return self.view(iteration + 1, "init", view)
+        index = self.indexes[iteration]
+        return self.array(iteration)[index["stages"].index(stage), index["views"].index(view)]
+
+    def image(self, iteration: int, stage: str, view: str) -> Image.Image:
+        return Image.fromarray(np.asarray(self.view(iteration, stage, view)))
+
+    def history(self, stage: str, view: str) -> np.ndarray:
+        """
+        The images of one view and stage over every iteration that has it, as (iterations, height, width, 3).
+        """
+        return np.stack([self.view(iteration, stage, view) for iteration in self.iterations()
+                         if view in self._files(iteration, stage)])
+
+    def export(self, output_dir: str):
+        """
+        Writes every archived view back as <output_dir>/<iteration>/<original file name>.
+        The "nerf" stage is not written again, its images are the init images of the next iteration.
+        """
+        count = 0
+        for iteration in self.iterations():
+            folder = os.path.join(output_dir, str(iteration))
+            os.makedirs(folder, exist_ok=True)
+            for stage, views in self.indexes[iteration]["files"].items():
+                for view, file_name in views.items():
+                    self.image(iteration, stage, view).save(os.path.join(folder, file_name))
+                    count += 1
+        return count
+
+
+def iteration_stages(train_elements):
+    """
+    What the pipeline keeps in an iteration folder: the init image (the NeRF render of the previous
+    iteration) and the diffusion output of every view. There is no separate NeRF stage, the reader
+    derives it from the next folder's init images.
+    """
+    return {
+        "init": {element.filename: element.init_image_name for element in train_elements},
+        "diffusion": {element.filename: element.filename for element in train_elements},
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Pack, inspect or export the image archive of a run")
+    parser.add_argument("command", choices=["pack", "info", "export"])
+    parser.add_argument("run_dir", type=str, help="Run folder (iter/<time>)")
+    parser.add_argument("output_dir", type=str, nargs="?", default=None, help="Export destination")
+    parser.add_argument("--views", type=str, default="./transforms_internal.json",
+                        help="View set of the run (default: ./transforms_internal.json)")
+    args = parser.parse_args()
+
+    if args.command == "pack":
+        from view_set import ViewSet
+
+        stages = iteration_stages(ViewSet.load(args.views).train_elements(tokenized=False).values())
+        start = time.perf_counter()
+        folders = [name for name in os.listdir(args.run_dir)
+                   if name.isdigit() and os.path.isdir(os.path.join(args.run_dir, name))]
+        for name in sorted(folders, key=int):
+            write_iteration(os.path.join(args.run_dir, name), stages)
+        print(f"Packed {len(folders)} iterations in {time.perf_counter() - start:.2f}s")
+
+    elif args.command == "info":
+        start = time.perf_counter()
+        reader = ArchiveReader(args.run_dir)
+        # Touch every pixel, the time a full analysis pass needs to get the images in memory
+        read = 0
+        for iteration in reader.iterations():
+            array = reader.array(iteration)
+            array.max()
+            read += array.nbytes
+        elapsed = time.perf_counter() - start
+        for iteration in reader.iterations():
+            print(f"  {iteration:<4} " + ", ".join(f"{stage}: {len(reader.views(iteration, stage))} views"
+                                                  for stage in reader.stages(iteration)))
+        print(f"Read {read / 2 ** 20:.0f} MB of {len(reader.iterations())} iterations in {elapsed:.2f}s")
+
+    else:
+        if args.output_dir is None:
+            parser.error("export needs an output_dir")
+        count = ArchiveReader(args.run_dir).export(args.output_dir)
+        print(f"Exported {count} images to {args.output_dir}")
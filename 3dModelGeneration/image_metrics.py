@@ -0,0 +1,83 @@
+"""
+Vectorized comparisons of whole view sets: every function takes (views, height, width, 3) float32
+arrays in [0, 1] and returns one value per view, so comparing all views costs a few NumPy calls.
+"""
+import numpy as np
+from PIL import Image
+
+LUMA = np.array([0.299, 0.587, 0.114], dtype=np.float32)
+
+
+def _reduce(image: Image.Image, size: int) -> np.ndarray:
+    # Box-reduce by the largest whole factor, then resize to exactly size x size
+    factor = max(1, min(image.size) // size)
+    image = image.reduce(factor) if factor > 1 else image
+    if image.size != (size, size):
+        image = image.resize((size, size), Image.BILINEAR)
+    return np.asarray(image)
+
+
+def downsample(images: np.ndarray, size: int = 64) -> np.ndarray:
+    """
+    Reduces (views, height, width, 3) images to (views, size, size, 3) float32 in [0, 1], with the same
+    resampling as load_views, so in-memory and on-disk views can be compared whatever their resolution.
+    """
+    images = np.asarray(images)
+    if images.dtype != np.uint8:
+        images = np.clip(np.rint(images), 0, 255).astype(np.uint8)
+    return np.stack([_reduce(Image.fromarray(image), size) for image in images]).astype(np.float32) / 255.0
+
+
+def load_views(paths, size: int = 64) -> np.ndarray:
+    """
+    Loads and downsamples image files. Each file is fully decoded before it is reduced (PNG has no
+    reduced-size decoding), the cost of the check is mostly here when the renders are not in memory.
+    """
+    images = []
+    for path in paths:
+        with Image.open(path) as image:
+            images.append(_reduce(image.convert("RGB"), size))
+    return np.stack(images).astype(np.float32) / 255.0
+
+
+def mse(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    return np.mean((a - b) ** 2, axis=(1, 2, 3))
+
+
+def psnr(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    return 10 * np.log10(1.0 / np.maximum(mse(a, b), 1e-10))
+
+
+def _box_mean(x: np.ndarray, window: int) -> np.ndarray:
+    # Mean over every window x window patch of (views, height, width), through an integral image
+    integral = np.pad(x, ((0, 0), (1, 0), (1, 0))).cumsum(axis=1).cumsum(axis=2)
+    sums = (integral[:, window:, window:] - integral[:, :-window, window:]
+            - integral[:, window:, :-window] + integral[:, :-window, :-window])
+    return sums / (window * window)
+
+
+def ssim(a: np.ndarray, b: np.ndarray, window: int = 7) -> np.ndarray:
+    """
+    Mean SSIM of the luminance, with a uniform window.
+    """
+    x = (a @ LUMA).astype(np.float64)
+    y = (b @ LUMA).astype(np.float64)
+    c1, c2 = 0.01 ** 2, 0.03 ** 2
+    mu_x, mu_y = _box_mean(x, window), _box_mean(y, window)
+    var_x = _box_mean(x * x, window) - mu_x ** 2
+    var_y = _box_mean(y * y, window) - mu_y ** 2
+    cov = _box_mean(x * y, window) - mu_x * mu_y
+    ssim_map = ((2 * mu_x * mu_y + c1) * (2 * cov + c2)) / ((mu_x ** 2 + mu_y ** 2 + c1) * (var_x + var_y + c2))
+    return ssim_map.mean(axis=(1, 2))
+
+
+def average_hash(images: np.ndarray, hash_size: int = 8) -> np.ndarray:
+    """
+    Perceptual average hash: (views, hash_size * hash_size) bits, set where the luminance is above the mean.
+    """
+    gray = downsample(images * 255.0, hash_size) @ LUMA
+    return (gray > gray.mean(axis=(1, 2), keepdims=True)).reshape(len(images), -1)
+
+
+def hamming(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    return np.count_nonzero(a != b, axis=1)
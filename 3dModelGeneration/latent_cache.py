@@ -0,0 +1,160 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+import torch
+
+from run_manifest import atomic_write_json
+
+
+def content_hash(image) -> str:
+    """
+    Hash of the decoded pixels (and size) of an image, identical renders share their latents.
+    """
+    pixels = np.ascontiguousarray(np.asarray(image))
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(str(pixels.shape).encode())
+    digest.update(pixels.tobytes())
+    return digest.hexdigest()
+
+
+class LatentCache:
+    """
+    VAE latents of the init images, stored as float16 in a memory-mapped (capacity, 4, h, w) array
+    under `folder`, indexed by the content hash of the image. Renders that did not change since they
+    were last encoded skip the VAE encoder; the others are encoded together in one batch.
+    When full, the least recently used latents are evicted.
+    """
+
+    def __init__(self, folder: str, capacity: int = 64):
+        self.folder = folder
+        self.capacity = capacity
+        self.index = OrderedDict()
+        self.store = None
+        self.hits = 0
+        self.misses = 0
+        self.encode_time = 0.0
+        # Run totals, to estimate the time saved by iterations without a miss
+        self._encoded = 0
+        self._encoded_time = 0.0
+        self._lock = threading.Lock()
+        self._index_path = os.path.join(folder, "index.json")
+        self._store_path = os.path.join(folder, "latents.npy")
+        self._open()
+
+    def _open(self):
+        if not os.path.exists(self._index_path) or not os.path.exists(self._store_path):
+            return
+        with open(self._index_path) as f:
+            saved = json.load(f)
+        store = np.load(self._store_path, mmap_mode="r+")
+        if store.shape[0] != self.capacity:
+            return
+        self.store = store
+        self.index = OrderedDict(saved["entries"])
+
+    def _create_store(self, shape):
+        os.makedirs(self.folder, exist_ok=True)
+        self.store = np.lib.format.open_memmap(self._store_path, mode="w+", dtype=np.float16,
+                                               shape=(self.capacity,) + tuple(shape))
+        self.index.clear()
+
+    def _save_index(self):
+        self.store.flush()
+        atomic_write_json(self._index_path, {"entries": list(self.index.items())})
+
+    def _slot_for(self):
+        if len(self.index) < self.capacity:
+            used = set(self.index.values())
+            return next(slot for slot in range(self.capacity) if slot not in used)
+        _, slot = self.index.popitem(last=False)
+        return slot
+
+    def get(self, key: str):
+        with self._lock:
+            if self.store is None or key not in self.index:
+                return None
+            self.index.move_to_end(key)
+            return np.array(self.store[self.index[key]])
+
+    def put(self, key: str, latents: np.ndarray):
+        with self._lock:
+            if self.store is None or self.store.shape[1:] != latents.shape:
+                self._create_store(latents.shape)
+            slot = self.index.pop(key, None)
+            if slot is None:
+                slot = self._slot_for()
+            self.store[slot] = latents.astype(np.float16)
+            self.index[key] = slot
+
+    def latents(self, pipeline, images):
+        """
+        Returns the scaled latents of the images as a (batch, 4, h, w) tensor on the pipeline device,
+        ready to be passed to the img2img pipeline in place of the images. The latents are the mode of the
+        VAE distribution: a cached entry must not depend on the generator, so unlike the uncached path
+        (which samples with the seeded generator) outputs are not reproducible against uncached runs.
+        """
+        keys = [content_hash(image) for image in images]
+        cached = [self.get(key) for key in keys]
+        missing = {}
+        for i, key in enumerate(keys):
+            if cached[i] is None:
+                missing.setdefault(key, []).append(i)
+        with self._lock:
+            self.hits += len(keys) - sum(len(positions) for positions in missing.values())
+
+        if missing:
+            start = time.perf_counter()
+            first = [positions[0] for positions in missing.values()]
+            vae = pipeline.vae
+            pixels = pipeline.image_processor.preprocess([images[i] for i in first])
+            with torch.no_grad():
+                encoded = vae.encode(pixels.to(pipeline.device, vae.dtype)).latent_dist.mode()
+                encoded = (encoded * vae.config.scaling_factor).float().cpu().numpy()
+            for (key, positions), latents in zip(missing.items(), encoded):
+                self.put(key, latents)
+                for i in positions:
+                    cached[i] = latents
+            elapsed = time.perf_counter() - start
+            # Diffusion workers update the counters concurrently
+            with self._lock:
+                self.encode_time += elapsed
+                self.misses += len(first)
+                self._encoded_time += elapsed
+                self._encoded += len(first)
+                self._save_index()
+
+        return torch.from_numpy(np.stack(cached)).to(pipeline.device, pipeline.unet.dtype)
+
+    def saved_time(self) -> float:
+        """
+        Encoder time avoided by the hits, estimated from the mean encode time of a miss.
+        """
+        if not self._encoded:
+            return 0.0
+        return self.hits * self._encoded_time / self._encoded
+
+    def stats(self):
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "encode_seconds": self.encode_time,
+                    "saved_seconds": self.saved_time()}
+
+    def reset_stats(self):
+        with self._lock:
+            self.hits = 0
+            self.misses = 0
+            self.encode_time = 0.0
+
+    def clear(self):
+        """
+        Removes the store, at the end of the run it was created for.
+        """
+        with self._lock:
+            self.store = None
+            self.index.clear()
+            shutil.rmtree(self.folder, ignore_errors=True)
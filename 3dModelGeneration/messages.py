@@ -0,0 +1,153 @@
+import io
+import json
+import pickle
+import struct
+
+# Wire format, all integers little endian:
+#   magic (4s) | version (B) | type (B) | reserved (H) | body length (I) | payload length (I)
+#   body: UTF-8 JSON object with the typed fields of the message
+#   payload: optional raw bytes (e.g. an encoded render)
+MAGIC = b"NSPM"
+VERSION = 1
+HEADER = struct.Struct("<4sBBHII")
+
+MESSAGE_TYPES = {"camera": 1, "step": 2}
+MESSAGE_NAMES = {code: name for name, code in MESSAGE_TYPES.items()}
+
+# Typed fields of each message type, "message" is always present
+SCHEMA = {
+    "camera": {"session": str, "image_format": str, "width": int, "height": int},
+    "step": {"session": str, "loss": float, "rays_per_sec": float, "step_time": float},
+}
+
+
+class SocketMessage:
+    session = None
+    payload = None
+
+    def __init__(self, type: str, message: str, session: str = None, payload: bytes = None, **fields):
+        self.type = type
+        self.message = message
+        self.session = session
+        self.payload = payload
+        self.fields = fields
+
+    def get(self, name, default=None):
+        return getattr(self, "fields", {}).get(name, default)
+
+    def to_pickle(self):
+        return pickle.dumps(self)
+
+    def to_bytes(self):
+        return encode(self)
+
+
+def camera_message(filename: str, image: bytes = None, image_format: str = "png", session: str = None, **fields):
+    if image is not None:
+        fields["image_format"] = image_format
+    return SocketMessage("camera", filename, session=session, payload=image, **fields)
+
+
+def step_message(step: int, loss: float = None, rays_per_sec: float = None, session: str = None, **fields):
+    if loss is not None:
+        fields["loss"] = loss
+    if rays_per_sec is not None:
+        fields["rays_per_sec"] = rays_per_sec
+    return SocketMessage("step", int(step), session=session, **fields)
+
+
+def _validate(type: str, body: dict):
+    if not isinstance(body, dict) or "message" not in body:
+        raise ValueError(f"Body of {type} message must be an object with a message")
+    if not isinstance(body["message"], (str, int)):
+        raise ValueError(f"Field 'message' of {type} message must be str or int")
+    schema = SCHEMA[type]
+    for name, value in body.items():
+        if name == "message" or value is None:
+            continue
+        expected = schema.get(name)
+        if expected is None:
+            raise ValueError(f"Unknown field '{name}' for {type} message")
+        if expected is float and isinstance(value, int):
+            continue
+        if not isinstance(value, expected):
+            raise ValueError(f"Field '{name}' of {type} message must be {expected.__name__}")
+
+
+def encode(message: SocketMessage) -> bytes:
+    if message.type not in MESSAGE_TYPES:
+        raise ValueError(f"Unknown message type: {message.type}")
+    body = {"message": message.message, **getattr(message, "fields", {})}
+    if message.session is not None:
+        body["session"] = message.session
+    _validate(message.type, body)
+
+    body = json.dumps(body, separators=(",", ":")).encode("utf-8")
+    payload = message.payload or b""
+    header = HEADER.pack(MAGIC, VERSION, MESSAGE_TYPES[message.type], 0, len(body), len(payload))
+    return b"".join((header, body, payload))
+
+
+class _LegacyUnpickler(pickle.Unpickler):
+    """
+    Only lets the legacy pickled SocketMessage through, whatever module the sender defined it in.
+    """
+
+    def find_class(self, module, name):
+        if name == "SocketMessage":
+            return SocketMessage
+        raise pickle.UnpicklingError(f"Refusing to unpickle {module}.{name}")
+
+
+def _validate_legacy(message) -> SocketMessage:
+    # A pickled object can carry any attribute: check it like a framed message before using it
+    if not isinstance(message, SocketMessage) or message.type not in MESSAGE_TYPES:
+        raise ValueError("Not a legacy camera or step message")
+    fields = getattr(message, "fields", {})
+    if not isinstance(fields, dict):
+        raise ValueError("Legacy message fields must be a dict")
+    body = {**fields, "message": message.message}
+    if message.session is not None:
+        body["session"] = message.session
+    _validate(message.type, body)
+    if message.payload is not None and not isinstance(message.payload, bytes):
+        raise ValueError("Legacy message payload must be bytes")
+    return message
+
+
+def is_framed(raw) -> bool:
+    if isinstance(raw, str):
+        raw = raw.encode("utf-8")
+    return raw.startswith(MAGIC)
+
+
+def decode(raw: bytes, allow_legacy_pickle: bool = False) -> SocketMessage:
+    """
+    Decodes a framed message. Pickled legacy messages are only accepted with allow_legacy_pickle,
+    since the bytes come from the socket.
+    """
+    if isinstance(raw, str):
+        raw = raw.encode("utf-8")
+
+    if not is_framed(raw):
+        if not allow_legacy_pickle:
+            raise ValueError("Not a framed message (legacy pickled messages are disabled)")
+        return _validate_legacy(_LegacyUnpickler(io.BytesIO(raw)).load())
+
+    if len(raw) < HEADER.size:
+        raise ValueError("Truncated message header")
+    _, version, type_code, _, body_length, payload_length = HEADER.unpack_from(raw)
+    if version != VERSION:
+        raise ValueError(f"Unsupported message version: {version}")
+    if type_code not in MESSAGE_NAMES:
+        raise ValueError(f"Unknown message type code: {type_code}")
+    if len(raw) != HEADER.size + body_length + payload_length:
+        raise ValueError("Message length does not match its header")
+
+    type = MESSAGE_NAMES[type_code]
+    body = json.loads(raw[HEADER.size:HEADER.size + body_length])
+    _validate(type, body)
+    payload = raw[HEADER.size + body_length:] or None
+    message = body.pop("message")
+    session = body.pop("session", None)
+    return SocketMessage(type, message, session=session, payload=payload, **body)
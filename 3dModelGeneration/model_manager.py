@@ -0,0 +1,100 @@
+import threading
+import time
+
+import torch
+from diffusers import StableDiffusionImg2ImgPipeline
+
+from diffusion_profiles import PROFILES, SpeedProfile, apply_profile
+
+
+class ModelManager:
+    """
+    Keeps the img2img pipeline resident for the whole run.
+    The weights are loaded once, parked on the host while ns-train holds the GPU
+    and moved back to the device when the diffusion stage starts. Several diffusion workers
+    may acquire it at once, loads and moves are serialized so they happen only once.
+    """
+
+    def __init__(self, model_path: str, device: str = "cuda", pin_memory: bool = False,
+                 profile: SpeedProfile = PROFILES["quality"]):
+        self.model_path = model_path
+        self.profile = profile
+        self.device = device
+        self.pin_memory = pin_memory and torch.cuda.is_available()
+        self.pipeline: StableDiffusionImg2ImgPipeline = None
+        self.on_device = False
+        self.timings = {"load": [], "offload": [], "reload": []}
+        self._lock = threading.RLock()
+
+    def _modules(self):
+        for component in self.pipeline.components.values():
+            if isinstance(component, torch.nn.Module):
+                yield component
+
+    def _synchronize(self):
+        if torch.cuda.is_available():
+            torch.cuda.synchronize()
+
+    def load(self):
+        with self._lock:
+            start = time.perf_counter()
+            pipeline = StableDiffusionImg2ImgPipeline.from_pretrained(self.model_path, torch_dtype=torch.float16)
+            pipeline.safety_checker = None
+            self.pipeline = apply_profile(pipeline.to(self.device), self.profile)
+            self.on_device = True
+            self._synchronize()
+            elapsed = time.perf_counter() - start
+            self.timings["load"].append(elapsed)
+            print(f"Model loaded in {elapsed:.2f}s")
+            return self.pipeline
+
+    def acquire(self) -> StableDiffusionImg2ImgPipeline:
+        """
+        Returns the pipeline on the device, loading it on first use.
+        """
+        with self._lock:
+            if self.pipeline is None:
+                return self.load()
+            if self.on_device:
+                return self.pipeline
+
+            start = time.perf_counter()
+            for module in self._modules():
+                module.to(self.device, non_blocking=self.pin_memory)
+            self._synchronize()
+            self.on_device = True
+            elapsed = time.perf_counter() - start
+            self.timings["reload"].append(elapsed)
+            print(f"Model moved back to {self.device} in {elapsed:.2f}s")
+            return self.pipeline
+
+    def offload(self):
+        """
+        Parks the weights on the host (pinned if requested) to free the GPU for ns-train.
+        """
+        with self._lock:
+            if self.pipeline is None or not self.on_device:
+                return
+
+            start = time.perf_counter()
+            for module in self._modules():
+                module.to("cpu")
+                if self.pin_memory:
+                    for tensor in list(module.parameters()) + list(module.buffers()):
+                        tensor.data = tensor.data.pin_memory()
+            self.on_device = False
+            if torch.cuda.is_available():
+                torch.cuda.empty_cache()
+            elapsed = time.perf_counter() - start
+            self.timings["offload"].append(elapsed)
+            print(f"Model offloaded to host in {elapsed:.2f}s")
+
+    def report(self):
+        print("Model manager timings:")
+        for name, values in self.timings.items():
+            if values:
+                mean = sum(values) / len(values)
+                print(f"  {name:<8} count={len(values):<3} mean={mean:.2f}s total={sum(values):.2f}s")
+        if self.timings["load"] and self.timings["reload"]:
+            ratio = (sum(self.timings["reload"]) / len(self.timings["reload"])) / self.timings["load"][0]
+            print(f"  reload / cold load = {ratio:.1%}")
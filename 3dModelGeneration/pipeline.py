@@ -1,38 +1,39 @@
 # %%
 import math
-import pickle
 import os
-import threading
-import subprocess
+import atexit
 import time
 
-import asyncio
 import argparse
-from websockets.server import serve
-import websockets
-import nest_asyncio
-
-from selenium import webdriver
-from selenium.webdriver.chrome.service import Service as ChromeService
-from selenium.common.exceptions import WebDriverException
-from selenium.webdriver.support.ui import WebDriverWait
-from webdriver_manager.chrome import ChromeDriverManager
-from selenium.webdriver.support import expected_conditions as EC
-from selenium.webdriver.common.by import By
-from selenium.webdriver.chrome.options import Options
+from concurrent.futures import Future
 
 os.environ["KMP_DUPLICATE_LIB_OK"] = "TRUE"
 os.environ["PYTHONUTF8"] = "1"
 
 # %%
-from diffusers import StableDiffusionImg2ImgPipeline
-import torch
-import numpy as np
 import gc
 from PIL import Image
-import shutil
 
-process_killed_event = threading.Event()
+from diffusion_profiles import PROFILES
+from image_archive import ArchiveWriter, iteration_stages
+from rotation import RotationExecutor, link_or_copy
+from change_detector import ChangeDetector
+from train_logs import TrainingLog
+from convergence import ConvergenceController, MODES as CONVERGENCE_MODES
+from image_metrics import downsample, load_views
+from viewer_client import create_viewer_trigger
+from coordination_server import CoordinationServer, LEGACY_PICKLE_MODES
+from view_buffer import ViewBuffer, AsyncFileWriter
+from schedule import strength_schedule, warm_start_steps, find_checkpoint_dir
+from trainer_backend import create_trainer
+from scheduler import Stage, StageScheduler
+from run_manifest import RunManifest, DIFFUSED, TRAINED
+from telemetry import Telemetry
+from view_set import ViewSet, TrainElement
+from readiness import TrainerReadiness, VIEWER_LISTENING, RENDERS_COMPLETE
+
+readiness = TrainerReadiness()
+telemetry = Telemetry()
 max_attempts = 20
 current_time = time.gmtime()
 
@@ -51,93 +52,239 @@ parser.add_argument("-s", "--steps", type=int, default=3500,
 parser.add_argument("-d", "--not_tokenized", action="store_true",
                     help="If the prompt is not tokenized (default: False if arg not specified)")
 
+parser.add_argument("-b", "--batch_size", type=int, default=1,
+                    help="Number of views generated together in one diffusion call (default: 1)")
+
+parser.add_argument("--seed", type=int, default=None,
+                    help="Base seed for the per-view generators, view i uses seed + i (default: random)")
+
+parser.add_argument("--viewer_trigger", type=str, default="websocket", choices=["websocket", "selenium"],
+                    help="How the viewer is told to render the cameras: a headless websocket client "
+                         "or the legacy Chrome browser (default: websocket)")
+
+parser.add_argument("--in_memory_views", action="store_true",
+                    help="Feed the renders streamed over the socket straight to the diffusion model, "
+                         "writing the disk copies in the background (default: False)")
+
+parser.add_argument("-t", "--trainer", type=str, default="subprocess", choices=["subprocess", "in_process", "stub"],
+                    help="NeRF training backend: a new ns-train process per iteration, nerfstudio "
+                         "running inside this process and reusing its setup, or a CPU stub without "
+                         "nerfstudio (default: subprocess)")
+
+parser.add_argument("--diffusion", type=str, default="model", choices=["model", "stub"],
+                    help="img2img backend: the Stable Diffusion model, or a CPU stub adding noise that "
+                         "needs neither torch nor a GPU (default: model)")
+
+parser.add_argument("--stub_seconds", type=float, default=0.05,
+                    help="Duration of a stub diffusion batch and of a stub training (default: 0.05)")
+
+parser.add_argument("-w", "--warm_start", action="store_true",
+                    help="Resume each iteration's NeRF training from the previous iteration's checkpoint (default: False)")
+
+parser.add_argument("--warm_start_fraction", type=float, default=0.25,
+                    help="Fraction of --steps used by warm-started iterations, decayed like the strength (default: 0.25)")
+
+parser.add_argument("--warm_start_min_steps", type=int, default=300,
+                    help="Minimum number of steps of a warm-started iteration (default: 300)")
+
+parser.add_argument("-p", "--pipelined", action="store_true",
+                    help="Diffuse each view of the next iteration as soon as its render arrives (default: False)")
+
+parser.add_argument("--pipeline_gpu_workers", type=int, default=1,
+                    help="Views diffused at the same time in pipelined mode (default: 1)")
+
+parser.add_argument("--pipeline_io_workers", type=int, default=4,
+                    help="Threads encoding and saving the diffused views in pipelined mode (default: 4)")
+
+parser.add_argument("--pin_memory", action="store_true",
+                    help="Park the diffusion model in pinned host memory between iterations (default: False)")
+
+parser.add_argument("--start_image", type=str, default="./start.png",
+                    help="Image every view starts from (default: ./start.png)")
+
+parser.add_argument("--ws_port", type=int, default=8765,
+                    help="Port of the coordination server the trainer reports to (default: 8765)")
+
+parser.add_argument("--legacy_pickle", type=str, default="warn", choices=LEGACY_PICKLE_MODES,
+                    help="Legacy pickled messages of the trainer: accept them with a deprecation warning, "
+                         "accept them silently, or refuse them (default: warn)")
+
+parser.add_argument("--viewer_port", type=int, default=7007,
+                    help="Port of the nerfstudio viewer (default: 7007)")
+
+parser.add_argument("--speed_profile", type=str, default="quality", choices=sorted(PROFILES),
+                    help="Diffusion speed profile: scheduler, step budget and UNet options (default: quality)")
+
+parser.add_argument("--inference_steps", type=int, default=None,
+                    help="Overrides the number of inference steps of the speed profile (default: None)")
+
+parser.add_argument("--prompt_cache_dir", type=str, default=None,
+                    help="Folder where the prompt embeddings are saved and reused across runs (default: None, memory only)")
+
+parser.add_argument("--unload_text_encoder", action="store_true",
+                    help="Unload the text encoder once every prompt is encoded (default: False)")
+
+parser.add_argument("--latent_cache", action="store_true",
+                    help="Reuse the VAE latents of init images that did not change. Latents are the mode of the "
+                         "VAE distribution, not a seeded sample, so outputs differ from uncached runs with the "
+                         "same --seed (default: False)")
+
+parser.add_argument("--latent_cache_size", type=int, default=None,
+                    help="Latents kept by the cache before evicting the least recently used (default: twice the views)")
+
+parser.add_argument("--keep_latent_cache", action="store_true",
+                    help="Keep the latent cache of the run folder when the run ends (default: False)")
+
+parser.add_argument("--archive", action="store_true",
+                    help="Pack the images of every iteration folder into a memory-mapped array (default: False)")
+
+parser.add_argument("--archive_only", action="store_true",
+                    help="Like --archive, and remove the packed PNGs from the iteration folders (default: False)")
+
+parser.add_argument("--rotation_workers", type=int, default=8,
+                    help="Threads moving the files of a rotation in parallel (default: 8)")
+
+parser.add_argument("--convergence", type=str, default="off", choices=CONVERGENCE_MODES,
+                    help="Stop the loop, or reduce strength and steps, once the renders stop changing (default: off)")
+
+parser.add_argument("--convergence_psnr", type=float, default=32.0,
+                    help="Median PSNR between consecutive renders above which they count as unchanged (default: 32)")
+
+parser.add_argument("--convergence_ssim", type=float, default=0.97,
+                    help="Median SSIM between consecutive renders above which they count as unchanged (default: 0.97)")
+
+parser.add_argument("--convergence_patience", type=int, default=2,
+                    help="Converged iterations in a row before stopping (default: 2)")
+
+parser.add_argument("--selective", action="store_true",
+                    help="Only diffuse again the views whose NeRF render changed since the previous iteration (default: False)")
+
+parser.add_argument("--selective_rmse", type=float, default=0.01,
+                    help="Render RMSE (0-1, on 64x64 images) below which a view counts as unchanged (default: 0.01)")
+
+parser.add_argument("--selective_hash_bits", type=int, default=2,
+                    help="Average hash bits that may differ for a view to count as unchanged (default: 2)")
+
+parser.add_argument("--full_refresh_every", type=int, default=5,
+                    help="With --selective, diffuse every view again every K iterations (default: 5)")
+
+parser.add_argument("--views", type=str, default="./transforms_internal.json",
+                    help="View set: a transforms file or a YAML file pointing to one (default: ./transforms_internal.json)")
+
+parser.add_argument("-r", "--resume", type=str, default=None,
+                    help="Run folder (iter/<time>) of an interrupted run to continue from its last completed stage")
+
 args = parser.parse_args()
+if args.diffusion == "stub" and args.latent_cache:
+    parser.error("--latent_cache needs --diffusion model, the stub has no VAE")
+
+# The stub diffusion runs without torch and diffusers, they are only imported for the model
+stub_diffusion = args.diffusion == "stub"
+if stub_diffusion:
+    torch = None
+    from diffusion_stub import StubModelManager
+else:
+    from diffusers import StableDiffusionImg2ImgPipeline
+    import torch
+
+    from model_manager import ModelManager
+    from prompt_cache import PromptEmbeddingCache
+    from latent_cache import LatentCache
+
+# These settings define the run, a resumed run keeps the ones it was started with
+run_settings = ["iterations", "model", "steps", "not_tokenized", "seed", "views",
+                "speed_profile", "inference_steps", "convergence",
+                "warm_start", "warm_start_fraction", "warm_start_min_steps"]
+run_manifest = None
+if args.resume is not None:
+    run_manifest = RunManifest.load(args.resume)
+    for name in run_settings:
+        # Runs recorded before a setting existed keep its default
+        if name in run_manifest.settings:
+            setattr(args, name, run_manifest.settings[name])
+    print(f"Resuming {args.resume} after {run_manifest.last_completed()}")
 
 max_iterations = args.iterations
 model_type = args.model
 steps = args.steps
 not_tokenized = args.not_tokenized
+pin_memory = args.pin_memory
+batch_size = max(1, args.batch_size)
+seed = args.seed
+viewer_trigger = args.viewer_trigger
+in_memory_views = args.in_memory_views
+trainer_backend = args.trainer
+stub_seconds = args.stub_seconds
+pipelined = args.pipelined
+pipeline_gpu_workers = args.pipeline_gpu_workers
+pipeline_io_workers = args.pipeline_io_workers
+start_image_path = args.start_image
+ws_port = args.ws_port
+legacy_pickle = args.legacy_pickle
+viewer_port = args.viewer_port
+warm_start = args.warm_start
+warm_start_fraction = args.warm_start_fraction
+warm_start_min_steps = args.warm_start_min_steps
+views_path = args.views
+prompt_cache_dir = args.prompt_cache_dir
+unload_text_encoder = args.unload_text_encoder
+use_latent_cache = args.latent_cache
+keep_latent_cache = args.keep_latent_cache
+archive = args.archive or args.archive_only
+archive_only = args.archive_only
+rotation_workers = args.rotation_workers
+convergence = ConvergenceController(args.convergence, psnr_threshold=args.convergence_psnr,
+                                    ssim_threshold=args.convergence_ssim, patience=args.convergence_patience)
+speed_profile = PROFILES[args.speed_profile]
+if args.inference_steps is not None:
+    speed_profile = speed_profile.replace(steps=args.inference_steps)
 
 print("-------------------------------------")
 print(f"Max iterations: {max_iterations}")
 print(f"Model type: {model_type}")
 print(f"Number of steps: {steps}")
 print(f"Not Tokenized: {not_tokenized}")
+print(f"Pin memory: {pin_memory}")
+print(f"Batch size: {batch_size}")
+print(f"Seed: {seed}")
+print(f"Viewer trigger: {viewer_trigger}")
+print(f"In-memory views: {in_memory_views}")
+print(f"Trainer backend: {trainer_backend}")
+print(f"Diffusion: {args.diffusion}")
+print(f"Warm start: {warm_start}")
+print(f"Pipelined: {pipelined}")
+print(f"Speed profile: {speed_profile}")
+print(f"Convergence: {convergence.mode}")
 print("-------------------------------------")
 
 
-class TrainElement:
-    def __init__(self, prospective: str, filename: str, init_image_name: str):
-        self.prospective = prospective
-        self.filename = filename
-        self.init_image_name = init_image_name
-        self.nerf_output_image_name = f"output_{filename}"
-
-class SocketMessage:
-    def __init__(self, type: str, message: str):
-        self.type = type
-        self.message = message
-
-    def to_pickle(self):
-        return pickle.dumps(self)
-
+# Every view of the reconstruction: TrainElements, prompts and expected renders all come from here
+view_set = ViewSet.load(views_path)
+train_elements = view_set.train_elements(tokenized=not not_tokenized)
+print(f"Views: {len(view_set)} from {views_path}")
 
 if not_tokenized:
     model_path = "AdrianoC/RubberDuckProspectStableDiffusion_1_5"
-
-    # Define the list of TrainElements
-    train_elements = {
-        "Top": TrainElement("Top", "top_camera.png", "init_top.png"),
-        "Right Top": TrainElement("Right Top", "right_top.png", "init_right_top.png"),
-        "Back Right Top": TrainElement("Back Right Top", "back_right_top.png", "init_back_right_top.png"),
-        "Back Top": TrainElement("Back Top", "back_top.png", "init_back_top.png"),
-        "Back Left Top": TrainElement("Back Left Top", "back_left_top.png", "init_back_left_top.png"),
-        "Left Top": TrainElement("Left Top", "left_top.png", "init_left_top.png"),
-        "Front Left Top": TrainElement("Front Left Top", "front_left_top.png", "init_front_left_top.png"),
-        "Front Top": TrainElement("Front Top", "front_top.png", "init_front_top.png"),
-        "Front Right Top": TrainElement("Front Right Top", "front_right_top.png", "init_front_right_top.png"),
-        "Right": TrainElement("Right", "right.png", "init_right.png"),
-        "Back Right": TrainElement("Back Right", "back_right.png", "init_back_right.png"),
-        "Back": TrainElement("Back", "back.png", "init_back.png"),
-        "Back Left": TrainElement("Back Left", "back_left.png", "init_back_left.png"),
-        "Left": TrainElement("Left", "left.png", "init_left.png"),
-        "Front Left": TrainElement("Front Left", "front_left.png", "init_front_left.png"),
-        "Front": TrainElement("Front", "front.png", "init_front.png"),
-        "Front Right": TrainElement("Front Right", "front_right.png", "init_front_right.png")
-    }
 else:
-    model_path="AdrianoC/RubberDuckProspectStableDiffusion_1_5_tokens"
-    train_elements = {
-        "<top>": TrainElement("Top", "top_camera.png", "init_top.png"),
-        "<left_top>": TrainElement("Right Top", "right_top.png", "init_right_top.png"),
-        "<back_left_top>": TrainElement("Back Right Top", "back_right_top.png", "init_back_right_top.png"),
-        "<back_top>": TrainElement("Back Top", "back_top.png", "init_back_top.png"),
-        "<back_right_top>": TrainElement("Back Left Top", "back_left_top.png", "init_back_left_top.png"),
-        "<right_top>": TrainElement("Left Top", "left_top.png", "init_left_top.png"),
-        "<front_right_top>": TrainElement("Front Left Top", "front_left_top.png", "init_front_left_top.png"),
-        "<front_top>": TrainElement("Front Top", "front_top.png", "init_front_top.png"),
-        "<front_left_top>": TrainElement("Front Right Top", "front_right_top.png", "init_front_right_top.png"),
-        "<left>": TrainElement("Right", "right.png", "init_right.png"),
-        "<back_left>": TrainElement("Back Right", "back_right.png", "init_back_right.png"),
-        "<back>": TrainElement("Back", "back.png", "init_back.png"),
-        "<back_right>": TrainElement("Back Left", "back_left.png", "init_back_left.png"),
-        "<right>": TrainElement("Left", "left.png", "init_left.png"),
-        "<front_right>": TrainElement("Front Left", "front_left.png", "init_front_left.png"),
-        "<front>": TrainElement("Front", "front.png", "init_front.png"),
-        "<front_left>": TrainElement("Front Right", "front_right.png", "init_front_right.png")
-    }
+    model_path = "AdrianoC/RubberDuckProspectStableDiffusion_1_5_tokens"
+
+# ns-train reads ./transforms.json, keep it in sync with a view set defined elsewhere
+if os.path.abspath(views_path) != os.path.abspath("./transforms_internal.json"):
+    view_set.write_transforms("./transforms.json", "./diff_mod_image")
 
 
 # %%
-# Load the pipeline
-def load_model(model_path):
-    pipeline = StableDiffusionImg2ImgPipeline.from_pretrained(model_path, torch_dtype=torch.float16)
-    pipeline = pipeline.to("cuda")  # Use GPU if available
-    pipeline.safety_checker = None
-    return pipeline
+if stub_diffusion:
+    model_manager = StubModelManager()
+    prompt_cache = None
+else:
+    # The pipeline is loaded once and kept resident across iterations
+    model_manager = ModelManager(model_path, device="cuda", pin_memory=pin_memory, profile=speed_profile)
+    # The prompts are the same every iteration, they go through the text encoder once
+    prompt_cache = PromptEmbeddingCache(model_path, cache_dir=prompt_cache_dir)
 
 # %%
-start_image = Image.open("./start.png").convert("RGB")
+start_image = Image.open(start_image_path).convert("RGB")
 start_image = start_image.resize((512, 512))  # Resize the image if necessary
 # start_image.show()
 
@@ -146,8 +293,9 @@ string_time = time.strftime("%Y-%m-%d %H_%M_%S", current_time)
 init_folder = "./init"
 output_folder = "./output"
 reconstruction_folder = "./outputs"
-iter_folder = f"./iter/{string_time}"
+iter_folder = f"./iter/{string_time}" if run_manifest is None else run_manifest.run_dir
 diff_mod_image_folder = "./diff_mod_image"
+next_diff_folder = "./diff_next"
 
 if not os.path.exists(init_folder):
     os.makedirs(init_folder)
@@ -158,69 +306,129 @@ if not os.path.exists(iter_folder):
 if not os.path.exists(diff_mod_image_folder):
     os.makedirs(diff_mod_image_folder)
 
-for train_element in train_elements.values():
-    init_image = start_image.copy()
-    init_image.save(f"./{train_element.nerf_output_image_name}")
+if not os.path.exists(next_diff_folder):
+    os.makedirs(next_diff_folder)
+
+if run_manifest is None:
+    run_manifest = RunManifest.create(iter_folder, {name: getattr(args, name) for name in run_settings})
+
+    # A resumed run already has its renders in place, only a new one starts from start.png
+    for train_element in train_elements.values():
+        init_image = start_image.copy()
+        init_image.save(f"./{train_element.nerf_output_image_name}")
+else:
+    # Continue the converged streak of the interrupted run, it scales the strength and steps in adapt mode
+    convergence.restore(run_manifest.latest_value("convergence", {}))
+
+# Renders streamed by the trainer land here when running with --in_memory_views
+view_buffer = ViewBuffer([train_element.filename for train_element in train_elements.values()], 512, 512)
+file_writer = AsyncFileWriter()
+
+rotation_executor = RotationExecutor(workers=rotation_workers)
+
+# Decisions of --selective are logged to iter/<time>/regeneration.jsonl
+change_detector = None
+if args.selective:
+    change_detector = ChangeDetector(args.selective_rmse, args.selective_hash_bits, args.full_refresh_every,
+                                     log_path=f"{iter_folder}/regeneration.jsonl")
+
+# Iteration folders are packed in the background once rotated
+archive_writer = ArchiveWriter(remove_images=archive_only) if archive else None
+
+# Lives in the run folder, so a resumed run finds the latents of its renders
+latent_cache = None
+if use_latent_cache:
+    latent_cache = LatentCache(f"{iter_folder}/latents", capacity=args.latent_cache_size or 2 * len(view_set))
+
+def load_init_image(train_element: TrainElement):
+    if in_memory_views and view_buffer.has(train_element.filename):
+        return view_buffer.image(train_element.filename)
+    return Image.open(f"{init_folder}/{train_element.init_image_name}").convert("RGB")
 
 # Convert to dictionary
 # %%
- 
-pipeline: StableDiffusionImg2ImgPipeline = None
-def generate_duck_images(model_path, strength=1):
+view_positions = {train_element.filename: i for i, train_element in enumerate(train_elements.values())}
+
+def diffuse(views, init_images, strength):
+    """
+    Runs img2img on a batch of (perspective, train_element) views and returns the output images.
+    """
+    if stub_diffusion:
+        seeds = None if seed is None else [seed + view_positions[train_element.filename] for _, train_element in views]
+        return model_manager.acquire()(init_images, strength, seeds, stub_seconds)
+
+    pipeline: StableDiffusionImg2ImgPipeline = model_manager.acquire()
+    if unload_text_encoder and pipeline.text_encoder is not None:
+        prompt_cache.precompute(pipeline, view_set.prompts(tokenized=not not_tokenized))
+        prompt_cache.unload_text_encoder(pipeline)
+    prompts = [f"yellow rubber duck seen from {perspective}" for perspective, _ in views]
+    prompt_embeds, negative_prompt_embeds = prompt_cache.get(pipeline, prompts)
+
+    # One generator per view, seeded by its position, so the output does not depend on the batch size
+    generators = None
+    if seed is not None:
+        generators = [
+            torch.Generator(device="cuda").manual_seed(seed + view_positions[train_element.filename])
+            for _, train_element in views
+        ]
+
+    # Latents with 4 channels are taken by img2img as already encoded images
+    if latent_cache is not None:
+        init_images = latent_cache.latents(pipeline, init_images)
+
+    with torch.no_grad():
+        output = pipeline(
+            prompt_embeds=prompt_embeds,
+            negative_prompt_embeds=negative_prompt_embeds,
+            image=init_images,
+            strength=strength,  # Controls how much the output differs from the original image
+            guidance_scale=speed_profile.guidance_scale,  # Controls how closely the model follows the prompt
+            num_inference_steps=speed_profile.inference_steps(strength),
+            generator=generators,
+        )
+    return output.images
+
+def save_image(image: Image.Image, path: str):
+    # Save next to the target and rename, a crash never leaves a truncated view that resume takes as done
+    temp_path = f"{path}.part"
+    image.save(temp_path, format=Image.registered_extensions().get(os.path.splitext(path)[1].lower(), "PNG"))
+    os.replace(temp_path, path)
+
+@telemetry.timed()
+def generate_duck_images(strength=1, skip=()):
     global diff_mod_image_folder
     global train_elements
 
-    pipeline: StableDiffusionImg2ImgPipeline = load_model(model_path=model_path)
-
-    for perspective, train_element in train_elements.items():
-        init_image = Image.open(f"{init_folder}/{train_element.init_image_name}").convert("RGB")
-
-        # path = f"{diff_mod_image_folder}/{train_element.filename}"
-        prompt = f"yellow rubber duck seen from {perspective}"
-        with torch.no_grad():
-            output = pipeline(
-                prompt=prompt,
-                image=init_image,
-                strength=strength,  # Controls how much the output differs from the original image
-                guidance_scale=2.5,  # Controls how closely the model follows the prompt
-                num_inference_steps=50,
-            )
-        output_image = output.images[0]
-        #output_image.show()
-        output_image.save(
-            f"{diff_mod_image_folder}/{train_element.filename}"
-        )
-        """
-        # save the init image as a 
-        temp = init_image.copy()
-        temp.save(path)
-        """
-    
-    pipeline = None
+    views = [(perspective, train_element) for perspective, train_element in train_elements.items()
+             if train_element.filename not in skip]
+    for start in range(0, len(views), batch_size):
+        batch = views[start:start + batch_size]
+        init_images = [load_init_image(train_element) for _, train_element in batch]
+
+        for (_, train_element), output_image in zip(batch, diffuse(batch, init_images, strength)):
+            save_image(output_image, f"{diff_mod_image_folder}/{train_element.filename}")
+
+    if latent_cache is not None:
+        stats = latent_cache.stats()
+        telemetry.add("vae_encode", stats["encode_seconds"], cached=stats["hits"], encoded=stats["misses"],
+                      saved_seconds=stats["saved_seconds"])
+        print(f"Latent cache: {stats['hits']} cached, {stats['misses']} encoded in {stats['encode_seconds']:.2f}s, "
+              f"~{stats['saved_seconds']:.2f}s of encoding saved")
+        latent_cache.reset_stats()
+
+    # Park the weights on the host so ns-train gets the whole GPU
+    model_manager.offload()
     gc.collect()
-    torch.cuda.empty_cache()
-    torch.cuda.synchronize()
-    torch.cuda.ipc_collect()
-
-#%% 
-command = [
-    'ns-train',
-    model_type,
-    '--data', './', 
-    '--max-num-iterations', str(steps),
-    'nerfstudio-data',
-    '--orientation-method', 'none',
-    '--center_method', 'none'
-]
+    if torch is not None:
+        torch.cuda.synchronize()
+        torch.cuda.ipc_collect()
 
 #%% 
 def kill_process():
-    global process
-    # Get the process PID
-    process.terminate()
-    process_killed_event.set()  # Signal to the main thread that the process is terminated
+    trainer.stop()
 
 #%% 
+@telemetry.timed()
 def rename_new_file(iteration):
     print("rename...")
     global init_folder
@@ -228,155 +436,353 @@ def rename_new_file(iteration):
     global diff_mod_image_folder
     global reconstruction_folder
     
-    for perspective, train_element in train_elements.items():
-        # Create the folder for the iteration
-        temp_iter = f"{iter_folder}/{iteration}"
-        if not os.path.exists(temp_iter):
-            os.makedirs(temp_iter)
+    # Create the folder for the iteration
+    temp_iter = f"{iter_folder}/{iteration}"
+    if not os.path.exists(temp_iter):
+        os.makedirs(temp_iter)
 
+    # Plan every move first, the manifest journals them so an interrupted rotation can be replayed
+    moves = []
+    for perspective, train_element in train_elements.items():
         # Save the old init file in the iteration folder
         init_path = f"{init_folder}/{train_element.init_image_name}"
-        new_init_path = f"{iter_folder}/{iteration}/{train_element.init_image_name}"
-        if os.path.exists(init_path):
-            os.rename(init_path, new_init_path)
-        
+        moves.append((init_path, f"{temp_iter}/{train_element.init_image_name}"))
+
         # Save the old images generated by the diffusion model in the iteration folder
         model_image_path = f"{diff_mod_image_folder}/{train_element.filename}"
-        new_model_image_path = f"{iter_folder}/{iteration}/{train_element.filename}"
-        if os.path.exists(model_image_path):
-            os.rename(model_image_path, new_model_image_path)
+        moves.append((model_image_path, f"{temp_iter}/{train_element.filename}"))
 
         # Save the new output images from the nerf as new init files
-        output_path = f"./{train_element.nerf_output_image_name}"
-        new_output_path = init_path
-        if os.path.exists(output_path):
-            os.rename(output_path, new_output_path)
-    
-    # Save the images generated by the nerf in the iteration folder
-    if os.path.exists(reconstruction_folder):
-        os.rename(reconstruction_folder, f"{iter_folder}/{iteration}/outputs")
-    
-    # Copy the file transforms_internal.json into the iteration folder as transforms.json
-    if os.path.exists("./transforms_internal.json"):
-        shutil.copyfile("./transforms_internal.json", f"{iter_folder}/{iteration}/transforms.json")
-    else:
-        print("File transforms_internal.json not found")
+        moves.append((f"./{train_element.nerf_output_image_name}", init_path))
 
-        
-server_started = False
+    # Save the images generated by the nerf in the iteration folder
+    moves.append((reconstruction_folder, f"{temp_iter}/outputs"))
+    run_manifest.move_files(iteration, moves, rotation_executor)
 
-def read_stream(stream, stream_name):
-    """
-    Reads line by line from the stream (stdout/stderr) and prints it.
-    """
-    # Iterate over lines until an EOF signal ('') is received
-    for line in iter(stream.readline, ''):
-        if line:
-            print(f"[{stream_name}] {line.strip()}")
-    stream.close()
+    # Save the camera poses of the views into the iteration folder as transforms.json
+    view_set.write_transforms(f"{iter_folder}/{iteration}/transforms.json")
 
-# %%
-for iteration in range(max_iterations):
 
-    rename_new_file(iteration)
-    
-    strength = np.exp(-0.7 * iteration/(max_iterations-1))
-    generate_duck_images(model_path, strength=strength)
+def archive_iteration(iteration):
+    # Once the loop no longer reads the iteration folder, --archive_only removes its PNGs
+    if archive_writer is not None:
+        archive_writer.submit(f"{iter_folder}/{iteration}", iteration_stages(train_elements.values()))
 
-    nest_asyncio.apply()
-    execution_count = 0
-    lock = asyncio.Lock()  # Async Lock
 
-    async def handle_messages(websocket):
+@telemetry.timed()
+def reuse_unchanged_views(iteration, done_views):
+    """
+    Puts back the previous diffusion output of the views whose init image barely changed.
+    """
+    previous_folder = f"{iter_folder}/{iteration}"
+    elements = [te for te in train_elements.values() if te.filename not in done_views
+                and os.path.exists(f"{previous_folder}/{te.init_image_name}")
+                and os.path.exists(f"{previous_folder}/{te.filename}")]
+    if not elements:
+        return
+    current = load_views([f"{init_folder}/{te.init_image_name}" for te in elements])
+    previous = load_views([f"{previous_folder}/{te.init_image_name}" for te in elements])
+    decisions = change_detector.decide(iteration, [te.filename for te in elements], current, previous)
+    for te in elements:
+        if not decisions[te.filename]:
+            link_or_copy(f"{previous_folder}/{te.filename}", f"{diff_mod_image_folder}/{te.filename}")
+            done_views.add(te.filename)
+    print(f"Reusing the previous diffusion of {sum(not d for d in decisions.values())}/{len(decisions)} views")
+
+
+
+def on_renders_complete(session):
+    readiness.mark(RENDERS_COMPLETE)
+    print("Killing process...")
+    kill_process()
+    print("Process killed")
+
+
+def on_view_received(filename, data):
+    # Runs on the coordination server loop: only hand the bytes over, decoding happens on worker threads
+    train_element = next(te for te in train_elements.values() if te.filename == filename)
+    if in_memory_views and data is not None:
+        # Decoded once into memory for the next diffusion pass, the disk copy is only for the archive
+        view_buffer.put_async(filename, data)
+        file_writer.submit(f"./{train_element.nerf_output_image_name}", data)
+
+    if pipelined and iteration + 1 < max_iterations:
+        # Start diffusing the next iteration's view while the trainer renders the others
+        perspective = next(p for p, te in train_elements.items() if te is train_element)
+        diffusion_scheduler.submit((perspective, train_element, data is not None, next_strength))
+
+
+def on_training_step(message):
+    try:
+        step = int(message.message)
+    except (TypeError, ValueError):
+        return
+    readiness.set_step(step)
+    training_log.record(step=step, loss=message.get("loss"), rays_per_sec=message.get("rays_per_sec"),
+                        iter_time=message.get("step_time"))
 
-        message: SocketMessage = pickle.loads(await websocket.recv())
-        if(message.type == 'camera'):
-            global execution_count
-            async with lock:  # Ensure only one coroutine modifies the counter at a time
-                execution_count += 1
 
-            # Receive the filename
-            filename = message.message
-            print(f"Received file: {filename} {execution_count}")
+def load_render(train_element: TrainElement, streamed: bool):
+    if in_memory_views and streamed and view_buffer.has(train_element.filename):
+        return view_buffer.image(train_element.filename)
+    return Image.open(f"./{train_element.nerf_output_image_name}").convert("RGB")
 
-            if(execution_count == 17):
-                print("Killing process...")
-                kill_process()
-                print("Process killed")
-                execution_count = 0 
 
-        if(message.type == 'step'):
-            print("Step: ", message.message)
+def decide_strength(target_iteration):
+    """
+    The strength of an iteration, decided once. With --convergence adapt it depends on the check of the
+    iteration before, so it is only decided after that check, for the pre-diffused views and the others alike.
+    It is recorded in the manifest, a resumed run diffuses with the strength the interrupted one chose.
+    """
+    if target_iteration not in strengths:
+        strength = run_manifest.value(target_iteration, "strength")
+        if strength is None:
+            strength = convergence.adjust_strength(strength_schedule(target_iteration, max_iterations))
+            run_manifest.record(target_iteration, strength=strength)
+        strengths[target_iteration] = strength
+    return strengths[target_iteration]
+
+
+def diffuse_stage(item):
+    perspective, train_element, streamed, strength_decided = item
+    image = load_render(train_element, streamed)
+    # Blocks until the strength of the next iteration is known (after the convergence check in adapt mode)
+    output_image = diffuse([(perspective, train_element)], [image], strength_decided.result())[0]
+    return train_element, output_image
+
+
+def save_stage(item):
+    train_element, output_image = item
+    save_image(output_image, f"{next_diff_folder}/{train_element.filename}")
+    return train_element.filename
+
+
+strengths = {}
+# Resolved with the next iteration's strength, the pipelined diffusion waits for it
+next_strength = None
+
+# Diffusion of the next iteration runs on one GPU worker, PNG encoding on a pool of I/O workers
+diffusion_scheduler = None
+if pipelined:
+    diffusion_scheduler = StageScheduler([
+        Stage("diffuse", diffuse_stage, workers=pipeline_gpu_workers, queue_size=len(train_elements)),
+        Stage("save", save_stage, workers=pipeline_io_workers, queue_size=len(train_elements)),
+    ]).start()
+
+coordination_server = CoordinationServer(host="localhost", port=ws_port, legacy_pickle=legacy_pickle)
+coordination_server.start()
+
+# ns-train output goes to iter/<time>/ns-train.log (rotated, gzipped) and its metrics to training_metrics.csv
+training_log = TrainingLog(iter_folder)
+trainer_options = {"seconds": stub_seconds} if trainer_backend == "stub" else {}
+trainer = create_trainer(trainer_backend, model_type, data="./", readiness=readiness,
+                         viewer_port=viewer_port, ws_port=ws_port, training_log=training_log, **trainer_options)
+
+def write_telemetry():
+    # Also runs when the loop is left early, so partial runs get a report too
+    telemetry.write_report(iter_folder)
+    print("-------------------------------------")
+    telemetry.summary()
+    print("-------------------------------------")
 
-    async def server_creation():
-        async with serve(handle_messages, "localhost", 8765):
-            await asyncio.get_running_loop().create_future()  # run forever
+atexit.register(write_telemetry)
 
-    def start_server():
-        asyncio.run(server_creation())
-    
-    if not server_started:
-        server_thread = threading.Thread(target=start_server)
-        server_thread.start()
-        
-        server_started = True
+# %%
+for iteration in range(max_iterations):
+    telemetry.iteration = iteration
+    if convergence.stopped_at is not None:
+        print(f"The interrupted run had converged after iteration {convergence.stopped_at}, nothing left to do")
+        break
+    if run_manifest.is_done(iteration, TRAINED):
+        print(f"Iteration {iteration} already completed, skipping")
+        continue
+
+    with telemetry.stage("file_writer_flush"):
+        file_writer.flush()
+
+    # Views already diffused while the previous trainer was rendering
+    prediffused = []
+    if pipelined:
+        with telemetry.stage("pipeline_drain"):
+            try:
+                prediffused = diffusion_scheduler.wait()
+            except RuntimeError as e:
+                # Fall back to diffusing every view in this iteration
+                print(f"Pipelined diffusion failed: {e}")
+
+    strength = decide_strength(iteration)
+    if not run_manifest.is_done(iteration, DIFFUSED):
+        rename_new_file(iteration)
+        for filename in prediffused:
+            os.replace(f"{next_diff_folder}/{filename}", f"{diff_mod_image_folder}/{filename}")
+
+        # After the rotation diff_mod_image only holds this iteration's views (pre-diffused, or left by
+        # an interrupted run), the diffusion model only has to produce the missing ones
+        done_views = {train_element.filename for train_element in train_elements.values()
+                      if os.path.exists(f"{diff_mod_image_folder}/{train_element.filename}")}
+        if change_detector is not None and iteration > 0:
+            reuse_unchanged_views(iteration, done_views)
+        archive_iteration(iteration)
+        if len(done_views) < len(train_elements):
+            if model_manager.pipeline is None:
+                with telemetry.stage("load_model"):
+                    model_manager.load()
+            generate_duck_images(strength=strength, skip=done_views)
+        run_manifest.complete(iteration, DIFFUSED)
+    # Pipelined diffusion may have left the weights on the GPU
+    model_manager.offload()
+
+    # The previous iteration's outputs have just been moved into iter/<time>/<iteration>/outputs
+    load_dir = None
+    iteration_steps = steps
+    if warm_start and iteration > 0:
+        load_dir = find_checkpoint_dir(f"{iter_folder}/{iteration}/outputs")
+        if load_dir is not None:
+            iteration_steps = warm_start_steps(iteration, max_iterations, steps,
+                                               warm_start_fraction, warm_start_min_steps)
+            print(f"Warm start from {load_dir} with {iteration_steps} steps")
+        else:
+            print("No checkpoint from the previous iteration, training from scratch")
+    recorded_steps = run_manifest.value(iteration, "steps")
+    if recorded_steps is not None:
+        # The interrupted run already started this iteration, train it with the same step budget
+        iteration_steps = recorded_steps
+    else:
+        if convergence.mode == "adapt":
+            iteration_steps = convergence.adjust_steps(iteration_steps, warm_start_min_steps)
+        run_manifest.record(iteration, steps=iteration_steps)
+
+    next_strength = Future()
+    if convergence.mode != "adapt":
+        next_strength.set_result(decide_strength(iteration + 1))
+
+    # Expect one render per view from this iteration's trainer
+    view_buffer.reset()
+    session = coordination_server.open_session(
+        iteration,
+        view_set.expected_renders(),
+        on_complete=on_renders_complete,
+        on_step=on_training_step,
+        on_view=on_view_received if in_memory_views or pipelined else None,
+    )
 
     # ns-train instant-ngp --data .\ nerfstudio-data --orientation-method none --auto-scale-poses False
 
     print("Executing nerf-studio...")
-    try:
-        process = subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True, encoding="utf-8")
-        
-        #stdout_thread = threading.Thread(target=read_stream, args=(process.stdout, "STDOUT"))
-        stderr_thread = threading.Thread(target=read_stream, args=(process.stderr, "STDERR"))
-
-        #stdout_thread.start()
-        stderr_thread.start()
-
-    except Exception as e:
-        print(f"Error executing command: {e}")
-        print(f"Error output: {e.stderr}")
-
-
-    attempt = 0
-    op = Options()
-    driver = webdriver.Chrome(service=ChromeService(ChromeDriverManager().install()), options=op)
-
-    while attempt < max_attempts:
-        print("Connecting to the browser...")
+    readiness.reset()
+    training_log.start_iteration(iteration)
+    with telemetry.stage("trainer_startup"):
         try:
-            # Use webdriver_manager to install and configure ChromeDriver
-
-            # Open the site localhost:7007
-            driver.get("http://localhost:7007")
+            trainer.start(iteration_steps, load_dir, session=session.session_id)
+        except Exception as e:
+            print(f"Error executing command: {e}")
             break
 
-        except WebDriverException as e:
-            time.sleep(10)
-            print("Unable to connect to the site, retrying...")
-            attempt += 1
-    
-    else:
-        print("Error connecting to the browser, exiting the program...")
-        driver.quit()
+        # Move on as soon as the viewer accepts connections instead of polling it blindly
+        readiness.watch_port(viewer_port)
+        viewer_listening = readiness.wait_for(VIEWER_LISTENING, timeout=max_attempts * 10)
+    if not viewer_listening:
+        print("The viewer never started listening, exiting the program...")
+        trainer.stop()
+        trainer.wait()
+        break
+
+    trigger = create_viewer_trigger(viewer_trigger, port=viewer_port)
+    with telemetry.stage("viewer_handshake"):
+        connected = trigger.connect(timeout=max_attempts * 10)
+    if not connected:
+        print("Error connecting to the viewer, exiting the program...")
+        trigger.close()
+        trainer.stop()
+        trainer.wait()
         break
 
-    time.sleep(10)
-    driver.quit()
     print("Connection successful!")
-    print("Waiting for the process to terminate...")
-    process_killed_event.wait()  # Wait for the process to be terminated by the server
-    process_killed_event.clear()
+    print("Waiting for the renders...")
+    with telemetry.stage("training_and_renders"):
+        renders_complete = readiness.wait_for(RENDERS_COMPLETE)
+        trigger.close()
+        trainer.wait()
+    coordination_server.close_session(iteration)
+    metrics = training_log.summary()
+    telemetry.add("training_metrics", metrics.get("seconds", 0.0), **{key: value for key, value in metrics.items()
+                                                                      if key != "seconds"})
+    if not renders_complete:
+        print("ns-train exited before rendering all the cameras, exiting the program...")
+        training_log.dump_tail()
+        break
     print("Process terminated, freeing memory...")
+    for state, duration in readiness.durations().items():
+        print(f"  {state:<18} {duration:.2f}s")
+        telemetry.add(f"ns-train: {state}", duration)
+
+    if convergence.mode != "off":
+        with telemetry.stage("convergence_check"):
+            file_writer.flush()
+            elements = list(train_elements.values())
+            view_buffer.flush()
+            if in_memory_views and view_buffer.filled.all():
+                renders = downsample(view_buffer.images)
+            else:
+                renders = load_views([f"./{te.nerf_output_image_name}" for te in elements])
+            diffused = load_views([f"{diff_mod_image_folder}/{te.filename}" for te in elements])
+            # The renders of the previous iteration are the current init images
+            previous = None
+            if convergence.previous is None and iteration > 0:
+                previous = load_views([f"{init_folder}/{te.init_image_name}" for te in elements])
+            result = convergence.check(iteration, renders, diffused, previous,
+                                       steps_per_sec=metrics.get("steps_per_sec"))
+        telemetry.add("convergence_metrics", result["check_seconds"],
+                      **{key: value for key, value in result.items() if key not in ("iteration", "seconds")})
+        if "render_psnr" in result:
+            print(f"Render change: PSNR {result['render_psnr']:.2f}, SSIM {result['render_ssim']:.4f}"
+                  f"{' (converged)' if result['converged'] else ''}")
+    if convergence.should_stop():
+        convergence.stop(iteration)
+    # Recorded with the controller state after the check, so a resumed run continues its streak
+    run_manifest.complete(iteration, TRAINED, load_dir=load_dir, convergence=convergence.state())
+    if convergence.stopped_at is not None:
+        print(f"The renders stopped changing, ending the loop after iteration {iteration}")
+        break
+
+    if not next_strength.done():
+        next_strength.set_result(decide_strength(iteration + 1))
 
     print("Releasing memory...")
     gc.collect()
-    torch.cuda.empty_cache()
-    torch.cuda.synchronize()
-    torch.cuda.ipc_collect()  # Helps release shared GPU memory between processes
+    if torch is not None:
+        torch.cuda.empty_cache()
+        torch.cuda.synchronize()
+        torch.cuda.ipc_collect()  # Helps release shared GPU memory between processes
     print("-------------------------------------")
     print(f"Iteration {iteration} completed, moving to the next one...")
     print("-------------------------------------")
 
+if next_strength is not None and not next_strength.done():
+    # Left early: release the pre-diffusion waiting for a strength
+    next_strength.cancel()
+file_writer.close()
+view_buffer.close()
 rename_new_file(max_iterations + 1)
+archive_iteration(max_iterations + 1)
+rotation_executor.close()
+if archive_writer is not None:
+    archive_writer.close()
+model_manager.report()
+if prompt_cache is not None:
+    prompt_cache.report()
+if latent_cache is not None and not keep_latent_cache:
+    latent_cache.clear()
+trainer.report()
+training_log.report()
+training_log.close()
+convergence.report(max_iterations)
+if change_detector is not None:
+    change_detector.report(len(train_elements))
+trainer.close()
+if diffusion_scheduler is not None:
+    diffusion_scheduler.close()
+    print("Pipelined diffusion:")
+    diffusion_scheduler.report()
+coordination_server.stop()
 print("Iterations complete, exiting the program...")
\ No newline at end of file
@@ -0,0 +1,116 @@
+import os
+import re
+import threading
+import time
+
+import torch
+
+
+def model_revision(pipeline, model_path: str) -> str:
+    """
+    The snapshot hash of a hub model (its text encoder folder lives in .../snapshots/<hash>/text_encoder),
+    or the modification time of a local model folder.
+    """
+    source = getattr(pipeline.text_encoder.config, "_name_or_path", "") if pipeline.text_encoder is not None else ""
+    parts = os.path.normpath(source).split(os.sep)
+    if "snapshots" in parts and parts.index("snapshots") + 1 < len(parts):
+        return parts[parts.index("snapshots") + 1][:12]
+    if os.path.isdir(model_path):
+        return str(int(os.path.getmtime(model_path)))
+    return "unknown"
+
+
+class PromptEmbeddingCache:
+    """
+    CLIP embeddings of the prompts and of the negative prompt, encoded once per model and passed
+    to the pipeline as prompt_embeds. The prompts of the views never change during a run, so once they
+    are all encoded the text encoder can be unloaded. With a cache_dir the embeddings are also saved
+    to <cache_dir>/<model>-<revision>.pt and reused by later runs.
+    """
+
+    def __init__(self, model_path: str, cache_dir: str = None, negative_prompt: str = ""):
+        self.model_path = model_path
+        self.cache_dir = cache_dir
+        self.negative_prompt = negative_prompt
+        self.embeddings = {}
+        self.hits = 0
+        self.misses = 0
+        self.encode_time = 0.0
+        self._loaded = False
+        # Diffusion workers share the cache: one encodes the missing prompts, the others wait for it
+        self._lock = threading.Lock()
+
+    def _path(self, pipeline):
+        name = re.sub(r"[^A-Za-z0-9_.-]+", "_", self.model_path.strip("/\\"))
+        return os.path.join(self.cache_dir, f"{name}-{model_revision(pipeline, self.model_path)}.pt")
+
+    def _load(self, pipeline):
+        self._loaded = True
+        if self.cache_dir is None:
+            return
+        path = self._path(pipeline)
+        if os.path.exists(path):
+            saved = torch.load(path, map_location="cpu")
+            if saved.get("negative_prompt") == self.negative_prompt:
+                self.embeddings.update(saved["embeddings"])
+                print(f"Loaded {len(saved['embeddings'])} prompt embeddings from {path}")
+
+    def _save(self, pipeline):
+        if self.cache_dir is None:
+            return
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = self._path(pipeline)
+        temp_path = f"{path}.tmp"
+        torch.save({"negative_prompt": self.negative_prompt, "embeddings": self.embeddings}, temp_path)
+        os.replace(temp_path, path)
+
+    def precompute(self, pipeline, prompts):
+        """
+        Encodes, in one batch, every prompt not cached yet.
+        """
+        with self._lock:
+            if not self._loaded:
+                self._load(pipeline)
+            missing = list(dict.fromkeys(prompt for prompt in prompts if prompt not in self.embeddings))
+            if not missing:
+                return
+            if pipeline.text_encoder is None:
+                raise RuntimeError(f"The text encoder was unloaded, cannot encode: {missing}")
+
+            start = time.perf_counter()
+            with torch.no_grad():
+                prompt_embeds, negative_embeds = pipeline.encode_prompt(
+                    missing, pipeline.device, num_images_per_prompt=1, do_classifier_free_guidance=True,
+                    negative_prompt=[self.negative_prompt] * len(missing),
+                )
+            for prompt, embeds, negative in zip(missing, prompt_embeds.cpu(), negative_embeds.cpu()):
+                self.embeddings[prompt] = (embeds, negative)
+            self.encode_time += time.perf_counter() - start
+            self.misses += len(missing)
+            self._save(pipeline)
+
+    def get(self, pipeline, prompts):
+        """
+        Returns (prompt_embeds, negative_prompt_embeds) for the prompts, on the device of the pipeline.
+        """
+        self.precompute(pipeline, prompts)
+        with self._lock:
+            self.hits += len(prompts)
+        dtype = pipeline.unet.dtype
+        prompt_embeds = torch.stack([self.embeddings[prompt][0] for prompt in prompts])
+        negative_embeds = torch.stack([self.embeddings[prompt][1] for prompt in prompts])
+        return (prompt_embeds.to(pipeline.device, dtype, non_blocking=True),
+                negative_embeds.to(pipeline.device, dtype, non_blocking=True))
+
+    def unload_text_encoder(self, pipeline):
+        with self._lock:
+            if pipeline.text_encoder is None:
+                return
+            pipeline.text_encoder = None
+        if torch.cuda.is_available():
+            torch.cuda.empty_cache()
+        print("Text encoder unloaded, prompts are served from the embedding cache")
+
+    def report(self):
+        print(f"Prompt embedding cache: {len(self.embeddings)} prompts, {self.misses} encoded "
+              f"in {self.encode_time:.2f}s, {self.hits} served")
@@ -0,0 +1,107 @@
+import asyncio
+import socket
+import threading
+import time
+
+PROCESS_STARTED = "process started"
+VIEWER_LISTENING = "viewer listening"
+TRAINING_STEP = "training step"
+RENDERS_COMPLETE = "renders complete"
+PROCESS_EXITED = "process exited"
+
+
+class TrainerReadiness:
+    """
+    Tracks the life cycle of one ns-train run from the events that are already available:
+    the stderr stream, the viewer port and the websocket messages.
+    Every state can be waited on, from a thread with wait_for or from a coroutine with until,
+    and the time at which it was reached is logged.
+    """
+
+    def __init__(self, name: str = "ns-train"):
+        self.name = name
+        self._condition = threading.Condition()
+        self.reset()
+
+    def reset(self):
+        with self._condition:
+            self.started_at = time.monotonic()
+            self.reached = {}
+            self.step = -1
+            self._last_state = None
+            self._last_time = self.started_at
+
+    def mark(self, state: str):
+        with self._condition:
+            if state in self.reached:
+                return
+            now = time.monotonic()
+            self.reached[state] = now
+            if self._last_state is not None:
+                print(f"[{self.name}] {state} after {now - self.started_at:.2f}s "
+                      f"({now - self._last_time:.2f}s in '{self._last_state}')")
+            else:
+                print(f"[{self.name}] {state} after {now - self.started_at:.2f}s")
+            self._last_state = state
+            self._last_time = now
+            self._condition.notify_all()
+
+    def set_step(self, step: int):
+        with self._condition:
+            if step <= self.step:
+                return
+            self.step = step
+        self.mark(TRAINING_STEP)
+        with self._condition:
+            self._condition.notify_all()
+
+    def _wait(self, predicate, timeout):
+        # Stop waiting as soon as ns-train is gone, the condition can no longer hold
+        with self._condition:
+            self._condition.wait_for(lambda: predicate() or PROCESS_EXITED in self.reached, timeout)
+            return predicate()
+
+    def wait_for(self, state: str, timeout: float = None) -> bool:
+        return self._wait(lambda: state in self.reached, timeout)
+
+    def wait_for_step(self, step: int, timeout: float = None) -> bool:
+        return self._wait(lambda: self.step >= step, timeout)
+
+    async def until(self, state: str, timeout: float = None) -> bool:
+        return await asyncio.to_thread(self.wait_for, state, timeout)
+
+    def on_stderr_line(self, line: str):
+        self.mark(PROCESS_STARTED)
+        if "Viewer" in line and "http" in line:
+            self.mark(VIEWER_LISTENING)
+
+    def on_stream_closed(self):
+        self.mark(PROCESS_EXITED)
+
+    def watch_port(self, port: int, host: str = "localhost", poll_interval: float = 0.1):
+        """
+        Probes the viewer port on a background thread and marks the viewer as listening once it accepts connections.
+        """
+        def probe():
+            while VIEWER_LISTENING not in self.reached and PROCESS_EXITED not in self.reached:
+                try:
+                    with socket.create_connection((host, port), timeout=poll_interval):
+                        self.mark(VIEWER_LISTENING)
+                except OSError:
+                    time.sleep(poll_interval)
+
+        thread = threading.Thread(target=probe, daemon=True)
+        thread.start()
+        return thread
+
+    def durations(self):
+        """
+        Returns the time spent in each state, in the order the states were reached.
+        """
+        ordered = sorted(self.reached.items(), key=lambda item: item[1])
+        result = {}
+        previous_state, previous_time = "launching", self.started_at
+        for state, reached_at in ordered:
+            result[previous_state] = reached_at - previous_time
+            previous_state, previous_time = state, reached_at
+        return result
@@ -0,0 +1,121 @@
+import os
+import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+def plan_phases(moves):
+    """
+    Splits (source, destination) moves into phases of independent moves: a move whose destination is
+    the source of another move (init/x.png is archived before the new render takes its place) goes
+    in a later phase. Returns lists of indices into moves, in the original order within a phase.
+    """
+    sources = {source: i for i, (source, _) in enumerate(moves)}
+    phase = [0] * len(moves)
+    changed = True
+    while changed:
+        changed = False
+        for i, (_, destination) in enumerate(moves):
+            before = sources.get(destination)
+            if before is not None and before != i and phase[i] <= phase[before]:
+                phase[i] = phase[before] + 1
+                if phase[i] > len(moves):
+                    raise ValueError(f"Circular moves around {destination}")
+                changed = True
+    phases = [[] for _ in range(max(phase, default=-1) + 1)]
+    for i, p in enumerate(phase):
+        phases[p].append(i)
+    return phases
+
+
+def same_device(source: str, destination: str) -> bool:
+    parent = os.path.dirname(os.path.abspath(destination))
+    return os.stat(source).st_dev == os.stat(parent).st_dev
+
+
+def link_or_copy(source: str, destination: str):
+    """
+    Hard links when both paths are on the same file system, otherwise copies. shutil copies with
+    copy_file_range/sendfile where available, which clones the data on copy-on-write file systems.
+    """
+    try:
+        os.link(source, destination)
+    except OSError:
+        shutil.copy2(source, destination)
+
+
+class RotationExecutor:
+    """
+    Executes planned moves phase by phase, the moves of a phase in parallel on a thread pool.
+    Renames within a file system are atomic. Across file systems, files are copied next to their
+    destination and renamed into place before the source is removed, and directory trees are copied
+    file by file on the pool. Moves of a phase are independent, so an interrupted phase is replayed
+    by moving the sources still in place.
+    """
+
+    def __init__(self, workers: int = 8):
+        self.workers = max(1, workers)
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="rotation")
+        self._lock = threading.Lock()
+        self.stats = {"renamed": 0, "copied": 0, "skipped": 0, "seconds": 0.0}
+
+    def _count(self, key):
+        with self._lock:
+            self.stats[key] += 1
+
+    def _copy_file(self, source, destination):
+        # Only used across file systems, where a hard link cannot be made
+        temp_path = f"{destination}.part"
+        shutil.copy2(source, temp_path)
+        os.replace(temp_path, destination)
+
+    def _copy_tree(self, source, destination):
+        files = []
+        for root, _, names in os.walk(source):
+            target = os.path.join(destination, os.path.relpath(root, source))
+            os.makedirs(target, exist_ok=True)
+            files += [(os.path.join(root, name), os.path.join(target, name)) for name in names]
+        list(self._executor.map(lambda pair: self._copy_file(*pair), files))
+
+    def move(self, source: str, destination: str):
+        if not os.path.exists(source):
+            self._count("skipped")
+            return
+        if same_device(source, destination):
+            os.replace(source, destination)
+            self._count("renamed")
+            return
+        if os.path.isdir(source):
+            self._copy_tree(source, destination)
+            shutil.rmtree(source)
+        else:
+            self._copy_file(source, destination)
+            os.remove(source)
+        self._count("copied")
+
+    def run_phase(self, moves):
+        start = time.perf_counter()
+        # Trees are copied on the pool themselves, move them from this thread to avoid starving it
+        files = [(s, d) for s, d in moves if not os.path.isdir(s)]
+        trees = [(s, d) for s, d in moves if os.path.isdir(s)]
+        futures = [self._executor.submit(self.move, source, destination) for source, destination in files]
+        for source, destination in trees:
+            self.move(source, destination)
+        for future in futures:
+            future.result()
+        with self._lock:
+            self.stats["seconds"] += time.perf_counter() - start
+
+    def execute(self, moves, phases=None, on_phase_done=None, first_phase: int = 0):
+        """
+        Runs the phases from first_phase on, calling on_phase_done(index) after each one.
+        """
+        phases = plan_phases(moves) if phases is None else phases
+        for index in range(first_phase, len(phases)):
+            self.run_phase([moves[i] for i in phases[index]])
+            if on_phase_done is not None:
+                on_phase_done(index)
+
+    def close(self):
+        self._executor.shutdown()
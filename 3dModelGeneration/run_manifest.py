@@ -0,0 +1,130 @@
+import json
+import os
+import time
+
+from rotation import RotationExecutor, plan_phases
+
+# Stages of one iteration, in the order they complete
+ROTATED = "rotated"
+DIFFUSED = "diffused"
+TRAINED = "trained"
+
+MANIFEST_NAME = "manifest.json"
+
+
+def atomic_write_json(path: str, data):
+    # Write next to the target and swap it in, a crash leaves either the old or the new file
+    temp_path = f"{path}.tmp"
+    with open(temp_path, "w") as f:
+        json.dump(data, f, indent=4)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_path, path)
+
+
+class RunManifest:
+    """
+    Records, in iter/<time>/manifest.json, the run settings and the stages completed by every iteration,
+    with the strength and step budget they used, so an interrupted run can be resumed.
+    File rotations are journaled: the planned moves and their phases are saved first, then the
+    count of phases done after each one, so a rotation interrupted halfway is replayed from the phase
+    where it stopped.
+    """
+
+    def __init__(self, run_dir: str, data: dict):
+        self.run_dir = run_dir
+        self.path = os.path.join(run_dir, MANIFEST_NAME)
+        self.data = data
+
+    @classmethod
+    def create(cls, run_dir: str, settings: dict):
+        os.makedirs(run_dir, exist_ok=True)
+        manifest = cls(run_dir, {"settings": settings, "created": time.time(), "iterations": {}})
+        manifest.save()
+        return manifest
+
+    @classmethod
+    def load(cls, run_dir: str):
+        with open(os.path.join(run_dir, MANIFEST_NAME)) as f:
+            return cls(run_dir, json.load(f))
+
+    @property
+    def settings(self):
+        return self.data["settings"]
+
+    def save(self):
+        atomic_write_json(self.path, self.data)
+
+    def iteration(self, iteration: int) -> dict:
+        return self.data["iterations"].setdefault(str(iteration), {"stages": {}})
+
+    def is_done(self, iteration: int, stage: str) -> bool:
+        return stage in self.data["iterations"].get(str(iteration), {}).get("stages", {})
+
+    def record(self, iteration: int, **info):
+        """
+        Saves values an iteration decided before running a stage (strength, steps), so a resumed run
+        reuses them instead of deciding again.
+        """
+        self.iteration(iteration).update(info)
+        self.save()
+
+    def value(self, iteration: int, key: str, default=None):
+        return self.data["iterations"].get(str(iteration), {}).get(key, default)
+
+    def latest_value(self, key: str, default=None):
+        """
+        The value of the last iteration that recorded `key`.
+        """
+        recorded = [int(iteration) for iteration, entry in self.data["iterations"].items() if key in entry]
+        return self.value(max(recorded), key) if recorded else default
+
+    def complete(self, iteration: int, stage: str, **info):
+        entry = self.iteration(iteration)
+        entry["stages"][stage] = time.time()
+        entry.update(info)
+        self.save()
+
+    def last_completed(self):
+        """
+        Returns (iteration, stage) of the most recently completed stage, or None for a new run.
+        """
+        last = None
+        for iteration, entry in self.data["iterations"].items():
+            for stage, completed_at in entry["stages"].items():
+                if last is None or completed_at > last[2]:
+                    last = (int(iteration), stage, completed_at)
+        return last[:2] if last else None
+
+    def move_files(self, iteration: int, moves, executor: RotationExecutor = None):
+        """
+        Moves every (source, destination) pair, skipping missing sources. Moves are grouped into
+        phases of independent moves, which the executor runs in parallel.
+        """
+        entry = self.iteration(iteration)
+        if ROTATED in entry["stages"]:
+            return
+        rotation = entry.get("rotation")
+        if rotation is None:
+            # Journal the plan before touching any file
+            moves = [list(move) for move in moves]
+            rotation = entry["rotation"] = {"moves": moves, "phases": plan_phases(moves), "phases_done": 0}
+            self.save()
+        elif rotation["phases_done"]:
+            print(f"Resuming the rotation of iteration {iteration} at phase "
+                  f"{rotation['phases_done']}/{len(rotation['phases'])}")
+
+        def phase_done(index):
+            rotation["phases_done"] = index + 1
+            self.save()
+
+        own_executor = executor is None
+        executor = RotationExecutor() if own_executor else executor
+        try:
+            executor.execute([tuple(move) for move in rotation["moves"]], rotation["phases"],
+                             on_phase_done=phase_done, first_phase=rotation["phases_done"])
+        finally:
+            if own_executor:
+                executor.close()
+
+        self.complete(iteration, ROTATED)
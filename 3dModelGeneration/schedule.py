@@ -0,0 +1,35 @@
+import glob
+import os
+
+import numpy as np
+
+
+def decay(iteration: int, max_iterations: int) -> float:
+    """
+    The exponential decay driving the refinement loop, from 1 at the first iteration to exp(-0.7) at the last.
+    """
+    return float(np.exp(-0.7 * iteration / max(1, max_iterations - 1)))
+
+
+def strength_schedule(iteration: int, max_iterations: int) -> float:
+    return decay(iteration, max_iterations)
+
+
+def warm_start_steps(iteration: int, max_iterations: int, steps: int, fraction: float, min_steps: int) -> int:
+    """
+    Step budget of a warm-started iteration: a fraction of the cold budget, decaying like the strength.
+    """
+    return min(steps, max(min_steps, int(round(steps * fraction * decay(iteration, max_iterations)))))
+
+
+def find_checkpoint_dir(outputs_folder: str):
+    """
+    Returns the most recent nerfstudio_models folder containing a checkpoint under outputs_folder, or None.
+    """
+    candidates = [
+        path for path in glob.glob(os.path.join(outputs_folder, "**", "nerfstudio_models"), recursive=True)
+        if glob.glob(os.path.join(path, "*.ckpt"))
+    ]
+    if not candidates:
+        return None
+    return max(candidates, key=os.path.getmtime)
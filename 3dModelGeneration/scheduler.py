@@ -0,0 +1,125 @@
+import queue
+import threading
+import time
+import traceback
+
+_DONE = object()
+
+
+class Stage:
+    """
+    One step of a StageScheduler: a function applied to every item by `workers` threads,
+    fed by a queue holding at most `queue_size` items. Returning None drops the item.
+    """
+
+    def __init__(self, name: str, function, workers: int = 1, queue_size: int = 8):
+        self.name = name
+        self.function = function
+        self.workers = max(1, workers)
+        self.queue_size = max(1, queue_size)
+
+
+class StageScheduler:
+    """
+    Producer/consumer pipeline: items submitted to the first stage flow through every stage in order.
+    The bounded queues make submit() block when a later stage falls behind, and the number of
+    workers of a stage bounds how many items it processes at once (e.g. 1 for the GPU stage).
+    """
+
+    def __init__(self, stages):
+        self.stages = list(stages)
+        self.queues = [queue.Queue(maxsize=stage.queue_size) for stage in self.stages]
+        self.busy_time = {stage.name: 0.0 for stage in self.stages}
+        self.processed = {stage.name: 0 for stage in self.stages}
+        self._results = []
+        self._errors = []
+        self._pending = 0
+        self._condition = threading.Condition()
+        self._alive = [0] * len(self.stages)
+        self._threads = []
+
+    def start(self):
+        for index, stage in enumerate(self.stages):
+            self._alive[index] = stage.workers
+            for _ in range(stage.workers):
+                thread = threading.Thread(target=self._work, args=(index,), daemon=True,
+                                          name=f"{stage.name}-worker")
+                thread.start()
+                self._threads.append(thread)
+        return self
+
+    def _finish_item(self, result=None, error=None):
+        with self._condition:
+            if error is not None:
+                self._errors.append(error)
+            elif result is not None:
+                self._results.append(result)
+            self._pending -= 1
+            self._condition.notify_all()
+
+    def _work(self, index):
+        stage = self.stages[index]
+        stage_queue = self.queues[index]
+        while True:
+            item = stage_queue.get()
+            if item is _DONE:
+                break
+
+            start = time.perf_counter()
+            try:
+                result = stage.function(item)
+            except Exception as e:
+                traceback.print_exc()
+                self._finish_item(error=(stage.name, e))
+                continue
+            finally:
+                with self._condition:
+                    self.busy_time[stage.name] += time.perf_counter() - start
+                    self.processed[stage.name] += 1
+
+            if result is None:
+                self._finish_item()
+            elif index + 1 < len(self.stages):
+                self.queues[index + 1].put(result)
+            else:
+                self._finish_item(result=result)
+
+        # The last worker of a stage to leave shuts the next stage down
+        with self._condition:
+            self._alive[index] -= 1
+            last = self._alive[index] == 0
+        if last and index + 1 < len(self.stages):
+            for _ in range(self.stages[index + 1].workers):
+                self.queues[index + 1].put(_DONE)
+
+    def submit(self, item):
+        with self._condition:
+            self._pending += 1
+        self.queues[0].put(item)
+
+    def wait(self, timeout: float = None):
+        """
+        Blocks until every submitted item has left the pipeline and returns the outputs of the last stage.
+        Raises the first error raised by a stage since the previous wait.
+        """
+        with self._condition:
+            if not self._condition.wait_for(lambda: self._pending == 0, timeout):
+                raise TimeoutError(f"{self._pending} items still in the pipeline")
+            results, self._results = self._results, []
+            errors, self._errors = self._errors, []
+        if errors:
+            name, error = errors[0]
+            raise RuntimeError(f"Stage '{name}' failed on {len(errors)} item(s)") from error
+        return results
+
+    def close(self):
+        for _ in range(self.stages[0].workers):
+            self.queues[0].put(_DONE)
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+    def report(self):
+        for stage in self.stages:
+            print(f"  {stage.name:<12} workers={stage.workers:<3} items={self.processed[stage.name]:<5} "
+                  f"busy={self.busy_time[stage.name]:.2f}s")
@@ -0,0 +1,178 @@
+import csv
+import functools
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+MB = 1024 * 1024
+
+
+def current_rss_mb():
+    """
+    Current resident memory of this process in MB, or None if unknown.
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / MB
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import psutil
+    except ImportError:
+        return None
+    return psutil.Process().memory_info().rss / MB
+
+
+class RssSampler:
+    """
+    Polls the resident memory on a thread while a stage runs and keeps its maximum.
+    """
+
+    def __init__(self, interval: float = 0.05):
+        self.interval = interval
+        self.peak = current_rss_mb()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            rss = current_rss_mb()
+            if rss is not None:
+                self.peak = rss if self.peak is None else max(self.peak, rss)
+
+    def start(self):
+        if self.peak is not None:
+            self._thread = threading.Thread(target=self._sample, daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        rss = current_rss_mb()
+        if rss is not None and self.peak is not None:
+            self.peak = max(self.peak, rss)
+        return self.peak
+
+
+def process_peak_rss_mb():
+    """
+    Lifetime peak resident memory of this process and of its largest finished child (ns-train), in MB,
+    or None if unknown. These are high-water marks of the whole run, not of a stage.
+    """
+    if resource is not None:
+        # ru_maxrss is in KB on Linux and in bytes on macOS
+        scale = MB if sys.platform == "darwin" else 1024
+        own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale
+        children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / scale
+        return own, children
+    try:
+        import psutil
+    except ImportError:
+        return None, None
+    info = psutil.Process().memory_info()
+    return getattr(info, "peak_wset", info.rss) / MB, None
+
+
+def _cuda():
+    # Only look at torch if the pipeline already imported it
+    torch = sys.modules.get("torch")
+    if torch is not None and torch.cuda.is_available():
+        return torch.cuda
+    return None
+
+
+class Telemetry:
+    """
+    Collects the duration and memory peaks of the pipeline stages, tagged with the current iteration.
+    The RSS peak of a stage is sampled while it runs; the lifetime peaks of the process and of
+    ns-train are only reported once per run.
+    """
+
+    def __init__(self):
+        self.records = []
+        self.iteration = None
+        self.started_at = time.perf_counter()
+
+    def add(self, stage: str, seconds: float, **extra):
+        record = {"iteration": self.iteration, "stage": stage, "seconds": seconds}
+        record.update(extra)
+        self.records.append(record)
+        return record
+
+    @contextmanager
+    def stage(self, name: str):
+        cuda = _cuda()
+        if cuda is not None:
+            cuda.reset_peak_memory_stats()
+        sampler = RssSampler().start()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            rss = sampler.stop()
+            gpu = cuda.max_memory_allocated() / MB if cuda is not None else None
+            self.add(name, seconds, peak_rss_mb=rss, peak_gpu_mb=gpu)
+
+    def timed(self, name: str = None):
+        """
+        Decorator version of stage, named after the function by default.
+        """
+        def decorator(function):
+            @functools.wraps(function)
+            def wrapper(*args, **kwargs):
+                with self.stage(name or function.__name__):
+                    return function(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def totals(self):
+        totals = {}
+        for record in self.records:
+            total = totals.setdefault(record["stage"], {"count": 0, "seconds": 0.0, "max": 0.0})
+            total["count"] += 1
+            total["seconds"] += record["seconds"]
+            total["max"] = max(total["max"], record["seconds"])
+        return totals
+
+    def write_report(self, folder: str, name: str = "telemetry"):
+        os.makedirs(folder, exist_ok=True)
+        wall_time = time.perf_counter() - self.started_at
+        with open(os.path.join(folder, f"{name}.json"), "w") as f:
+            rss, children_rss = process_peak_rss_mb()
+            json.dump({"wall_time": wall_time, "process_peak_rss_mb": rss, "process_peak_children_rss_mb": children_rss,
+                       "stages": self.totals(), "records": self.records}, f, indent=4)
+
+        fields = []
+        for record in self.records:
+            fields += [key for key in record if key not in fields]
+        with open(os.path.join(folder, f"{name}.csv"), "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=fields)
+            writer.writeheader()
+            writer.writerows(self.records)
+
+    def summary(self):
+        wall_time = time.perf_counter() - self.started_at
+        print(f"{'stage':<28}{'count':>6}{'total s':>10}{'mean s':>10}{'max s':>10}{'share':>8}")
+        for stage, total in sorted(self.totals().items(), key=lambda item: -item[1]["seconds"]):
+            print(f"{stage:<28}{total['count']:>6}{total['seconds']:>10.2f}"
+                  f"{total['seconds'] / total['count']:>10.2f}{total['max']:>10.2f}"
+                  f"{total['seconds'] / wall_time:>8.1%}")
+        peaks = [record.get("peak_gpu_mb") for record in self.records if record.get("peak_gpu_mb") is not None]
+        if peaks:
+            print(f"Peak GPU memory: {max(peaks):.0f} MB")
+        rss, children_rss = process_peak_rss_mb()
+        if rss is not None:
+            print(f"Process peak RSS: {rss:.0f} MB" + (f", ns-train {children_rss:.0f} MB" if children_rss else ""))
+        print(f"Wall time: {wall_time:.2f}s")
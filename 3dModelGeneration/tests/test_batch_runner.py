@@ -0,0 +1,46 @@
+import json
+import os
+import socket
+
+from batch_runner import Job, Slot, allocate, run_batch
+
+MODULE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("localhost", 0))
+        return s.getsockname()[1]
+
+
+def test_fake_batch_reports_completed_and_failed_jobs(tmp_path):
+    start_image = os.path.join(MODULE_DIR, "start.png")
+    jobs = [
+        Job("duck", start_image, iterations=2, steps=10, args=["--seed", "1"]),
+        # Fails before pipeline.py starts, the batch goes on
+        Job("no_image", str(tmp_path / "missing.png"), iterations=1, steps=10),
+        # pipeline.py itself fails
+        Job("no_views", start_image, iterations=1, steps=10, args=["--views", "./missing.json"]),
+    ]
+    allocate(jobs, str(tmp_path / "batch"), free_port(), free_port())
+
+    report = run_batch(jobs, [Slot("0"), Slot("1")], fake=True, stage_seconds=0.01)
+
+    results = {result["name"]: result for result in report["jobs"]}
+    assert report["completed"] == 1
+    assert report["failed"] == 2
+    assert results["duck"]["returncode"] == 0 and results["duck"]["error"] is None
+    assert results["no_image"]["returncode"] == 1
+    assert results["no_image"]["error"].startswith("FileNotFoundError")
+    assert results["no_views"]["returncode"] != 0 and results["no_views"]["error"] is None
+
+    # The real orchestration ran: the views of both iterations were rotated into the run folder,
+    # iteration i + 1 archives what iteration i diffused, and the last rotation goes to iterations + 1
+    workdir = tmp_path / "batch" / "duck"
+    (run_dir,) = (workdir / "iter").iterdir()
+    manifest = json.loads((run_dir / "manifest.json").read_text())
+    assert manifest["settings"]["iterations"] == 2
+    for folder in ("1", "3"):
+        assert len(list((run_dir / folder).glob("init_*.png"))) == 17
+        assert len(list((run_dir / folder).glob("*.png"))) == 34
+    assert "Iterations complete" in (workdir / "pipeline.log").read_text()
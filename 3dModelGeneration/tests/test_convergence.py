@@ -0,0 +1,58 @@
+import numpy as np
+
+from convergence import ConvergenceController
+from run_manifest import TRAINED, RunManifest
+
+
+def converging_renders(iterations, seed=0):
+    # Renders that stop changing after the second iteration
+    rng = np.random.default_rng(seed)
+    first = rng.integers(0, 256, (4, 64, 64, 3), dtype=np.uint8)
+    return [first if i else rng.integers(0, 256, first.shape, dtype=np.uint8) for i in range(iterations)]
+
+
+def run(controller, manifest, renders, iterations, steps=1000):
+    # The part of the pipeline loop that depends on the controller
+    schedule = []
+    for iteration in iterations:
+        if manifest.is_done(iteration, TRAINED):
+            continue
+        strength = controller.adjust_strength(0.5)
+        iteration_steps = controller.adjust_steps(steps, 100)
+        previous = renders[iteration - 1] if controller.previous is None and iteration > 0 else None
+        controller.check(iteration, renders[iteration], previous=previous)
+        manifest.complete(iteration, TRAINED, convergence=controller.state())
+        schedule.append((iteration, strength, iteration_steps))
+    return schedule
+
+
+def test_resumed_adapt_run_keeps_the_schedule(tmp_path):
+    renders = converging_renders(5)
+    full = run(ConvergenceController("adapt", min_iterations=1), RunManifest.create(str(tmp_path / "full"), {}),
+               renders, range(5))
+    # Strength and steps halve for every converged iteration in a row
+    assert [entry[1] for entry in full] == [0.5, 0.5, 0.5, 0.25, 0.125]
+
+    manifest = RunManifest.create(str(tmp_path / "resumed"), {})
+    first = run(ConvergenceController("adapt", min_iterations=1), manifest, renders, range(4))
+    resumed = ConvergenceController("adapt", min_iterations=1)
+    resumed.restore(RunManifest.load(manifest.run_dir).latest_value("convergence", {}))
+    assert resumed.streak == 2 and resumed.last_strength == 0.25
+    assert first + run(resumed, manifest, renders, range(5)) == full
+
+
+def test_stop_is_restored(tmp_path):
+    controller = ConvergenceController("stop", patience=1, min_iterations=1)
+    manifest = RunManifest.create(str(tmp_path), {})
+    renders = converging_renders(4)
+    for iteration in range(4):
+        controller.check(iteration, renders[iteration])
+        if controller.should_stop():
+            controller.stop(iteration)
+        manifest.complete(iteration, TRAINED, convergence=controller.state())
+        if controller.stopped_at is not None:
+            break
+
+    resumed = ConvergenceController("stop", patience=1, min_iterations=1)
+    resumed.restore(RunManifest.load(str(tmp_path)).latest_value("convergence", {}))
+    assert resumed.stopped_at == 2
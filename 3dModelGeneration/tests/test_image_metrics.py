@@ -0,0 +1,46 @@
+import numpy as np
+import pytest
+from PIL import Image
+
+from convergence import ConvergenceController
+from image_metrics import average_hash, downsample, load_views
+
+
+@pytest.mark.parametrize("resolution", [800, 100, 512])
+def test_downsample_matches_load_views(tmp_path, resolution):
+    rng = np.random.default_rng(0)
+    images = rng.integers(0, 256, (3, resolution, resolution, 3), dtype=np.uint8)
+    paths = []
+    for i, image in enumerate(images):
+        path = tmp_path / f"view_{i}.png"
+        Image.fromarray(image).save(path)
+        paths.append(path)
+
+    in_memory = downsample(images)
+    on_disk = load_views(paths)
+    assert in_memory.shape == on_disk.shape == (3, 64, 64, 3)
+    np.testing.assert_array_equal(in_memory, on_disk)
+
+
+def test_convergence_check_mixes_buffer_and_files(tmp_path):
+    # 800x800 renders from the buffer against diffusion outputs loaded from disk
+    rng = np.random.default_rng(1)
+    renders = rng.integers(0, 256, (2, 800, 800, 3), dtype=np.uint8)
+    paths = []
+    for i, image in enumerate(renders):
+        path = tmp_path / f"view_{i}.png"
+        Image.fromarray(image).save(path)
+        paths.append(path)
+
+    controller = ConvergenceController(mode="stop")
+    controller.check(0, load_views(paths))
+    result = controller.check(1, downsample(renders), diffused=load_views(paths))
+    assert result["render_psnr"] > 90
+    assert result["diffusion_ssim"] == pytest.approx(1.0)
+
+
+def test_average_hash_of_float_views():
+    views = np.zeros((1, 64, 64, 3), dtype=np.float32)
+    views[:, :, 32:] = 1.0
+    bits = average_hash(views).reshape(8, 8)
+    assert not bits[:, :4].any() and bits[:, 4:].all()
@@ -0,0 +1,217 @@
+import asyncio
+import json
+import os
+import pickle
+import socket
+import sys
+import types
+
+import pytest
+import websockets
+
+from coordination_server import CoordinationServer
+from messages import HEADER, MAGIC, MESSAGE_TYPES, VERSION, SocketMessage, camera_message, decode, step_message
+
+
+def frame(type_code, body, payload=b"", version=VERSION, magic=MAGIC):
+    body = json.dumps(body).encode("utf-8") if not isinstance(body, bytes) else body
+    return HEADER.pack(magic, version, type_code, 0, len(body), len(payload)) + body + payload
+
+
+def legacy(type, message, **attributes):
+    # What the trainer fork pickles: a SocketMessage with plain attributes
+    legacy_message = SocketMessage.__new__(SocketMessage)
+    legacy_message.type = type
+    legacy_message.message = message
+    legacy_message.__dict__.update(attributes)
+    return pickle.dumps(legacy_message)
+
+
+def test_camera_message_round_trip():
+    image = bytes(range(256)) * 4
+    message = decode(camera_message("output_front.png", image, session="3", width=512, height=512).to_bytes())
+
+    assert message.type == "camera"
+    assert message.message == "output_front.png"
+    assert message.session == "3"
+    assert message.payload == image
+    assert message.get("image_format") == "png"
+    assert message.get("width") == 512 and message.get("height") == 512
+
+
+def test_step_message_round_trip():
+    message = decode(step_message(1200, loss=0.0123, rays_per_sec=2.5e6, session="0", step_time=0.01).to_bytes())
+
+    assert message.type == "step"
+    assert message.message == 1200
+    assert message.session == "0"
+    assert message.payload is None
+    assert message.get("loss") == 0.0123
+    assert message.get("rays_per_sec") == 2.5e6
+    assert message.get("step_time") == 0.01
+
+
+def test_message_without_session_or_payload():
+    message = decode(camera_message("output_front.png").to_bytes())
+    assert message.session is None
+    assert message.payload is None
+    assert message.get("image_format") is None
+
+
+def test_str_input_is_decoded_as_utf8():
+    raw = step_message(7).to_bytes()
+    assert decode(raw.decode("utf-8")).message == 7
+
+
+@pytest.mark.parametrize("raw", [
+    frame(MESSAGE_TYPES["step"], {"message": 1}, magic=b"XXXX"),
+    MAGIC + b"\x01\x02",
+    frame(MESSAGE_TYPES["step"], {"message": 1}, version=VERSION + 1),
+    frame(99, {"message": 1}),
+    frame(MESSAGE_TYPES["step"], {"message": 1})[:-1],
+    frame(MESSAGE_TYPES["step"], {"message": 1}) + b"extra",
+    frame(MESSAGE_TYPES["step"], b"{not json"),
+    frame(MESSAGE_TYPES["step"], b"\xff\xfe"),
+    frame(MESSAGE_TYPES["step"], [1]),
+    frame(MESSAGE_TYPES["step"], {"loss": 0.5}),
+    frame(MESSAGE_TYPES["step"], {"message": [1]}),
+    frame(MESSAGE_TYPES["step"], {"message": 1, "loss": "low"}),
+    frame(MESSAGE_TYPES["step"], {"message": 1, "session": 3}),
+    frame(MESSAGE_TYPES["camera"], {"message": "output_front.png", "width": 1.5}),
+    frame(MESSAGE_TYPES["camera"], {"message": "output_front.png", "command": "rm"}),
+], ids=["bad magic", "truncated header", "version", "unknown type", "short", "long", "invalid json",
+        "invalid utf8", "body not an object", "no message", "message type", "float field", "session type",
+        "int field", "unknown field"])
+def test_malformed_frames_are_rejected(raw):
+    with pytest.raises(ValueError):
+        decode(raw)
+
+
+def test_int_is_accepted_for_float_fields():
+    assert decode(frame(MESSAGE_TYPES["step"], {"message": 1, "loss": 1})).get("loss") == 1
+
+
+def test_encode_rejects_what_decode_would():
+    with pytest.raises(ValueError):
+        step_message(1, loss="low").to_bytes()
+    with pytest.raises(ValueError):
+        SocketMessage("render", "output_front.png").to_bytes()
+
+
+def test_legacy_pickle_is_refused_by_default():
+    with pytest.raises(ValueError, match="legacy pickled messages are disabled"):
+        decode(legacy("camera", "output_front.png"))
+
+
+def test_legacy_pickle_is_accepted_when_allowed():
+    message = decode(legacy("step", "1200"), allow_legacy_pickle=True)
+    assert message.type == "step"
+    assert message.message == "1200"
+    # The fork's messages predate these attributes, the class defaults fill them in
+    assert message.session is None and message.payload is None and message.get("loss") is None
+
+
+def test_legacy_pickle_of_the_fork_module_is_accepted(monkeypatch):
+    # The fork defines its own SocketMessage, the unpickler maps it by name onto the local class
+    module = types.ModuleType("fork_messages")
+    fork_class = type("SocketMessage", (), {})
+    fork_class.__module__ = "fork_messages"
+    module.SocketMessage = fork_class
+    monkeypatch.setitem(sys.modules, "fork_messages", module)
+    fork_message = fork_class()
+    fork_message.type, fork_message.message = "camera", "output_front.png"
+
+    message = decode(pickle.dumps(fork_message), allow_legacy_pickle=True)
+    assert isinstance(message, SocketMessage)
+    assert message.message == "output_front.png"
+
+
+@pytest.mark.parametrize("raw", [
+    legacy("render", "output_front.png"),
+    legacy("camera", ["output_front.png"]),
+    legacy("camera", "output_front.png", payload="not bytes"),
+    legacy("camera", "output_front.png", fields=["width"]),
+    legacy("step", "1200", fields={"loss": "low"}),
+    legacy("step", "1200", fields={"command": "rm"}),
+    pickle.dumps({"type": "step", "message": "1200"}),
+], ids=["unknown type", "message type", "payload type", "fields type", "field type", "unknown field", "not a message"])
+def test_invalid_legacy_messages_are_rejected(raw):
+    with pytest.raises(ValueError):
+        decode(raw, allow_legacy_pickle=True)
+
+
+class Exploit:
+    def __reduce__(self):
+        return os.system, ("echo exploited",)
+
+
+@pytest.mark.parametrize("raw", [
+    pickle.dumps(Exploit()),
+    pickle.dumps(os.system),
+    pickle.dumps(CoordinationServer),
+    pickle.dumps(socket.AF_INET),
+], ids=["reduce", "function", "class", "enum"])
+def test_restricted_unpickler_only_loads_socket_message(raw):
+    with pytest.raises(pickle.UnpicklingError, match="Refusing to unpickle"):
+        decode(raw, allow_legacy_pickle=True)
+
+
+def test_route_by_session():
+    server = CoordinationServer()
+    first = server.open_session(0, ["front.png"])
+    second = server.open_session(1, ["front.png"])
+
+    assert server._route(step_message(1, session="0")) is first
+    assert server._route(step_message(1, session="1")) is second
+    # Without a session, the most recently opened one
+    assert server._route(step_message(1)) is second
+    server.close_session(1)
+    assert server._route(step_message(1, session="1")) is None
+    assert server._route(step_message(1, session="7")) is None
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("localhost", 0))
+        return s.getsockname()[1]
+
+
+@pytest.mark.parametrize("legacy_pickle, expected", [
+    ("warn", ["1", 2]),
+    ("allow", ["1", 2]),
+    ("refuse", [2]),
+])
+def test_server_legacy_pickle_modes(legacy_pickle, expected, capsys):
+    port = free_port()
+    server = CoordinationServer(port=port, legacy_pickle=legacy_pickle)
+    server.start()
+    steps = []
+    session = server.open_session(0, ["front.png"], on_step=lambda message: steps.append(message.message))
+    received = []
+    session.on_view = lambda filename, data: received.append(filename)
+
+    async def send():
+        async with websockets.connect(f"ws://localhost:{port}") as websocket:
+            await websocket.send(legacy("step", "1", session="0"))
+            await websocket.send(legacy("camera", "output_front.png"))
+            await websocket.send(step_message(2, session="0").to_bytes())
+            await websocket.send(b"garbage")
+            # A malformed message does not close the connection
+            await websocket.send(step_message(3, session="0").to_bytes())
+            while 3 not in steps:
+                await asyncio.sleep(0.01)
+
+    try:
+        asyncio.run(asyncio.wait_for(send(), timeout=10))
+    finally:
+        server.stop()
+
+    assert steps == expected + [3]
+    assert received == (["front.png"] if legacy_pickle != "refuse" else [])
+    assert server.legacy_messages == (2 if legacy_pickle != "refuse" else 0)
+    assert capsys.readouterr().out.count("DeprecationWarning") == (1 if legacy_pickle == "warn" else 0)
+
+
+def test_unknown_legacy_pickle_mode():
+    with pytest.raises(ValueError):
+        CoordinationServer(legacy_pickle="maybe")
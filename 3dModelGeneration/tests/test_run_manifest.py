@@ -0,0 +1,93 @@
+import os
+import subprocess
+import sys
+import textwrap
+
+import pytest
+
+from run_manifest import ROTATED, RunManifest
+
+MODULE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+VIEWS = 3
+
+
+def rotation_moves(run_dir):
+    # The moves of rename_new_file: archive the init and diffused views, the renders become the init views
+    moves = []
+    for i in range(VIEWS):
+        moves.append((f"{run_dir}/init/init_{i}.png", f"{run_dir}/0/init_{i}.png"))
+        moves.append((f"{run_dir}/diff/{i}.png", f"{run_dir}/0/{i}.png"))
+        moves.append((f"{run_dir}/render_{i}.png", f"{run_dir}/init/init_{i}.png"))
+    return moves
+
+
+def make_run(run_dir):
+    for folder in ("init", "diff", "0"):
+        os.makedirs(os.path.join(run_dir, folder))
+    for i in range(VIEWS):
+        for path, content in ((f"init/init_{i}.png", f"init {i}"), (f"diff/{i}.png", f"diff {i}"),
+                              (f"render_{i}.png", f"render {i}")):
+            with open(os.path.join(run_dir, path), "w") as f:
+                f.write(content)
+    RunManifest.create(run_dir, {})
+
+
+def read(path):
+    with open(path) as f:
+        return f.read()
+
+
+@pytest.mark.parametrize("killed_after", [2, 7])
+def test_rotation_killed_midway_is_replayed(tmp_path, killed_after):
+    run_dir = str(tmp_path)
+    make_run(run_dir)
+    # Kill the process (no cleanup, no exception handling) after `killed_after` file moves
+    script = textwrap.dedent(f"""
+        import os
+        from rotation import RotationExecutor
+        from run_manifest import RunManifest
+        from test_run_manifest import rotation_moves
+
+        class KilledExecutor(RotationExecutor):
+            moved = 0
+
+            def move(self, source, destination):
+                super().move(source, destination)
+                KilledExecutor.moved += 1
+                if KilledExecutor.moved == {killed_after}:
+                    os._exit(9)
+
+        manifest = RunManifest.load({run_dir!r})
+        manifest.move_files(0, rotation_moves({run_dir!r}), KilledExecutor(workers=1))
+    """)
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([MODULE_DIR, os.path.join(MODULE_DIR, "tests")]))
+    assert subprocess.run([sys.executable, "-c", script], env=env).returncode == 9
+
+    manifest = RunManifest.load(run_dir)
+    rotation = manifest.iteration(0)["rotation"]
+    # Archiving the init and diffused views is the first phase, the renders move in the second
+    assert rotation["phases_done"] == (0 if killed_after < 2 * VIEWS else 1)
+    assert not manifest.is_done(0, ROTATED)
+
+    # The journal is replayed even if the caller plans different moves
+    manifest.move_files(0, [])
+    assert RunManifest.load(run_dir).is_done(0, ROTATED)
+    for i in range(VIEWS):
+        assert read(f"{run_dir}/0/init_{i}.png") == f"init {i}"
+        assert read(f"{run_dir}/0/{i}.png") == f"diff {i}"
+        assert read(f"{run_dir}/init/init_{i}.png") == f"render {i}"
+        assert not os.path.exists(f"{run_dir}/render_{i}.png")
+        assert not os.path.exists(f"{run_dir}/diff/{i}.png")
+
+
+def test_recorded_values_survive_a_restart(tmp_path):
+    manifest = RunManifest.create(str(tmp_path), {"steps": 1000})
+    manifest.record(1, strength=0.4, steps=500)
+    manifest.complete(1, ROTATED)
+
+    resumed = RunManifest.load(str(tmp_path))
+    assert resumed.value(1, "strength") == 0.4
+    assert resumed.value(1, "steps") == 500
+    assert resumed.value(2, "steps") is None
+    assert resumed.is_done(1, ROTATED)
+    assert resumed.last_completed() == (1, ROTATED)
@@ -0,0 +1,100 @@
+import threading
+import time
+from concurrent.futures import CancelledError, Future
+
+import pytest
+
+from scheduler import Stage, StageScheduler
+
+
+def diffuse_stub(item):
+    # Stands in for diffuse_stage: waits for the strength of its iteration like the real one
+    view, strength = item
+    return view, f"diffused {view} at {strength.result(timeout=5)}"
+
+
+def scheduler(diffuse=diffuse_stub, train=lambda item: item, gpu_workers=1, io_workers=1):
+    return StageScheduler([
+        Stage("diffuse", diffuse, workers=gpu_workers, queue_size=4),
+        Stage("train", train, workers=io_workers, queue_size=4),
+    ]).start()
+
+
+def test_items_keep_their_order_through_single_workers():
+    strength = Future()
+    strength.set_result(0.5)
+    pipeline = scheduler()
+    for view in range(10):
+        pipeline.submit((view, strength))
+    results = pipeline.wait(timeout=5)
+    pipeline.close()
+    assert results == [(view, f"diffused {view} at 0.5") for view in range(10)]
+    assert pipeline.processed == {"diffuse": 10, "train": 10}
+
+
+def test_several_workers_process_every_item():
+    strength = Future()
+    strength.set_result(0.5)
+    pipeline = scheduler(gpu_workers=3, io_workers=2)
+    for view in range(20):
+        pipeline.submit((view, strength))
+    results = pipeline.wait(timeout=5)
+    pipeline.close()
+    assert sorted(results) == [(view, f"diffused {view} at 0.5") for view in range(20)]
+
+
+def test_items_wait_for_the_strength():
+    strength = Future()
+    pipeline = scheduler()
+    pipeline.submit((0, strength))
+    time.sleep(0.05)
+    # Nothing leaves the pipeline before the strength is decided
+    with pytest.raises(TimeoutError):
+        pipeline.wait(timeout=0.05)
+    threading.Timer(0.05, strength.set_result, (0.25,)).start()
+    assert pipeline.wait(timeout=5) == [(0, "diffused 0 at 0.25")]
+    pipeline.close()
+
+
+def test_cancelled_strength_releases_the_workers():
+    strength = Future()
+    pipeline = scheduler()
+    for view in range(3):
+        pipeline.submit((view, strength))
+    # What the loop does when it is left early
+    strength.cancel()
+    with pytest.raises(RuntimeError, match="'diffuse' failed on 3 item") as raised:
+        pipeline.wait(timeout=5)
+    assert isinstance(raised.value.__cause__, CancelledError)
+    pipeline.close()
+
+
+def test_stage_errors_are_raised_once_and_other_items_go_through():
+    def train(item):
+        view, image = item
+        if view == 2:
+            raise ValueError("training failed")
+        return view
+
+    strength = Future()
+    strength.set_result(1.0)
+    pipeline = scheduler(train=train)
+    for view in range(4):
+        pipeline.submit((view, strength))
+    with pytest.raises(RuntimeError, match="'train' failed on 1 item") as raised:
+        pipeline.wait(timeout=5)
+    assert isinstance(raised.value.__cause__, ValueError)
+
+    # The error was reported, the next batch starts clean
+    pipeline.submit((5, strength))
+    assert pipeline.wait(timeout=5) == [5]
+    pipeline.close()
+
+
+def test_dropped_items_leave_the_pipeline():
+    pipeline = StageScheduler([Stage("filter", lambda item: item if item % 2 else None),
+                               Stage("square", lambda item: item * item)]).start()
+    for item in range(6):
+        pipeline.submit(item)
+    assert sorted(pipeline.wait(timeout=5)) == [1, 9, 25]
+    pipeline.close()
@@ -0,0 +1,72 @@
+import pytest
+
+from train_logs import TrainingLog, parse_line
+
+# Part of the config dump ns-train prints before training (nerfacto)
+CONFIG_DUMP = """\
+TrainerConfig(
+    _target=<class 'nerfstudio.engine.trainer.Trainer'>,
+    output_dir=PosixPath('outputs'),
+    steps_per_eval_batch=500,
+    max_num_iterations=30000,
+    pipeline=VanillaPipelineConfig(
+        model=NerfactoModelConfig(
+            near_plane=0.05,
+            far_plane=1000.0,
+            loss_coefficients={'rgb_loss_coarse': 1.0, 'rgb_loss_fine': 1.0},
+            interlevel_loss_mult=1.0,
+            distortion_loss_mult=0.002,
+            orientation_loss_mult=0.0001,
+            pred_normal_loss_mult=0.001,
+            use_gradient_scaling=False,
+        ),
+    ),
+)"""
+
+STEP_LINES = [
+    "Step (% Done)       Train Iter (time)    ETA (time)           Train Rays / Sec",
+    "-----------------------------------------------------------------------------------",
+    "1230 (12.30%)       10.548 ms            1 m, 32 s            380.76 K",
+    "\x1b[1m1240 (12.40%)\x1b[0m       11.002 ms            1 m, 31 s            1.02 M",
+]
+
+
+def test_config_dump_has_no_metrics():
+    for line in CONFIG_DUMP.splitlines():
+        assert parse_line(line) is None, line
+
+
+def test_step_rows():
+    assert parse_line(STEP_LINES[0]) is None
+    assert parse_line(STEP_LINES[1]) is None
+    row = parse_line(STEP_LINES[2])
+    assert row["step"] == 1230 and row["percent"] == 12.3
+    assert row["iter_time"] == pytest.approx(0.010548)
+    assert row["eta"] == pytest.approx(92.0)
+    assert row["rays_per_sec"] == pytest.approx(380.76e3)
+    assert "loss" not in row
+    assert parse_line(STEP_LINES[3])["rays_per_sec"] == pytest.approx(1.02e6)
+
+
+@pytest.mark.parametrize("line, loss", [
+    ("loss: 0.0123", 0.0123),
+    ("Train Loss = 1.2e-3", 1.2e-3),
+    ("{'loss': 0.5, 'psnr': 24.1}", 0.5),
+])
+def test_loss_fields(line, loss):
+    assert parse_line(line)["loss"] == pytest.approx(loss)
+
+
+def test_log_aggregates_only_real_losses(tmp_path):
+    log = TrainingLog(str(tmp_path))
+    log.start_iteration(0)
+    for line in CONFIG_DUMP.splitlines() + STEP_LINES:
+        log.on_line("stdout", line)
+    log.on_line("stdout", "loss: 0.25")
+    summary = log.summary()
+    log.close()
+    assert summary["last_step"] == 1240
+    assert summary["last_loss"] == summary["min_loss"] == 0.25
+    with open(tmp_path / "training_metrics.csv") as f:
+        # Header, two step rows and the loss line
+        assert len(f.read().splitlines()) == 4
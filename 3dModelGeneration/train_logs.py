@@ -0,0 +1,204 @@
+import csv
+import gzip
+import logging
+import logging.handlers
+import os
+import re
+import shutil
+import threading
+import time
+from collections import deque
+
+ANSI_ESCAPE = re.compile(r"\x1b\[[0-9;?]*[A-Za-z]")
+# A row of the nerfstudio progress table: "1230 (12.30%)   10.548 ms   1 m, 32 s   380.76 K"
+STEP_ROW = re.compile(r"^\s*(?P<step>\d+)\s+\((?P<percent>[\d.]+)%\)\s+(?P<rest>.*)$")
+DURATION = re.compile(r"(?P<value>[\d.]+)\s*(?P<unit>ms|s|m|h|d)\b")
+RATE = re.compile(r"(?P<value>[\d.]+)\s*(?P<suffix>[KMG]?)\s*$")
+# A loss field on its own ("loss: 0.0123", "Train Loss = 1.2e-3", "'loss': 0.5"). The word boundaries keep
+# out the config dump of ns-train, where "loss" is part of names like distortion_loss_mult or rgb_loss_fine.
+LOSS = re.compile(r"\bloss\b['\"]?\s*[:=]\s*(?P<loss>[-+]?\d*\.?\d+(?:[eE][-+]?\d+)?)", re.IGNORECASE)
+
+UNIT_SECONDS = {"ms": 1e-3, "s": 1.0, "m": 60.0, "h": 3600.0, "d": 86400.0}
+SUFFIX = {"": 1.0, "K": 1e3, "M": 1e6, "G": 1e9}
+FIELDS = ["iteration", "time", "step", "percent", "iter_time", "eta", "rays_per_sec", "loss", "source"]
+
+
+def parse_duration(text: str):
+    """
+    "10.548 ms" -> 0.010548, "1 m, 32 s" -> 92.0, None if the text holds no duration.
+    """
+    matches = list(DURATION.finditer(text))
+    if not matches:
+        return None
+    return sum(float(match["value"]) * UNIT_SECONDS[match["unit"]] for match in matches)
+
+
+def parse_line(line: str):
+    """
+    Parses one line of ns-train output into {step, percent, iter_time, eta, rays_per_sec, loss},
+    leaving out what the line does not have. Returns None for lines without metrics.
+    """
+    line = ANSI_ESCAPE.sub("", line).strip()
+    metrics = {}
+    row = STEP_ROW.match(line)
+    if row is not None:
+        metrics["step"] = int(row["step"])
+        metrics["percent"] = float(row["percent"])
+        # Columns are separated by runs of spaces: iteration time, ETA, rays per second
+        columns = [column for column in re.split(r"\s{2,}", row["rest"]) if column]
+        if columns:
+            metrics["iter_time"] = parse_duration(columns[0])
+        if len(columns) > 1:
+            metrics["eta"] = parse_duration(columns[1])
+        if len(columns) > 2:
+            rate = RATE.search(columns[2])
+            if rate is not None:
+                metrics["rays_per_sec"] = float(rate["value"]) * SUFFIX[rate["suffix"]]
+    loss = LOSS.search(line)
+    if loss is not None:
+        metrics["loss"] = float(loss["loss"])
+    return {key: value for key, value in metrics.items() if value is not None} or None
+
+
+def _gzip_rotator(source, destination):
+    with open(source, "rb") as f_in, gzip.open(destination, "wb") as f_out:
+        shutil.copyfileobj(f_in, f_out)
+    os.remove(source)
+
+
+class TrainingLog:
+    """
+    Captures the output of ns-train with bounded memory: every line goes to a size-rotated log file
+    whose old segments are gzipped, the last `tail_lines` lines are kept for failure reports, and
+    the parsed metrics are streamed to a CSV time series while only per-iteration aggregates stay
+    in memory. Step messages of the coordination server feed the same series.
+    """
+
+    def __init__(self, folder: str = None, max_bytes: int = 10 * 1024 * 1024, backups: int = 5,
+                 tail_lines: int = 200):
+        self.tail = deque(maxlen=tail_lines)
+        self.iteration = None
+        self.summaries = {}
+        self._lock = threading.Lock()
+        self._logger = logging.getLogger(f"ns-train.{id(self)}")
+        self._logger.propagate = False
+        self._logger.setLevel(logging.INFO)
+        self._csv_file = None
+        self._csv = None
+
+        if folder is not None:
+            os.makedirs(folder, exist_ok=True)
+            handler = logging.handlers.RotatingFileHandler(os.path.join(folder, "ns-train.log"),
+                                                           maxBytes=max_bytes, backupCount=backups, encoding="utf-8")
+            handler.namer = lambda name: f"{name}.gz"
+            handler.rotator = _gzip_rotator
+            handler.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+            self._logger.addHandler(handler)
+
+            path = os.path.join(folder, "training_metrics.csv")
+            new_file = not os.path.exists(path)
+            self._csv_file = open(path, "a", newline="")
+            self._csv = csv.DictWriter(self._csv_file, fieldnames=FIELDS)
+            if new_file:
+                self._csv.writeheader()
+
+    def start_iteration(self, iteration):
+        with self._lock:
+            self.iteration = iteration
+            self.summaries[iteration] = {"points": 0, "first_step": None, "last_step": None,
+                                         "first_time": None, "last_time": None, "rays_per_sec_sum": 0.0,
+                                         "rays_per_sec_count": 0, "iter_time_sum": 0.0, "iter_time_count": 0,
+                                         "last_loss": None, "min_loss": None, "last_eta": None}
+
+    def on_line(self, stream_name: str, line: str):
+        line = line.rstrip("\n")
+        with self._lock:
+            self.tail.append(f"[{stream_name}] {line}")
+        self._logger.info("[%s] %s", stream_name, line)
+        metrics = parse_line(line)
+        if metrics is not None:
+            self.record(source=stream_name, **metrics)
+
+    def record(self, source: str = "message", **metrics):
+        """
+        Adds one point of the time series (step, iter_time, eta, rays_per_sec, loss, any subset).
+        """
+        now = time.time()
+        with self._lock:
+            summary = self.summaries.get(self.iteration)
+            if summary is not None:
+                self._aggregate(summary, now, metrics)
+            if self._csv is not None:
+                row = {key: metrics.get(key) for key in FIELDS}
+                row.update(iteration=self.iteration, time=round(now, 3), source=source)
+                self._csv.writerow(row)
+                self._csv_file.flush()
+
+    @staticmethod
+    def _aggregate(summary, now, metrics):
+        summary["points"] += 1
+        step = metrics.get("step")
+        if step is not None:
+            if summary["first_step"] is None:
+                summary["first_step"], summary["first_time"] = step, now
+            summary["last_step"], summary["last_time"] = step, now
+        if metrics.get("rays_per_sec") is not None:
+            summary["rays_per_sec_sum"] += metrics["rays_per_sec"]
+            summary["rays_per_sec_count"] += 1
+        if metrics.get("iter_time") is not None:
+            summary["iter_time_sum"] += metrics["iter_time"]
+            summary["iter_time_count"] += 1
+        if metrics.get("loss") is not None:
+            summary["last_loss"] = metrics["loss"]
+            summary["min_loss"] = metrics["loss"] if summary["min_loss"] is None else min(summary["min_loss"], metrics["loss"])
+        if metrics.get("eta") is not None:
+            summary["last_eta"] = metrics["eta"]
+
+    def summary(self, iteration=None) -> dict:
+        """
+        Training throughput of an iteration (the current one by default).
+        """
+        with self._lock:
+            summary = dict(self.summaries.get(self.iteration if iteration is None else iteration, {}))
+        if not summary:
+            return {}
+        result = {"points": summary["points"], "last_step": summary["last_step"],
+                  "last_loss": summary["last_loss"], "min_loss": summary["min_loss"]}
+        if summary["first_step"] is not None and summary["last_time"] > summary["first_time"]:
+            result["seconds"] = summary["last_time"] - summary["first_time"]
+            result["steps_per_sec"] = (summary["last_step"] - summary["first_step"]) / result["seconds"]
+        if summary["rays_per_sec_count"]:
+            result["rays_per_sec"] = summary["rays_per_sec_sum"] / summary["rays_per_sec_count"]
+        if summary["iter_time_count"]:
+            result["iter_time"] = summary["iter_time_sum"] / summary["iter_time_count"]
+        return result
+
+    def dump_tail(self):
+        with self._lock:
+            lines = list(self.tail)
+        print(f"Last {len(lines)} lines of ns-train:")
+        for line in lines:
+            print(f"  {line}")
+
+    def report(self):
+        if not self.summaries:
+            return
+        print("Training metrics:")
+        print(f"  {'iteration':<10}{'steps':>8}{'steps/s':>10}{'rays/s':>12}{'iter ms':>10}{'loss':>10}")
+        for iteration in self.summaries:
+            summary = self.summary(iteration)
+
+            def value(key, scale=1.0, digits=1):
+                return f"{summary[key] * scale:.{digits}f}" if summary.get(key) is not None else "-"
+
+            print(f"  {str(iteration):<10}{value('last_step', digits=0):>8}{value('steps_per_sec'):>10}"
+                  f"{value('rays_per_sec', digits=0):>12}{value('iter_time', 1e3, 2):>10}{value('last_loss', digits=4):>10}")
+
+    def close(self):
+        for handler in list(self._logger.handlers):
+            handler.close()
+            self._logger.removeHandler(handler)
+        if self._csv_file is not None:
+            self._csv_file.close()
+            self._csv_file = None
+            self._csv = None
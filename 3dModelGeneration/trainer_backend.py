@@ -0,0 +1,423 @@
+import asyncio
+import copy
+import gc
+import io
+import json
+import os
+import subprocess
+import threading
+import time
+import traceback
+from pathlib import Path
+
+import numpy as np
+import websockets
+from PIL import Image
+from websockets.server import serve
+
+from messages import camera_message, step_message
+from readiness import TrainerReadiness, PROCESS_STARTED, TRAINING_STEP, VIEWER_LISTENING, PROCESS_EXITED
+from train_logs import TrainingLog
+
+# Environment of the trainer: the port of the coordination server, and the session its messages must name
+# so that several trainers reporting to one server are routed apart
+WS_PORT_ENV = "NERF_PIPELINE_WS_PORT"
+SESSION_ENV = "NERF_PIPELINE_SESSION"
+
+
+def read_stream(stream, stream_name, on_line=None, on_close=None, echo=True):
+    """
+    Reads line by line from the stream (stdout/stderr) and prints it.
+    """
+    # Iterate over lines until an EOF signal ('') is received
+    for line in iter(stream.readline, ''):
+        if line:
+            if echo:
+                print(f"[{stream_name}] {line.strip()}")
+            if on_line is not None:
+                on_line(line)
+    stream.close()
+    if on_close is not None:
+        on_close()
+
+
+class TrainerBackend:
+    """
+    Runs one NeRF training per iteration. start() returns once training is launched,
+    stop() asks it to end (it may be called from another thread) and wait() blocks until it has.
+    The session of the iteration is handed to the trainer in NERF_PIPELINE_SESSION.
+    """
+    name = "trainer"
+
+    def __init__(self, model_type: str, data: str = "./", readiness: TrainerReadiness = None,
+                 viewer_port: int = 7007, ws_port: int = 8765, training_log: TrainingLog = None):
+        self.model_type = model_type
+        self.data = data
+        self.viewer_port = viewer_port
+        self.ws_port = ws_port
+        self.readiness = readiness if readiness is not None else TrainerReadiness()
+        self.training_log = training_log if training_log is not None else TrainingLog()
+        self.timings = []
+        self._started_at = None
+
+    def start(self, num_steps: int, load_dir: str = None, session: str = None):
+        raise NotImplementedError
+
+    def stop(self):
+        raise NotImplementedError
+
+    def wait(self):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+    def _record(self, setup: float, training: float):
+        self.timings.append({"setup": setup, "training": training})
+        print(f"[{self.name}] setup {setup:.2f}s, training {training:.2f}s")
+
+    def report(self):
+        if not self.timings:
+            return
+        print(f"Trainer backend ({self.name}) timings:")
+        for i, timing in enumerate(self.timings):
+            print(f"  iteration {i:<3} setup={timing['setup']:.2f}s training={timing['training']:.2f}s")
+
+
+class SubprocessTrainer(TrainerBackend):
+    """
+    Launches ns-train in a new process every iteration.
+    Setup is measured until the first training step (or the viewer, if no step is reported).
+    stderr is printed, stdout (the progress table) only goes to the training log.
+    """
+    name = "subprocess"
+
+    def __init__(self, model_type: str, data: str = "./", readiness: TrainerReadiness = None, **kwargs):
+        super().__init__(model_type, data, readiness, **kwargs)
+        self.process = None
+        self._stopped = False
+        self._stream_threads = []
+
+    def build_command(self, num_steps, load_dir=None):
+        command = [
+            'ns-train',
+            self.model_type,
+            '--data', self.data,
+            '--max-num-iterations', str(num_steps),
+            '--viewer.websocket-port', str(self.viewer_port),
+        ]
+        if load_dir is not None:
+            # Resume from the previous iteration's model, the step budget counts from the loaded step
+            command += ['--load-dir', load_dir]
+        command += [
+            'nerfstudio-data',
+            '--orientation-method', 'none',
+            '--center_method', 'none'
+        ]
+        return command
+
+    def start(self, num_steps: int, load_dir: str = None, session: str = None):
+        self._started_at = time.perf_counter()
+        # The trainer reads the coordination server port and its session from its environment
+        env = dict(os.environ, **{WS_PORT_ENV: str(self.ws_port)})
+        if session is not None:
+            env[SESSION_ENV] = str(session)
+        self.process = subprocess.Popen(self.build_command(num_steps, load_dir), stdout=subprocess.PIPE,
+                                        stderr=subprocess.PIPE, text=True, encoding="utf-8", errors="replace", env=env)
+        self._stopped = False
+        self.readiness.mark(PROCESS_STARTED)
+
+        def on_stderr_line(line):
+            self.readiness.on_stderr_line(line)
+            self.training_log.on_line("STDERR", line)
+
+        self._stream_threads = [
+            threading.Thread(
+                target=read_stream,
+                args=(self.process.stderr, "STDERR", on_stderr_line, self.readiness.on_stream_closed),
+            ),
+            threading.Thread(
+                target=read_stream,
+                args=(self.process.stdout, "STDOUT", lambda line: self.training_log.on_line("STDOUT", line)),
+                kwargs={"echo": False},
+            ),
+        ]
+        for thread in self._stream_threads:
+            thread.start()
+
+    def stop(self):
+        if self.process is not None:
+            self._stopped = True
+            self.process.terminate()
+
+    def wait(self):
+        if self.process is None:
+            return
+        returncode = self.process.wait()
+        for thread in self._stream_threads:
+            thread.join()
+        ended_at = time.perf_counter()
+        if returncode != 0 and not self._stopped:
+            print(f"ns-train failed with code {returncode}")
+            self.training_log.dump_tail()
+
+        reached = self.readiness.reached
+        ready = reached.get(TRAINING_STEP, reached.get(VIEWER_LISTENING))
+        if ready is not None:
+            # readiness uses time.monotonic, convert to an offset from its own start
+            setup = ready - self.readiness.started_at
+        else:
+            setup = ended_at - self._started_at
+        self._record(setup, ended_at - self._started_at - setup)
+        self.process = None
+
+
+class TrainingStopped(Exception):
+    pass
+
+
+class InProcessTrainer(TrainerBackend):
+    """
+    Trains with nerfstudio inside this process. The imports, the CUDA context, the trainer
+    config and the dataparser output (camera poses and file names, which do not change
+    between iterations) are built once and reused; only the images are reloaded.
+    """
+    name = "in_process"
+
+    def __init__(self, model_type: str, data: str = "./", readiness: TrainerReadiness = None, **kwargs):
+        super().__init__(model_type, data, readiness, **kwargs)
+        self._base_config = None
+        self._dataparser = None
+        self._thread = None
+        self._stop_event = threading.Event()
+        self._trainer = None
+        self._setup_time = 0.0
+        self._training_time = 0.0
+
+    def _build_config(self, num_steps, load_dir):
+        if self._base_config is None:
+            from nerfstudio.configs.method_configs import all_methods
+            from nerfstudio.data.dataparsers.nerfstudio_dataparser import NerfstudioDataParserConfig
+
+            config = copy.deepcopy(all_methods[self.model_type])
+            config.data = Path(self.data)
+            config.pipeline.datamanager.data = Path(self.data)
+            config.pipeline.datamanager.dataparser = NerfstudioDataParserConfig(
+                orientation_method="none", center_method="none"
+            )
+            config.vis = "viewer"
+            config.viewer.websocket_port = self.viewer_port
+            os.environ[WS_PORT_ENV] = str(self.ws_port)
+            self._base_config = config
+
+        config = copy.deepcopy(self._base_config)
+        config.max_num_iterations = num_steps
+        config.load_dir = Path(load_dir) if load_dir is not None else None
+        config.set_timestamp()
+        if self._dataparser is not None:
+            dataparser = self._dataparser
+            config.pipeline.datamanager.dataparser.setup = lambda **kwargs: dataparser
+        return config
+
+    def _cache_dataparser(self, trainer):
+        dataparser = trainer.pipeline.datamanager.dataparser
+        outputs = {"train": trainer.pipeline.datamanager.train_dataparser_outputs}
+        get_dataparser_outputs = dataparser.get_dataparser_outputs
+
+        def cached(split="train", **kwargs):
+            if split not in outputs:
+                outputs[split] = get_dataparser_outputs(split=split, **kwargs)
+            return outputs[split]
+
+        dataparser.get_dataparser_outputs = cached
+        self._dataparser = dataparser
+
+    def _install_stop_hooks(self, trainer):
+        from nerfstudio.engine.callbacks import TrainingCallback, TrainingCallbackLocation
+
+        def check_stop(step):
+            if self._stop_event.is_set():
+                raise TrainingStopped()
+
+        # stop() ends the training loop at the next step, like terminating ns-train
+        trainer.callbacks.append(TrainingCallback(
+            where_to_run=[TrainingCallbackLocation.BEFORE_TRAIN_ITERATION], func=check_stop))
+
+        def train_complete_viewer():
+            # Marks the viewer as done like the original hook, then waits to be stopped instead of idling forever
+            viewer_state = getattr(trainer, "viewer_state", None)
+            if viewer_state is not None:
+                viewer_state.training_complete()
+            self._stop_event.wait()
+
+        trainer._train_complete_viewer = train_complete_viewer
+
+    def _run(self, num_steps, load_dir):
+        training_started = None
+        try:
+            setup_started = time.perf_counter()
+            config = self._build_config(num_steps, load_dir)
+            trainer = config.setup(local_rank=0, world_size=1)
+            trainer.setup()
+            if self._dataparser is None:
+                self._cache_dataparser(trainer)
+            self._install_stop_hooks(trainer)
+            self._trainer = trainer
+            self._setup_time = time.perf_counter() - setup_started
+
+            training_started = time.perf_counter()
+            trainer.train()
+        except TrainingStopped:
+            pass
+        except Exception:
+            traceback.print_exc()
+        finally:
+            self._training_time = time.perf_counter() - training_started if training_started else 0.0
+            self.readiness.mark(PROCESS_EXITED)
+
+    def start(self, num_steps: int, load_dir: str = None, session: str = None):
+        # The trainer runs in this process, its message client reads the session from this environment
+        if session is not None:
+            os.environ[SESSION_ENV] = str(session)
+        else:
+            os.environ.pop(SESSION_ENV, None)
+        self._stop_event.clear()
+        self._setup_time = 0.0
+        self._training_time = 0.0
+        self._thread = threading.Thread(target=self._run, args=(num_steps, load_dir), daemon=True)
+        self._thread.start()
+        self.readiness.mark(PROCESS_STARTED)
+
+    def stop(self):
+        self._stop_event.set()
+
+    def wait(self):
+        if self._thread is None:
+            return
+        self._thread.join()
+        self._thread = None
+
+        # Release the viewer port and the model before the diffusion stage needs the GPU
+        if self._trainer is not None:
+            viewer_state = getattr(self._trainer, "viewer_state", None)
+            if viewer_state is not None:
+                viewer_state.viser_server.stop()
+            self._trainer = None
+        gc.collect()
+        try:
+            import torch
+            torch.cuda.empty_cache()
+        except ImportError:
+            pass
+        self._record(self._setup_time, self._training_time)
+
+
+class StubTrainer(TrainerBackend):
+    """
+    CPU stand-in for ns-train, so the orchestration runs without nerfstudio or a GPU. It listens on the
+    viewer port and, once the viewer is triggered, "trains" for `seconds` by pulling the diffusion outputs
+    listed in transforms.json towards their mean. Like the forked trainer it reports step messages, writes
+    the output_<view> renders and sends one camera message per render, then waits to be stopped.
+    """
+    name = "stub"
+
+    def __init__(self, model_type: str, data: str = "./", readiness: TrainerReadiness = None,
+                 seconds: float = 0.05, **kwargs):
+        super().__init__(model_type, data, readiness, **kwargs)
+        self.seconds = seconds
+        self._thread = None
+        self._stop_event = threading.Event()
+        self._setup_time = 0.0
+        self._training_time = 0.0
+
+    def _render(self, num_steps):
+        with open(os.path.join(self.data, "transforms.json")) as f:
+            frames = json.load(f)["frames"]
+        images = [np.asarray(Image.open(os.path.join(self.data, frame["file_path"])).convert("RGB").resize((512, 512)),
+                             np.float32) for frame in frames]
+        mean = np.mean(images, axis=0)
+        renders = []
+        for frame, image in zip(frames, images):
+            path = os.path.join(self.data, f"output_{os.path.basename(frame['file_path'])}")
+            buffer = io.BytesIO()
+            Image.fromarray((0.5 * image + 0.5 * mean).astype(np.uint8)).save(buffer, format="PNG")
+            with open(f"{path}.part", "wb") as f:
+                f.write(buffer.getvalue())
+            os.replace(f"{path}.part", path)
+            renders.append((os.path.basename(path), buffer.getvalue()))
+
+        # A checkpoint where ns-train leaves its own, so --warm_start finds one
+        checkpoint_dir = os.path.join(self.data, "outputs", "stub", self.model_type, "nerfstudio_models")
+        os.makedirs(checkpoint_dir, exist_ok=True)
+        with open(os.path.join(checkpoint_dir, f"step-{num_steps:09d}.ckpt"), "wb"):
+            pass
+        return renders
+
+    async def _serve(self, num_steps, session):
+        viewer_connected = asyncio.Event()
+
+        async def on_viewer(websocket):
+            viewer_connected.set()
+            await websocket.wait_closed()
+
+        setup_started = time.perf_counter()
+        async with serve(on_viewer, "localhost", self.viewer_port):
+            while not viewer_connected.is_set():
+                if self._stop_event.is_set():
+                    return
+                await asyncio.sleep(0.05)
+            self._setup_time = time.perf_counter() - setup_started
+
+            training_started = time.perf_counter()
+            async with websockets.connect(f"ws://localhost:{self.ws_port}", max_size=None) as client:
+                reports = 10
+                for i in range(1, reports + 1):
+                    if self._stop_event.is_set():
+                        return
+                    await asyncio.sleep(self.seconds / reports)
+                    step = num_steps * i // reports
+                    await client.send(step_message(step, loss=1.0 / (1 + step), session=session,
+                                                   step_time=self.seconds / max(num_steps, 1)).to_bytes())
+                renders = await asyncio.to_thread(self._render, num_steps)
+                self._training_time = time.perf_counter() - training_started
+                for filename, data in renders:
+                    await client.send(camera_message(filename, data, session=session).to_bytes())
+                # The viewer of the forked trainer idles after rendering until the pipeline stops it
+                await asyncio.to_thread(self._stop_event.wait)
+
+    def _run(self, num_steps, session):
+        try:
+            asyncio.run(self._serve(num_steps, session))
+        except Exception:
+            traceback.print_exc()
+        finally:
+            self.readiness.mark(PROCESS_EXITED)
+
+    def start(self, num_steps: int, load_dir: str = None, session: str = None):
+        self._stop_event.clear()
+        self._setup_time = 0.0
+        self._training_time = 0.0
+        self._thread = threading.Thread(target=self._run, args=(num_steps, session), daemon=True)
+        self._thread.start()
+        self.readiness.mark(PROCESS_STARTED)
+
+    def stop(self):
+        self._stop_event.set()
+
+    def wait(self):
+        if self._thread is None:
+            return
+        self._thread.join()
+        self._thread = None
+        self._record(self._setup_time, self._training_time)
+
+
+def create_trainer(kind: str, model_type: str, data: str = "./", readiness: TrainerReadiness = None,
+                   **kwargs) -> TrainerBackend:
+    if kind == "subprocess":
+        return SubprocessTrainer(model_type, data, readiness, **kwargs)
+    if kind == "in_process":
+        return InProcessTrainer(model_type, data, readiness, **kwargs)
+    if kind == "stub":
+        return StubTrainer(model_type, data, readiness, **kwargs)
+    raise ValueError(f"Unknown trainer backend: {kind}")
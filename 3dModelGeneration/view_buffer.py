@@ -0,0 +1,119 @@
+import io
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from PIL import Image
+
+
+class ViewBuffer:
+    """
+    Preallocated (views, height, width, 3) array holding the renders streamed by the trainer.
+    Each render is decoded once, straight into its slot, and handed to the diffusion model from memory.
+    put_async decodes on a worker thread, so the caller (the coordination server loop) never decodes PNGs;
+    has() and image() wait for the pending decode of their view.
+    """
+
+    def __init__(self, filenames, height: int = 512, width: int = 512, decode_workers: int = 2):
+        self.index = {filename: i for i, filename in enumerate(filenames)}
+        self.images = np.zeros((len(self.index), height, width, 3), dtype=np.uint8)
+        self.filled = np.zeros(len(self.index), dtype=bool)
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=decode_workers, thread_name_prefix="decoder")
+        self._pending = {}
+
+    def reset(self):
+        self.flush()
+        with self._lock:
+            self.filled[:] = False
+
+    def _put_logged(self, filename: str, data: bytes):
+        # A render that fails to decode stays unfilled, readers fall back to the file on disk
+        try:
+            self.put(filename, data)
+        except Exception as e:
+            print(f"Could not decode the render {filename}: {e}")
+
+    def put_async(self, filename: str, data: bytes):
+        future = self._executor.submit(self._put_logged, filename, data)
+        with self._lock:
+            self._pending[filename] = future
+        return future
+
+    def _wait(self, filename: str):
+        with self._lock:
+            future = self._pending.pop(filename, None)
+        if future is not None:
+            future.result()
+
+    def flush(self):
+        """
+        Blocks until every pending decode is done.
+        """
+        with self._lock:
+            pending, self._pending = list(self._pending.values()), {}
+        for future in pending:
+            future.result()
+
+    def put(self, filename: str, data: bytes):
+        i = self.index[filename]
+        height, width = self.images.shape[1:3]
+        with Image.open(io.BytesIO(data)) as image:
+            image = image.convert("RGB")
+            if image.size != (width, height):
+                image = image.resize((width, height))
+            with self._lock:
+                self.images[i] = np.asarray(image)
+                self.filled[i] = True
+
+    def has(self, filename: str) -> bool:
+        self._wait(filename)
+        return bool(self.filled[self.index[filename]])
+
+    def image(self, filename: str) -> Image.Image:
+        self._wait(filename)
+        with self._lock:
+            return Image.fromarray(self.images[self.index[filename]])
+
+
+    def close(self):
+        self.flush()
+        self._executor.shutdown()
+
+
+class AsyncFileWriter:
+    """
+    Writes already encoded images to disk on a small thread pool, off the critical path.
+    """
+
+    def __init__(self, max_workers: int = 4):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="writer")
+        self._pending = []
+        self._lock = threading.Lock()
+
+    def _write(self, path, data):
+        # Write next to the target and rename, so readers never see a partial file
+        temp_path = f"{path}.part"
+        with open(temp_path, "wb") as f:
+            f.write(data)
+        os.replace(temp_path, path)
+
+    def submit(self, path: str, data: bytes):
+        future = self._executor.submit(self._write, path, data)
+        with self._lock:
+            self._pending.append(future)
+        return future
+
+    def flush(self):
+        """
+        Blocks until every submitted write is on disk, re-raising the first error.
+        """
+        with self._lock:
+            pending, self._pending = self._pending, []
+        for future in pending:
+            future.result()
+
+    def close(self):
+        self.flush()
+        self._executor.shutdown()
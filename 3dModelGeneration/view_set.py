@@ -0,0 +1,150 @@
+import json
+import os
+
+import numpy as np
+
+INTRINSICS = ["camera_angle_x", "camera_angle_y", "fl_x", "fl_y", "cx", "cy", "w", "h", "scale", "aabb_scale"]
+
+
+class TrainElement:
+    def __init__(self, prospective: str, filename: str, init_image_name: str):
+        self.prospective = prospective
+        self.filename = filename
+        self.init_image_name = init_image_name
+        self.nerf_output_image_name = f"output_{filename}"
+
+
+def perspective_from_filename(filename: str) -> str:
+    """
+    "back_right_top.png" -> "Back Right Top", the top camera is saved as "top_camera.png".
+    """
+    stem = os.path.splitext(os.path.basename(filename))[0]
+    if stem.endswith("_camera"):
+        stem = stem[:-len("_camera")]
+    return " ".join(word.capitalize() for word in stem.split("_"))
+
+
+def token_from_perspective(perspective: str) -> str:
+    """
+    The tokenized model was trained with left and right seen from the object: "Right Top" -> "<left_top>".
+    """
+    swap = {"left": "right", "right": "left"}
+    words = [swap.get(word, word) for word in perspective.lower().split()]
+    return f"<{'_'.join(words)}>"
+
+
+def init_image_from_filename(filename: str) -> str:
+    stem = os.path.splitext(os.path.basename(filename))[0]
+    if stem.endswith("_camera"):
+        stem = stem[:-len("_camera")]
+    return f"init_{stem}.png"
+
+
+class ViewSet:
+    """
+    The cameras of the reconstruction, stored as arrays: one row per view for the names and
+    a (views, 4, 4) float32 array for the camera-to-world poses, plus the shared intrinsics.
+    Everything the pipeline needs per view (TrainElements, prompts, expected renders,
+    transforms files) is derived from it.
+    """
+
+    def __init__(self, perspectives, filenames, poses, intrinsics: dict, tokens=None, init_images=None):
+        self.perspectives = np.asarray(perspectives, dtype=object)
+        self.filenames = np.asarray(filenames, dtype=object)
+        self.poses = np.asarray(poses, dtype=np.float32).reshape(-1, 4, 4)
+        self.intrinsics = dict(intrinsics)
+        self.tokens = np.asarray(tokens if tokens is not None else
+                                 [token_from_perspective(p) for p in self.perspectives], dtype=object)
+        self.init_images = np.asarray(init_images if init_images is not None else
+                                      [init_image_from_filename(f) for f in self.filenames], dtype=object)
+
+        if len(set(self.filenames)) != len(self.filenames):
+            raise ValueError("Every view needs its own filename")
+        if not len(self.perspectives) == len(self.filenames) == len(self.poses):
+            raise ValueError("Perspectives, filenames and poses must have one entry per view")
+
+    def __len__(self):
+        return len(self.filenames)
+
+    @classmethod
+    def from_transforms(cls, path: str):
+        """
+        Loads the views from a nerfstudio transforms file. Frames may name their "perspective" and "token",
+        otherwise they are derived from the file name.
+        """
+        with open(path) as f:
+            transforms = json.load(f)
+        frames = transforms["frames"]
+        filenames = [os.path.basename(frame["file_path"]) for frame in frames]
+        perspectives = [frame.get("perspective", perspective_from_filename(name))
+                        for frame, name in zip(frames, filenames)]
+        tokens = [frame.get("token", token_from_perspective(perspective))
+                  for frame, perspective in zip(frames, perspectives)]
+        poses = np.array([frame["transform_matrix"] for frame in frames], dtype=np.float32)
+        intrinsics = {key: transforms[key] for key in INTRINSICS if key in transforms}
+        return cls(perspectives, filenames, poses, intrinsics, tokens=tokens)
+
+    @classmethod
+    def from_yaml(cls, path: str):
+        """
+        YAML view set: a "transforms" file for the poses and intrinsics, and optionally a "views"
+        list overriding perspective, token and init_image per filename.
+        """
+        import yaml
+
+        with open(path) as f:
+            definition = yaml.safe_load(f)
+        base = os.path.dirname(os.path.abspath(path))
+        view_set = cls.from_transforms(os.path.join(base, definition["transforms"]))
+
+        overrides = {view["filename"]: view for view in definition.get("views", [])}
+        for i, filename in enumerate(view_set.filenames):
+            view = overrides.get(filename, {})
+            if "perspective" in view:
+                view_set.perspectives[i] = view["perspective"]
+                view_set.tokens[i] = token_from_perspective(view["perspective"])
+            if "token" in view:
+                view_set.tokens[i] = view["token"]
+            if "init_image" in view:
+                view_set.init_images[i] = view["init_image"]
+        return view_set
+
+    @classmethod
+    def load(cls, path: str):
+        if path.endswith((".yaml", ".yml")):
+            return cls.from_yaml(path)
+        return cls.from_transforms(path)
+
+    def train_elements(self, tokenized: bool) -> dict:
+        """
+        The per-view TrainElements, keyed by the prompt word of the model (token or natural perspective).
+        """
+        keys = self.tokens if tokenized else self.perspectives
+        return {
+            str(key): TrainElement(str(perspective), str(filename), str(init_image))
+            for key, perspective, filename, init_image
+            in zip(keys, self.perspectives, self.filenames, self.init_images)
+        }
+
+    def prompts(self, tokenized: bool, template: str = "yellow rubber duck seen from {}"):
+        keys = self.tokens if tokenized else self.perspectives
+        return [template.format(key) for key in keys]
+
+    def expected_renders(self):
+        return set(self.filenames.tolist())
+
+    def to_transforms(self, image_folder: str = ".") -> dict:
+        transforms = dict(self.intrinsics)
+        transforms["frames"] = [
+            {
+                "file_path": f"{image_folder}/{filename}",
+                "sharpness": 1.0,
+                "transform_matrix": pose.tolist(),
+            }
+            for filename, pose in zip(self.filenames, self.poses.astype(np.float64))
+        ]
+        return transforms
+
+    def write_transforms(self, path: str, image_folder: str = "."):
+        with open(path, "w") as f:
+            json.dump(self.to_transforms(image_folder), f, indent=4)
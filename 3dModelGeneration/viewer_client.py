@@ -0,0 +1,115 @@
+import asyncio
+import threading
+import time
+
+import websockets
+
+
+def default_subprotocol():
+    """
+    The viser based viewer only accepts clients speaking its own subprotocol, named after its version.
+    """
+    try:
+        import viser
+    except ImportError:
+        return None
+    return f"viser-v{viser.__version__}"
+
+
+class HeadlessViewerTrigger:
+    """
+    Connects to the viewer websocket directly, without a browser.
+    The forked viewer starts rendering the training cameras as soon as a client is connected,
+    so the connection is simply kept open until the renders have been received.
+    """
+
+    def __init__(self, url: str = "ws://localhost:7007", retry_interval: float = 0.5, subprotocol: str = None):
+        self.url = url
+        self.retry_interval = retry_interval
+        self.subprotocol = subprotocol if subprotocol is not None else default_subprotocol()
+        self.connected = threading.Event()
+        self._closed = threading.Event()
+        self._thread = None
+
+    async def _run(self, deadline):
+        subprotocols = [self.subprotocol] if self.subprotocol else None
+        while not self._closed.is_set() and (self.connected.is_set() or time.monotonic() < deadline):
+            try:
+                async with websockets.connect(self.url, subprotocols=subprotocols, max_size=None) as websocket:
+                    self.connected.set()
+                    while not self._closed.is_set():
+                        try:
+                            # Drain the scene updates sent by the viewer, they are not needed here
+                            await asyncio.wait_for(websocket.recv(), timeout=self.retry_interval)
+                        except asyncio.TimeoutError:
+                            continue
+            except (OSError, websockets.exceptions.WebSocketException):
+                # The viewer is not listening yet (or dropped us), try again shortly
+                await asyncio.sleep(self.retry_interval)
+
+    def connect(self, timeout: float) -> bool:
+        """
+        Starts the client on a background thread and waits until it is connected or the timeout expires.
+        """
+        deadline = time.monotonic() + timeout
+        self._thread = threading.Thread(target=lambda: asyncio.run(self._run(deadline)), daemon=True)
+        self._thread.start()
+        return self.connected.wait(timeout)
+
+    def close(self):
+        self._closed.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+
+class SeleniumViewerTrigger:
+    """
+    Legacy trigger: opens the viewer page in Chrome, waits for it to connect and quits the browser.
+    """
+
+    def __init__(self, url: str = "http://localhost:7007", retry_interval: float = 10, settle_time: float = 10):
+        self.url = url
+        self.retry_interval = retry_interval
+        self.settle_time = settle_time
+        self.driver = None
+
+    def connect(self, timeout: float) -> bool:
+        from selenium import webdriver
+        from selenium.webdriver.chrome.service import Service as ChromeService
+        from selenium.webdriver.chrome.options import Options
+        from selenium.common.exceptions import WebDriverException
+        from webdriver_manager.chrome import ChromeDriverManager
+
+        # Use webdriver_manager to install and configure ChromeDriver
+        self.driver = webdriver.Chrome(service=ChromeService(ChromeDriverManager().install()), options=Options())
+
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            print("Connecting to the browser...")
+            try:
+                self.driver.get(self.url)
+                break
+            except WebDriverException:
+                print("Unable to connect to the site, retrying...")
+                time.sleep(self.retry_interval)
+        else:
+            self.close()
+            return False
+
+        time.sleep(self.settle_time)
+        self.close()
+        return True
+
+    def close(self):
+        if self.driver is not None:
+            self.driver.quit()
+            self.driver = None
+
+
+def create_viewer_trigger(kind: str, port: int = 7007, host: str = "localhost"):
+    if kind == "selenium":
+        return SeleniumViewerTrigger(url=f"http://{host}:{port}")
+    if kind == "websocket":
+        return HeadlessViewerTrigger(url=f"ws://{host}:{port}")
+    raise ValueError(f"Unknown viewer trigger: {kind}")
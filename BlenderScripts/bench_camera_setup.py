@@ -0,0 +1,108 @@
+"""
+Times the camera setup and teardown of one environment for 1, 10 and 100 cameras per category
+(17, 170 and 1700 views), without rendering. Compares three approaches. "constraints" is the previous
+one: a camera, a Target empty and a TRACK_TO / DAMPED_TRACK constraint per view, created with operators.
+"matrices" creates one camera per view from its camera_poses matrix. "single" keeps one camera and
+moves it to every pose. Setup covers the creation and the placement of every view, up to reading its
+transforms.json frame. Teardown is clear_cameras, for "constraints" as it was (select, delete operator).
+The report also gives the largest difference between the constraint frames and the single-camera ones.
+
+    blender --background "rubber duck blender.blend" --python bench_camera_setup.py -- [--counts 1 10 100] [--repeats 3]
+"""
+import argparse
+import os
+import sys
+import time
+
+import bpy
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import blenderScripting
+from camera_poses import CATEGORIES, DAMPED_CATEGORIES, sample_angles, spherical_positions
+
+
+def constraint_teardown():
+    # clear_cameras as it was: select, then the delete operator
+    bpy.ops.object.select_all(action="DESELECT")
+    for obj in bpy.context.scene.objects:
+        if obj.type == "CAMERA" or (obj.type == "EMPTY" and "Target" in obj.name):
+            obj.select_set(True)
+    bpy.ops.object.delete()
+    blenderScripting.cameras.clear()
+
+
+def constraint_setup(num_camera_per_category, radius, center, noise_amount, seed):
+    # create_cameras_by_category as it was, on the same angles as generate_poses
+    constraint_teardown()
+    categories, theta_code, alpha = sample_angles(num_camera_per_category, noise_amount, seed)
+    positions = spherical_positions(theta_code, alpha, radius, center)
+    for i, (category, position) in enumerate(zip(categories, positions)):
+        name = f"Camera_{category}_{i + 1}"
+        damped = category in DAMPED_CATEGORIES
+        blenderScripting.create_camera(name=name, location=tuple(position), rotation=(0, 0, 0), center=center,
+                                       sensor_fit="HORIZONTAL", flip=damped, damped=damped)
+        blenderScripting.cameras.append(name)
+    # The constraints are only evaluated with the depsgraph
+    bpy.context.view_layer.update()
+    frames = []
+    for name in blenderScripting.cameras:
+        camera = bpy.data.objects[name]
+        bpy.context.scene.camera = camera
+        frames.append(blenderScripting.get_frame_data(camera, name)["transform_matrix"])
+    return frames
+
+
+def pose_setup(num_camera_per_category, radius, center, noise_amount, seed):
+    blenderScripting.create_cameras_by_category(num_camera_per_category, radius, center, seed=seed)
+    frames = []
+    for index in range(blenderScripting.view_count()):
+        name, camera = blenderScripting.view_camera(index)
+        bpy.context.scene.camera = camera
+        frames.append(blenderScripting.get_frame_data(camera, name)["transform_matrix"])
+    return frames
+
+
+def bench(mode, count, args):
+    scene = bpy.context.scene
+    scene.noise_amount = args.noise
+    scene.single_camera = mode == "single"
+    setup = constraint_setup if mode == "constraints" else pose_setup
+    teardown = constraint_teardown if mode == "constraints" else blenderScripting.clear_cameras
+    setup_times, teardown_times = [], []
+    frames = None
+    for _ in range(args.repeats):
+        start = time.perf_counter()
+        frames = setup(count, args.radius, tuple(args.center), args.noise, args.seed)
+        setup_times.append(time.perf_counter() - start)
+        start = time.perf_counter()
+        teardown()
+        teardown_times.append(time.perf_counter() - start)
+    return min(setup_times), min(teardown_times), np.array(frames)
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Camera setup and teardown per approach")
+    parser.add_argument("--counts", type=int, nargs="+", default=[1, 10, 100], help="Cameras per category")
+    parser.add_argument("--repeats", type=int, default=3, help="Best of this many runs")
+    parser.add_argument("--radius", type=float, default=10.0)
+    parser.add_argument("--center", type=float, nargs=3, default=(0.0, 0.0, 0.0))
+    parser.add_argument("--noise", type=float, default=5.0)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    blenderScripting.register()
+    print(f"{'approach':<14}{'per cat':>8}{'views':>7}{'setup ms':>11}{'teardown ms':>13}{'total ms':>11}{'speedup':>9}")
+    for count in args.counts:
+        results = {mode: bench(mode, count, args) for mode in ("constraints", "matrices", "single")}
+        baseline = sum(results["constraints"][:2])
+        for mode, (setup, teardown, _) in results.items():
+            print(f"{mode:<14}{count:>8}{count * len(CATEGORIES):>7}{setup * 1e3:>11.1f}{teardown * 1e3:>13.1f}"
+                  f"{(setup + teardown) * 1e3:>11.1f}{baseline / (setup + teardown):>8.1f}x")
+        difference = np.abs(results["constraints"][2] - results["single"][2]).max()
+        print(f"{'':<14}largest frame difference, constraints vs single: {difference:.2e}")
+    blenderScripting.unregister()
+
+
+if __name__ == "__main__":
+    main(sys.argv[sys.argv.index("--") + 1:] if "--" in sys.argv else [])
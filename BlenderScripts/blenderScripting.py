@@ -4,9 +4,17 @@ import math
 import json
 import os
 import csv
-import random
+import sys
+import argparse
+from mathutils import Matrix
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from camera_poses import generate_poses
 
 cameras = []
+# Single-camera mode: one camera object, moved to every (name, camera-to-world matrix) pose before its render
+SINGLE_CAMERA_NAME = "Camera_Single"
+poses = []
 
 # ── UPDATED categorize_camera ──
 # Here we subtract 90° from the computed alpha (and normalize) so that the original “Back” (alpha≈0)
@@ -213,6 +221,12 @@ def add_properties():
         min=0.0,
     )
 
+    bpy.types.Scene.single_camera = bpy.props.BoolProperty(
+        name="Single Camera",
+        description="Render every view with one camera moved to each pose instead of one camera per view",
+        default=False,
+    )
+
 
 def create_camera(name: str, location: tuple, rotation: tuple, center: tuple,
                   sensor_fit: Literal["HORIZONTAL", "VERTICAL"] = "HORIZONTAL", flip=False, damped=False):
@@ -261,84 +275,48 @@ def render_camera(camera, filepath):
     return get_frame_data(camera, filepath)
 
 
-# ── UPDATED create_cameras_by_category ──
-# Now we only spawn cameras in the upper half.
-# The allowed horizontal intervals are defined (in terms of the original alpha)
-# so that, after subtracting 90°, the mapping matches the new desired labels.
-def create_cameras_by_category(num_camera_per_category, radius, center):
+def create_camera_from_matrix(name: str, matrix, sensor_fit: Literal["HORIZONTAL", "VERTICAL"] = "HORIZONTAL"):
+    # No operator, no target empty and no constraint: the pose comes from camera_poses
+    data = bpy.data.cameras.new(name)
+    data.sensor_fit = sensor_fit
+    camera = bpy.data.objects.new(name, data)
+    bpy.context.scene.collection.objects.link(camera)
+    camera.matrix_world = Matrix(matrix.tolist())
+    return camera
+
+
+# Only the upper half of the sphere; the categories and their angle ranges are in camera_poses.
+def create_cameras_by_category(num_camera_per_category, radius, center, seed=None):
     clear_cameras()
     scene = bpy.context.scene
-    noise_amount = scene.noise_amount
-    camera_count = 1
-
-    # Definizione delle categorie per l'emisfero superiore con i relativi range verticali (theta_code)
-    # e orizzontali (alpha) definiti in termini dell'angolo originale.
-    horizontal_categories = {
-        "Back":         (-30, 30, [(67.5, 112.5)]),       # Centro = 90°
-        "Back Right":   (-30, 30, [(112.5, 157.5)]),      # Centro = 135°
-        "Right":        (-30, 30, [(157.5, 202.5)]),      # Centro = 180°
-        "Front Right":  (-30, 30, [(202.5, 247.5)]),      # Centro = 225°
-        "Front":        (-30, 30, [(247.5, 292.5)]),      # Centro = 270°
-        "Front Left":   (-30, 30, [(-67.5, -22.5)]),      # Centro = -45°
-        "Left":         (-30, 30, [(-22.5, 22.5)]),       # Centro = 0°
-        "Back Left":    (-30, 30, [(22.5, 67.5)])         # Centro = 45°
-    }
-    moderate_top = { "Top " + k: (30, 60, v[2]) for k, v in horizontal_categories.items() }
-    # Per l'estreme top, spawniamo solo telecamere nella fascia "Front" (range originale [(247.5, 292.5)]).
-    extreme_top = { "Top": (80, 100, [(247.5, 292.5)]) }
-
-    # Combina le categorie (solo emisfero superiore)
-    all_categories = {}
-    all_categories.update(horizontal_categories)
-    all_categories.update(moderate_top)
-    all_categories.update(extreme_top)
-
-    for cat, (theta_min, theta_max, alpha_intervals) in all_categories.items():
-        for i in range(num_camera_per_category):
-            # Calcola il centro del range verticale e aggiunge rumore.
-            theta_center = (theta_min + theta_max) / 2.0
-            theta_code = theta_center + random.uniform(-noise_amount, noise_amount)
-            # Per l'angolo orizzontale, sceglie un intervallo, ne prende il centro e aggiunge rumore.
-            chosen_interval = random.choice(alpha_intervals)
-            alpha_center = (chosen_interval[0] + chosen_interval[1]) / 2.0
-            alpha_val = alpha_center + random.uniform(-noise_amount, noise_amount)
-            
-            # Se siamo nella categoria "Top" (estreme top) e theta_code > 90, attiva il flip.
-            flip = False
-            damped = False
-            if cat == "Top":
-                damped = True
-                #if theta_code > 90:
-                flip = True
-
-            # Converte theta_code nell'angolo polare (theta_polar) usato per le coordinate sferiche.
-            theta_polar = 90 - theta_code
-            theta_polar_rad = math.radians(theta_polar)
-            alpha_rad = math.radians(alpha_val)
-
-            # Calcola la posizione sulla sfera (distanza costante).
-            x = center[0] + radius * math.sin(theta_polar_rad) * math.cos(alpha_rad)
-            y = center[1] + radius * math.sin(theta_polar_rad) * math.sin(alpha_rad)
-            z = center[2] + radius * math.cos(theta_polar_rad)
-
-            cam_name = f"Camera_{cat}_{camera_count}"
-            create_camera(name=cam_name, location=(x, y, z), rotation=(0, 0, 0),
-                          center=center, sensor_fit="HORIZONTAL", flip=flip, damped=damped)
-            cameras.append(cam_name)
-            camera_count += 1
+    names, matrices = generate_poses(num_camera_per_category, radius, tuple(center), scene.noise_amount, seed)
+    if scene.single_camera:
+        create_camera_from_matrix(SINGLE_CAMERA_NAME, matrices[0], sensor_fit="HORIZONTAL")
+        poses.extend(zip(names, matrices))
+        return
+    for name, matrix in zip(names, matrices):
+        create_camera_from_matrix(name, matrix, sensor_fit="HORIZONTAL")
+        cameras.append(name)
 
 
+def view_count():
+    return len(poses) if poses else len(cameras)
 
-def render_all_cameras(num_camera_per_category, radius, center, base_path):
-    scene = bpy.context.scene
-    env_path = scene.env_path
-    env_name = os.path.splitext(os.path.basename(env_path))[0]
 
-    env_render_path = os.path.join(base_path, env_name)
-    if not os.path.exists(env_render_path):
-        os.makedirs(env_render_path)
+def view_camera(index):
+    """
+    Name and camera object of a view; in single-camera mode the camera is first moved to the view pose.
+    """
+    if poses:
+        name, matrix = poses[index]
+        camera = bpy.data.objects[SINGLE_CAMERA_NAME]
+        camera.matrix_world = Matrix(matrix.tolist())
+        return name, camera
+    return cameras[index], bpy.data.objects[cameras[index]]
 
-    frames = []
+
+def camera_intrinsics(radius):
+    scene = bpy.context.scene
     cam = bpy.data.cameras[0]
     focal_length = cam.lens
     sensor_width = cam.sensor_width
@@ -357,7 +335,7 @@ def render_all_cameras(num_camera_per_category, radius, center, base_path):
     fl_x = (focal_length / sensor_width) * image_width
     fl_y = (focal_length / sensor_height) * image_height
 
-    camera_data = {
+    return {
         "camera_angle_x": camera_angle_x,
         "camera_angle_y": camera_angle_y,
         "fl_x": fl_x,
@@ -370,10 +348,23 @@ def render_all_cameras(num_camera_per_category, radius, center, base_path):
         "aabb_scale": 16,
     }
 
+
+def render_all_cameras(num_camera_per_category, radius, center, base_path):
+    scene = bpy.context.scene
+    env_path = scene.env_path
+    env_name = os.path.splitext(os.path.basename(env_path))[0]
+
+    env_render_path = os.path.join(base_path, env_name)
+    if not os.path.exists(env_render_path):
+        os.makedirs(env_render_path)
+
+    frames = []
+    camera_data = camera_intrinsics(radius)
+
     csv_filepath = os.path.join(base_path, "images.csv")
 
-    for c in cameras:
-        camera = bpy.data.objects[c]
+    for index in range(view_count()):
+        c, camera = view_camera(index)
         filepath = os.path.join("images", f"render_{c}.png")
         full_filepath = os.path.join(env_render_path, filepath)
         images_folder = os.path.join(env_render_path, "images")
@@ -390,12 +381,17 @@ def render_all_cameras(num_camera_per_category, radius, center, base_path):
 
 
 def clear_cameras():
-    bpy.ops.object.select_all(action="DESELECT")
-    for obj in bpy.context.scene.objects:
+    # Removed through bpy.data: the delete operator slows down with the number of objects.
+    # The camera data created by this script goes too, so repeated environments leave no orphans.
+    created = set(cameras) | {SINGLE_CAMERA_NAME}
+    for obj in list(bpy.context.scene.objects):
         if obj.type == "CAMERA" or (obj.type == "EMPTY" and "Target" in obj.name):
-            obj.select_set(True)
-    bpy.ops.object.delete()
+            data = obj.data if obj.name in created else None
+            bpy.data.objects.remove(obj, do_unlink=True)
+            if data is not None and data.users == 0:
+                bpy.data.cameras.remove(data)
     cameras.clear()
+    poses.clear()
 
 
 class CAMERA_PT_SphericalSetupPanel(bpy.types.Panel):
@@ -421,6 +417,7 @@ class CAMERA_PT_SphericalSetupPanel(bpy.types.Panel):
         layout.prop(context.scene, "sphere_center")
         layout.prop(context.scene, "renderHalf")
         layout.prop(context.scene, "noise_amount")
+        layout.prop(context.scene, "single_camera")
         layout.operator("camera.create_spherical_cameras", text="Create Cameras")
         layout.operator("camera.render_spherical_cameras", text="Render All Cameras")
         layout.operator("camera.clear_spherical_cameras", text="Clear Cameras")
@@ -544,7 +541,46 @@ def unregister():
     del bpy.types.Scene.renderHalf
     del bpy.types.Scene.sensor_width
     del bpy.types.Scene.noise_amount
+    del bpy.types.Scene.single_camera
+
+
+def render_shard(shard_path):
+    """
+    Worker side of render_farm.py: renders the (environment, camera index) items of a shard file.
+    The camera noise is seeded per environment, so every worker places the same cameras and only
+    renders its own indices.
+    """
+    import render_farm
+
+    shard = render_farm.load_shard(shard_path)
+    settings = shard["settings"]
+    scene = bpy.context.scene
+    scene.envs_base_path = settings["envs_base_path"]
+    scene.envs_max_depth = settings["envs_max_depth"]
+    scene.noise_amount = settings["noise_amount"]
+    scene.single_camera = settings.get("single_camera", False)
+    radius = settings["radius"]
+    center = settings["center"]
+
+    def open_environment(env):
+        clear_cameras()
+        cleanup_unused_images()
+        scene.env_path = env
+        seed = render_farm.environment_seed(settings["seed"], env)
+        create_cameras_by_category(settings["num_camera_per_category"], radius, center, seed=seed)
+        return camera_intrinsics(radius)
+
+    def render_view(env, index, env_dir):
+        name, camera = view_camera(index)
+        full_filepath = os.path.join(env_dir, "images", f"render_{name}.png")
+        return render_camera(camera, full_filepath)
+
+    render_farm.run_shard(shard, open_environment, render_view)
 
 
 if __name__ == "__main__":
     register()
+    if "--" in sys.argv:
+        parser = argparse.ArgumentParser(description="Render a shard of render_farm.py")
+        parser.add_argument("--shard", type=str, required=True, help="Shard file written by render_farm.py")
+        render_shard(parser.parse_args(sys.argv[sys.argv.index("--") + 1:]).shard)
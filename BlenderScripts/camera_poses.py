@@ -0,0 +1,149 @@
+"""
+Camera poses of create_cameras_by_category computed with NumPy, without Blender: all the
+camera-to-world matrices of a sphere are generated in one batch. The TRACK_TO poses match the frames
+Blender exported in transforms_internal.json (tests/test_camera_poses.py); the DAMPED_TRACK pose of the
+Top cameras has not been compared with Blender's matrix_world yet.
+
+    names, matrices = generate_poses(num_camera_per_category=4, radius=10, center=(0, 0, 0), noise_amount=5, seed=0)
+"""
+import numpy as np
+
+WORLD_UP = np.array([0.0, 0.0, 1.0])
+
+# Upper hemisphere only: vertical range (theta_code, elevation in degrees) and horizontal intervals
+# (alpha, in terms of the original angle, so that subtracting 90° gives the labels of categorize_camera).
+HORIZONTAL_CATEGORIES = {
+    "Back":         (-30, 30, [(67.5, 112.5)]),       # Centro = 90°
+    "Back Right":   (-30, 30, [(112.5, 157.5)]),      # Centro = 135°
+    "Right":        (-30, 30, [(157.5, 202.5)]),      # Centro = 180°
+    "Front Right":  (-30, 30, [(202.5, 247.5)]),      # Centro = 225°
+    "Front":        (-30, 30, [(247.5, 292.5)]),      # Centro = 270°
+    "Front Left":   (-30, 30, [(-67.5, -22.5)]),      # Centro = -45°
+    "Left":         (-30, 30, [(-22.5, 22.5)]),       # Centro = 0°
+    "Back Left":    (-30, 30, [(22.5, 67.5)])         # Centro = 45°
+}
+CATEGORIES = dict(HORIZONTAL_CATEGORIES)
+CATEGORIES.update({"Top " + k: (30, 60, v[2]) for k, v in HORIZONTAL_CATEGORIES.items()})
+# Extreme top: only in the "Front" interval, tracked with DAMPED_TRACK and rolled by 180°
+CATEGORIES["Top"] = (80, 100, [(247.5, 292.5)])
+DAMPED_CATEGORIES = {"Top"}
+
+
+def spherical_positions(theta_code, alpha, radius, center):
+    """
+    Positions on the sphere from elevations and horizontal angles in degrees, shape (n, 3).
+    """
+    theta_polar = np.radians(90 - np.asarray(theta_code, dtype=np.float64))
+    alpha = np.radians(np.asarray(alpha, dtype=np.float64))
+    offsets = np.stack([np.sin(theta_polar) * np.cos(alpha),
+                        np.sin(theta_polar) * np.sin(alpha),
+                        np.cos(theta_polar)], axis=-1)
+    return np.asarray(center, dtype=np.float64) + radius * offsets
+
+
+def _matrices(rotations, positions):
+    matrices = np.zeros((len(positions), 4, 4))
+    matrices[:, :3, :3] = rotations
+    matrices[:, :3, 3] = positions
+    matrices[:, 3, 3] = 1.0
+    return matrices
+
+
+def _normalize(vectors):
+    return vectors / np.linalg.norm(vectors, axis=-1, keepdims=True)
+
+
+def track_to(positions, target, up=WORLD_UP):
+    """
+    TRACK_TO with track axis -Z and up axis Y: the camera looks at the target, with its Y axis as
+    close as possible to the world up vector. Returns (n, 4, 4) camera-to-world matrices.
+    """
+    positions = np.asarray(positions, dtype=np.float64)
+    z_axis = _normalize(positions - np.asarray(target, dtype=np.float64))
+    x_axis = np.cross(up, z_axis)
+    # Looking straight along the up vector: keep the world X axis, as Blender does
+    degenerate = np.linalg.norm(x_axis, axis=-1) < 1e-9
+    x_axis[degenerate] = [1.0, 0.0, 0.0]
+    x_axis = _normalize(x_axis)
+    y_axis = np.cross(z_axis, x_axis)
+    return _matrices(np.stack([x_axis, y_axis, z_axis], axis=-1), positions)
+
+
+def damped_track(positions, target, base_rotations):
+    """
+    DAMPED_TRACK with track axis -Z: the smallest rotation that turns the -Z axis of base_rotations
+    (n, 3, 3), the rotation of the camera before the constraint, towards the target.
+    """
+    positions = np.asarray(positions, dtype=np.float64)
+    base_rotations = np.asarray(base_rotations, dtype=np.float64)
+    current = -base_rotations[:, :, 2]
+    wanted = _normalize(np.asarray(target, dtype=np.float64) - positions)
+
+    axis = np.cross(current, wanted)
+    sin = np.linalg.norm(axis, axis=-1)
+    cos = np.einsum("ij,ij->i", current, wanted)
+    # Opposite directions: any perpendicular axis works, take the camera X axis
+    opposite = (sin < 1e-9) & (cos < 0)
+    axis[opposite] = base_rotations[opposite, :, 0]
+    sin[opposite] = 0.0
+    axis = np.where(sin[:, None] > 1e-9, axis / np.maximum(sin, 1e-12)[:, None], axis)
+
+    # Rodrigues: R = I + sin K + (1 - cos) K²
+    k = np.zeros((len(positions), 3, 3))
+    k[:, 0, 1], k[:, 0, 2] = -axis[:, 2], axis[:, 1]
+    k[:, 1, 0], k[:, 1, 2] = axis[:, 2], -axis[:, 0]
+    k[:, 2, 0], k[:, 2, 1] = -axis[:, 1], axis[:, 0]
+    rotations = np.eye(3) + sin[:, None, None] * k + (1 - cos)[:, None, None] * (k @ k)
+    return _matrices(rotations @ base_rotations, positions)
+
+
+def roll(angle_degrees, count):
+    """
+    Rotations about Z of rotation_euler = (0, 0, angle), shape (count, 3, 3).
+    """
+    c, s = np.cos(np.radians(angle_degrees)), np.sin(np.radians(angle_degrees))
+    return np.broadcast_to(np.array([[c, -s, 0.0], [s, c, 0.0], [0.0, 0.0, 1.0]]), (count, 3, 3)).copy()
+
+
+def sample_angles(num_camera_per_category, noise_amount=0.0, seed=None, categories=CATEGORIES):
+    """
+    The category, elevation and horizontal angle of every camera, in the order of create_cameras_by_category:
+    the centers of the ranges plus uniform noise in [-noise_amount, noise_amount].
+    """
+    rng = np.random.default_rng(seed)
+    names = list(categories)
+    count = len(names) * num_camera_per_category
+    category = np.repeat(np.arange(len(names)), num_camera_per_category)
+
+    theta_center = np.array([(v[0] + v[1]) / 2.0 for v in categories.values()])[category]
+    interval = (rng.random(count) * np.array([len(v[2]) for v in categories.values()])[category]).astype(int)
+    alpha_center = np.array([sum(categories[names[c]][2][i]) / 2.0 for c, i in zip(category, interval)])
+
+    theta_code = theta_center + rng.uniform(-noise_amount, noise_amount, count)
+    alpha = alpha_center + rng.uniform(-noise_amount, noise_amount, count)
+    return [names[c] for c in category], theta_code, alpha
+
+
+def generate_poses(num_camera_per_category, radius, center=(0.0, 0.0, 0.0), noise_amount=0.0, seed=None,
+                   categories=CATEGORIES):
+    """
+    Names (Camera_<category>_<count>) and (n, 4, 4) camera-to-world matrices of all the cameras.
+    """
+    camera_categories, theta_code, alpha = sample_angles(num_camera_per_category, noise_amount, seed, categories)
+    positions = spherical_positions(theta_code, alpha, radius, center)
+    matrices = track_to(positions, center)
+
+    damped = np.array([c in DAMPED_CATEGORIES for c in camera_categories])
+    if damped.any():
+        matrices[damped] = damped_track(positions[damped], center, roll(180, int(damped.sum())))
+
+    names = [f"Camera_{c}_{i + 1}" for i, c in enumerate(camera_categories)]
+    return names, matrices
+
+
+def to_frames(matrices, file_paths):
+    """
+    transforms.json frames, as written by get_frame_data.
+    """
+    return [{"file_path": path, "sharpness": 1.0, "transform_matrix": matrix.tolist()}
+            for path, matrix in zip(file_paths, matrices)]
@@ -0,0 +1,305 @@
+"""
+Renders the dataset with several headless Blender processes. Every (environment, camera) pair is a
+work item; the items are dealt round-robin to N shards, each shard runs in its own
+`blender --background` process (blenderScripting.py in shard mode), and the per-shard
+transforms.json and images.csv are merged at the end into the layout of "Render All Environments".
+
+    python render_farm.py --blender blender --blend "rubber duck blender.blend" --envs ./hdri --output ./renders --workers 4
+    python render_farm.py --envs ./hdri --output ./renders --workers 4 --fake      # no Blender needed
+
+Does not import bpy: the Blender side only provides open_environment and render_view to run_shard.
+"""
+import argparse
+import csv
+import json
+import multiprocessing
+import os
+import struct
+import subprocess
+import sys
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+from camera_poses import CATEGORIES, generate_poses, to_frames
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+SHARDS_FOLDER = "_shards"
+REPORT_NAME = "farm_report.json"
+
+
+def find_environments(base_path: str, max_depth: int = 1):
+    """
+    The .hdr/.exr files under base_path, relative to it, searched like get_env_items.
+    """
+    items = []
+
+    def recursive_search(directory, current_depth):
+        if current_depth > max_depth:
+            return
+        for entry in sorted(os.listdir(directory)):
+            full_path = os.path.join(directory, entry)
+            if os.path.isdir(full_path):
+                recursive_search(full_path, current_depth + 1)
+            elif entry.lower().endswith((".hdr", ".exr")):
+                items.append(os.path.relpath(full_path, base_path))
+
+    recursive_search(base_path, 1)
+    return items
+
+
+def env_name(env_path: str) -> str:
+    return os.path.splitext(os.path.basename(env_path))[0]
+
+
+def environment_seed(seed: int, env_path: str) -> int:
+    # Same cameras in every worker, different noise for every environment
+    return seed + zlib.crc32(env_path.encode())
+
+
+def plan_items(environments, cameras_per_environment: int):
+    return [[env, index] for env in environments for index in range(cameras_per_environment)]
+
+
+def shard_items(items, workers: int):
+    """
+    Deals the items round-robin, so every shard gets a similar share of every environment.
+    """
+    shards = [[] for _ in range(max(1, min(workers, len(items))))]
+    for i, item in enumerate(items):
+        shards[i % len(shards)].append(item)
+    return shards
+
+
+def write_shard(path: str, shard_index: int, items, settings: dict):
+    with open(path, "w") as f:
+        json.dump({"shard": shard_index, "items": items, "settings": settings}, f, indent=4)
+
+
+def load_shard(path: str) -> dict:
+    with open(path) as f:
+        return json.load(f)
+
+
+def shard_folder(output: str, shard_index: int) -> str:
+    return os.path.join(output, SHARDS_FOLDER, str(shard_index))
+
+
+def run_shard(shard: dict, open_environment, render_view):
+    """
+    Renders the items of a shard. open_environment(env) prepares the scene for an environment and
+    returns its intrinsics (the transforms.json fields without frames); render_view(env, index, env_dir)
+    renders one camera into env_dir/images and returns its frame. Per environment, the frames go to
+    <shard folder>/<env>/transforms.json with their camera indices, and the rows to <shard folder>/images.csv.
+    """
+    output = shard["settings"]["output"]
+    folder = shard_folder(output, shard["shard"])
+    os.makedirs(folder, exist_ok=True)
+
+    by_environment = {}
+    for env, index in shard["items"]:
+        by_environment.setdefault(env, []).append(index)
+
+    with open(os.path.join(folder, "images.csv"), "w", newline="") as csvfile:
+        writer = csv.writer(csvfile)
+        for env, indices in by_environment.items():
+            name = env_name(env)
+            env_dir = os.path.join(output, name)
+            os.makedirs(os.path.join(env_dir, "images"), exist_ok=True)
+
+            camera_data = dict(open_environment(env))
+            frames = []
+            for index in indices:
+                frame = render_view(env, index, env_dir)
+                frames.append(frame)
+                writer.writerow([frame["file_path"], name])
+            camera_data["frames"] = frames
+            camera_data["indices"] = indices
+
+            os.makedirs(os.path.join(folder, name), exist_ok=True)
+            with open(os.path.join(folder, name, "transforms.json"), "w") as f:
+                json.dump(camera_data, f, indent=4)
+
+
+def merge_shards(output: str, shard_count: int, environments):
+    """
+    Joins the shard results: one transforms.json per environment with the frames in camera order,
+    and the rows of every shard appended to <output>/images.csv in (environment, camera) order.
+    """
+    rows = []
+    for env in environments:
+        name = env_name(env)
+        camera_data = None
+        indexed_frames = []
+        for shard_index in range(shard_count):
+            path = os.path.join(shard_folder(output, shard_index), name, "transforms.json")
+            if not os.path.exists(path):
+                continue
+            with open(path) as f:
+                shard_data = json.load(f)
+            indexed_frames += zip(shard_data.pop("indices"), shard_data.pop("frames"))
+            camera_data = camera_data or shard_data
+        if camera_data is None:
+            print(f"No renders for {env}")
+            continue
+        indexed_frames.sort(key=lambda pair: pair[0])
+        camera_data["frames"] = [frame for _, frame in indexed_frames]
+        with open(os.path.join(output, name, "transforms.json"), "w") as f:
+            json.dump(camera_data, f, indent=4)
+        rows += [(name, index, frame["file_path"]) for index, frame in indexed_frames]
+
+    with open(os.path.join(output, "images.csv"), "a", newline="") as csvfile:
+        writer = csv.writer(csvfile)
+        for name, _, file_path in rows:
+            writer.writerow([file_path, name])
+    return len(rows)
+
+
+def blender_command(blender: str, blend_file: str, shard_path: str, threads: int = 0):
+    command = [blender, "--background", blend_file, "--python", os.path.join(SCRIPT_DIR, "blenderScripting.py")]
+    if threads:
+        command += ["--threads", str(threads)]
+    return command + ["--", "--shard", shard_path]
+
+
+def _png(width: int, height: int, rgb=(255, 200, 0)) -> bytes:
+    # Smallest valid RGB PNG, so the fake renders can be opened like real ones
+    def chunk(kind, data):
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data) & 0xFFFFFFFF)
+
+    raw = b"".join(b"\x00" + bytes(rgb) * width for _ in range(height))
+    header = struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)
+    return b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", header) + chunk(b"IDAT", zlib.compress(raw)) + chunk(b"IEND", b"")
+
+
+def fake_shard(shard_path: str, seconds_per_view: float = 0.01):
+    """
+    Stand-in for a Blender worker: the same files and camera poses, with a flat image per view.
+    """
+    shard = load_shard(shard_path)
+    settings = shard["settings"]
+    radius = settings["radius"]
+    poses = {}
+
+    def open_environment(env):
+        poses[env] = generate_poses(settings["num_camera_per_category"], radius, settings["center"],
+                                    settings["noise_amount"], environment_seed(settings["seed"], env))
+        return {"camera_angle_x": 0.69, "camera_angle_y": 0.69, "fl_x": 711.1, "fl_y": 711.1,
+                "cx": 256.0, "cy": 256.0, "w": 512, "h": 512, "scale": 2 / radius, "aabb_scale": 16}
+
+    def render_view(env, index, env_dir):
+        time.sleep(seconds_per_view)
+        names, matrices = poses[env]
+        file_path = os.path.join(env_dir, "images", f"render_{names[index]}.png")
+        with open(file_path, "wb") as f:
+            f.write(_png(8, 8))
+        return to_frames(matrices[index:index + 1], [file_path])[0]
+
+    run_shard(shard, open_environment, render_view)
+
+
+def run_worker(shard_path: str, args):
+    """
+    Runs one shard in its own process, a fake one started like the fake jobs of batch_runner.
+    A worker that cannot start is reported as failed instead of stopping the other shards.
+    """
+    start = time.perf_counter()
+    error = None
+    try:
+        if args.fake:
+            process = multiprocessing.get_context("spawn").Process(target=fake_shard,
+                                                                   args=(shard_path, args.fake_seconds_per_view))
+            process.start()
+            process.join()
+            returncode = process.exitcode
+        else:
+            log_path = os.path.splitext(shard_path)[0] + ".log"
+            with open(log_path, "w") as log:
+                returncode = subprocess.run(blender_command(args.blender, args.blend, shard_path, args.threads),
+                                            stdout=log, stderr=subprocess.STDOUT).returncode
+    except Exception as e:
+        returncode, error = 1, f"{type(e).__name__}: {e}"
+    seconds = time.perf_counter() - start
+    print(f"[{os.path.basename(shard_path)}] finished in {seconds:.1f}s with code {returncode}"
+          + (f" ({error})" if error else ""))
+    return {"shard": shard_path, "seconds": seconds, "returncode": returncode, "error": error}
+
+
+def run_farm(args):
+    environments = find_environments(args.envs, args.max_depth)
+    if not environments:
+        print(f"No environments found in {args.envs}")
+        return 1
+
+    output = os.path.abspath(args.output)
+    items = plan_items(environments, len(CATEGORIES) * args.cameras_per_category)
+    shards = shard_items(items, args.workers)
+    settings = {
+        "output": output,
+        "envs_base_path": os.path.abspath(args.envs),
+        "envs_max_depth": args.max_depth,
+        "num_camera_per_category": args.cameras_per_category,
+        "radius": args.radius,
+        "center": list(args.center),
+        "noise_amount": args.noise,
+        "seed": args.seed,
+        "single_camera": args.single_camera,
+    }
+    report_folder = os.path.join(output, SHARDS_FOLDER)
+    os.makedirs(report_folder, exist_ok=True)
+    report = {"views": len(items), "environments": len(environments), "workers": len(shards),
+              "shards": [], "rendered": 0, "elapsed": 0.0, "error": None}
+
+    print(f"{len(items)} views of {len(environments)} environments on {len(shards)} workers")
+    start = time.perf_counter()
+    # A failing step still ends with a report: what was rendered and which shard or step failed
+    try:
+        shard_paths = []
+        for i, shard in enumerate(shards):
+            path = os.path.join(report_folder, f"shard_{i}.json")
+            write_shard(path, i, shard, settings)
+            shard_paths.append(path)
+        with ThreadPoolExecutor(max_workers=len(shards)) as executor:
+            report["shards"] = list(executor.map(lambda path: run_worker(path, args), shard_paths))
+        report["rendered"] = merge_shards(output, len(shards), environments)
+    except Exception as e:
+        report["error"] = f"{type(e).__name__}: {e}"
+    elapsed = report["elapsed"] = time.perf_counter() - start
+    rendered = report["rendered"]
+    with open(os.path.join(report_folder, REPORT_NAME), "w") as f:
+        json.dump(report, f, indent=4)
+
+    print("-------------------------------------")
+    print(f"Rendered {rendered}/{len(items)} views in {elapsed:.1f}s ({rendered / max(elapsed, 1e-9):.2f} views/s)")
+    if report["error"]:
+        print(f"Farm failed: {report['error']}")
+    print(f"Report: {os.path.join(report_folder, REPORT_NAME)}")
+    print("-------------------------------------")
+    succeeded = report["error"] is None and all(shard["returncode"] == 0 for shard in report["shards"])
+    return 0 if succeeded and rendered == len(items) else 1
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Render every environment with parallel headless Blender workers")
+    parser.add_argument("--blender", type=str, default="blender", help="Blender executable (default: blender)")
+    parser.add_argument("--blend", type=str, default=os.path.join(SCRIPT_DIR, "rubber duck blender.blend"),
+                        help="Scene to render (default: rubber duck blender.blend)")
+    parser.add_argument("--envs", type=str, required=True, help="Folder with the HDRIs")
+    parser.add_argument("--max_depth", type=int, default=1, help="Folder depth of the HDRI search (default: 1)")
+    parser.add_argument("--output", type=str, required=True, help="Render base path")
+    parser.add_argument("--workers", type=int, default=max(1, os.cpu_count() // 4),
+                        help="Blender processes (default: a quarter of the cores)")
+    parser.add_argument("--threads", type=int, default=0,
+                        help="Render threads of every Blender process, 0 for Blender's default (default: 0)")
+    parser.add_argument("--cameras_per_category", type=int, default=1, help="Cameras per category (default: 1)")
+    parser.add_argument("--radius", type=float, default=10.0, help="Sphere radius (default: 10)")
+    parser.add_argument("--center", type=float, nargs=3, default=(0.0, 0.0, 0.0), help="Sphere center (default: 0 0 0)")
+    parser.add_argument("--noise", type=float, default=0.0, help="Noise added to the camera angles (default: 0)")
+    parser.add_argument("--seed", type=int, default=0,
+                        help="Seed of the camera noise, every worker places the same cameras (default: 0)")
+    parser.add_argument("--single_camera", action="store_true",
+                        help="Render with one camera moved to every pose (default: False)")
+    parser.add_argument("--fake", action="store_true", help="Replace Blender with a stub renderer (default: False)")
+    parser.add_argument("--fake_seconds_per_view", type=float, default=0.01,
+                        help="Duration of every fake render (default: 0.01)")
+    sys.exit(run_farm(parser.parse_args()))
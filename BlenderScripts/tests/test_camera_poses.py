@@ -0,0 +1,41 @@
+import json
+import os
+
+import numpy as np
+
+from camera_poses import DAMPED_CATEGORIES, generate_poses
+
+TRANSFORMS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "3dModelGeneration",
+                          "transforms_internal.json")
+
+
+def test_track_to_matches_blender_frames():
+    # transforms_internal.json was exported by Blender with the TRACK_TO cameras of create_camera on a
+    # unit sphere. Its first frame, top_camera.png, comes from another setup and is left out.
+    with open(TRANSFORMS) as f:
+        frames = [np.array(frame["transform_matrix"]) for frame in json.load(f)["frames"][1:]]
+    names, matrices = generate_poses(1, 1.0)
+    tracked = [i for i, name in enumerate(names) if name.split("_")[1] not in DAMPED_CATEGORIES]
+    assert len(frames) == len(tracked)
+
+    # The file names do not follow the category names, the frames are paired by camera position
+    matched = set()
+    for frame in frames:
+        index = min(tracked, key=lambda i: np.linalg.norm(matrices[i, :3, 3] - frame[:3, 3]))
+        matched.add(index)
+        np.testing.assert_allclose(matrices[index], frame, atol=1e-6)
+    assert matched == set(tracked)
+
+
+def test_damped_top_looks_at_center():
+    # Not checked against a Blender export: only that the pose is a rotation looking at the center
+    center = np.array([1.0, -2.0, 0.5])
+    names, matrices = generate_poses(3, 4.0, center, noise_amount=5.0, seed=0)
+    for name, matrix in zip(names, matrices):
+        if name.split("_")[1] not in DAMPED_CATEGORIES:
+            continue
+        rotation = matrix[:3, :3]
+        np.testing.assert_allclose(rotation.T @ rotation, np.eye(3), atol=1e-9)
+        assert np.isclose(np.linalg.det(rotation), 1.0)
+        direction = (center - matrix[:3, 3]) / np.linalg.norm(center - matrix[:3, 3])
+        np.testing.assert_allclose(-rotation[:, 2], direction, atol=1e-9)
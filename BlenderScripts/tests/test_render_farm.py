@@ -0,0 +1,106 @@
+import csv
+import json
+import os
+import types
+
+import numpy as np
+
+from camera_poses import CATEGORIES, generate_poses
+from render_farm import (REPORT_NAME, SHARDS_FOLDER, environment_seed, merge_shards, plan_items, run_farm,
+                         run_shard, shard_items)
+
+VIEWS = len(CATEGORIES)
+
+
+def farm_args(envs, output, workers=3, **overrides):
+    # The defaults of the command line, with the stub renderer
+    args = dict(blender="blender", blend="", envs=str(envs), max_depth=2, output=str(output), workers=workers,
+                threads=0, cameras_per_category=1, radius=10.0, center=(0.0, 0.0, 0.0), noise=2.0, seed=3,
+                single_camera=False, fake=True, fake_seconds_per_view=0.0)
+    args.update(overrides)
+    return types.SimpleNamespace(**args)
+
+
+def make_envs(folder):
+    for path in ("a.hdr", "b.exr", "sub/c.hdr", "notes.txt"):
+        os.makedirs(os.path.dirname(os.path.join(folder, path)), exist_ok=True)
+        open(os.path.join(folder, path), "w").close()
+    return ["a.hdr", "b.exr", os.path.join("sub", "c.hdr")]
+
+
+def read_csv(path):
+    with open(path, newline="") as f:
+        return list(csv.reader(f))
+
+
+def test_items_are_dealt_round_robin():
+    items = plan_items(["a.hdr", "b.hdr"], 5)
+    shards = shard_items(items, 3)
+    assert [len(shard) for shard in shards] == [4, 3, 3]
+    assert sorted(item for shard in shards for item in shard) == sorted(items)
+    # Every shard gets a share of every environment
+    assert all({env for env, _ in shard} == {"a.hdr", "b.hdr"} for shard in shards)
+    # Never more shards than items
+    assert len(shard_items(items[:2], 8)) == 2
+
+
+def test_fake_farm_renders_every_view(tmp_path):
+    envs = make_envs(tmp_path / "envs")
+    output = tmp_path / "renders"
+    assert run_farm(farm_args(tmp_path / "envs", output)) == 0
+
+    with open(output / SHARDS_FOLDER / REPORT_NAME) as f:
+        report = json.load(f)
+    assert report["error"] is None and report["rendered"] == report["views"] == 3 * VIEWS
+    assert [shard["returncode"] for shard in report["shards"]] == [0, 0, 0]
+
+    for env in envs:
+        name = os.path.splitext(os.path.basename(env))[0]
+        with open(output / name / "transforms.json") as f:
+            frames = json.load(f)["frames"]
+        # Frames merged back in camera order, with the poses of the environment's seed
+        names, matrices = generate_poses(1, 10.0, (0.0, 0.0, 0.0), 2.0, environment_seed(3, env))
+        assert [frame["file_path"] for frame in frames] == [
+            os.path.join(str(output), name, "images", f"render_{camera}.png") for camera in names]
+        np.testing.assert_allclose([frame["transform_matrix"] for frame in frames], matrices)
+        assert all(os.path.exists(frame["file_path"]) for frame in frames)
+    assert len(read_csv(output / "images.csv")) == 3 * VIEWS
+
+
+def test_failed_shard_is_reported(tmp_path):
+    make_envs(tmp_path / "envs")
+    output = tmp_path / "renders"
+    # A file where shard 1 writes its results makes that worker fail
+    os.makedirs(output / SHARDS_FOLDER)
+    open(output / SHARDS_FOLDER / "1", "w").close()
+    assert run_farm(farm_args(tmp_path / "envs", output)) == 1
+
+    with open(output / SHARDS_FOLDER / REPORT_NAME) as f:
+        report = json.load(f)
+    codes = [shard["returncode"] for shard in report["shards"]]
+    assert codes[0] == codes[2] == 0 and codes[1] != 0
+    # The other shards are still merged
+    assert report["rendered"] == 3 * VIEWS - len(shard_items(plan_items(["a", "b", "c"], VIEWS), 3)[1])
+    assert len(read_csv(output / "images.csv")) == report["rendered"]
+
+
+def test_merge_orders_the_frames_of_every_shard(tmp_path):
+    output = str(tmp_path)
+    items = plan_items(["x.hdr", "y.hdr"], 4)
+    shards = shard_items(items, 3)
+
+    def open_environment(env):
+        return {"w": 8, "h": 8}
+
+    def render_view(env, index, env_dir):
+        return {"file_path": f"{env}-{index}", "transform_matrix": [[float(index)]]}
+
+    for i, shard in enumerate(shards):
+        run_shard({"shard": i, "items": shard, "settings": {"output": output}}, open_environment, render_view)
+    assert merge_shards(output, len(shards), ["x.hdr", "y.hdr", "missing.hdr"]) == len(items)
+
+    with open(tmp_path / "x" / "transforms.json") as f:
+        data = json.load(f)
+    assert data["w"] == 8 and "indices" not in data
+    assert [frame["file_path"] for frame in data["frames"]] == [f"x.hdr-{i}" for i in range(4)]
+    assert read_csv(tmp_path / "images.csv") == [[f"{env}-{i}", env[0]] for env in ("x.hdr", "y.hdr") for i in range(4)]